@@ -0,0 +1,300 @@
+"""Reproducible benchmarks for the face grouping pipeline.
+
+Every workload is generated locally from a fixed seed, so no network access
+or sample photos are needed:
+
+- detect:     in-process detection (DetectionEngine.detect) on procedurally
+              drawn images
+- match:      greedy grouping (match_encodings and identity prototypes) of
+              synthetic 128-d encodings, against the exact and IVF identity indexes
+- cluster:    batch clustering of the same encodings
+- label:      label_images on the generated images
+- thumbnails: cold and warm ThumbnailCache lookups
+
+Each stage runs in a fresh process so its peak RSS can be measured on its
+own. Results are written as JSON and can be compared with a stored
+baseline to catch regressions:
+
+    python benchmarks/run_benchmarks.py --output results.json
+    python benchmarks/run_benchmarks.py --baseline results.json
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import statistics
+import multiprocessing
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+# Make the application modules importable
+SRC_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+STAGES = ("detect", "match", "match_ivf", "cluster", "label", "thumbnails")
+ENCODING_SIZE = 128
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MiB, or None if unavailable"""
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and kilobytes elsewhere
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def synthetic_encodings(count, identities, seed, spread=0.03):
+    """Draw encodings from clustered distributions, one cluster per identity.
+
+    Centres are random unit vectors (about 1.4 apart in 128-d), while
+    faces of the same identity stay well inside the 0.6 tolerance.
+    """
+    rng = np.random.default_rng(seed)
+    centres = rng.normal(size=(identities, ENCODING_SIZE)).astype(np.float32)
+    centres /= np.linalg.norm(centres, axis=1, keepdims=True)
+    labels = rng.integers(0, identities, count)
+    noise = rng.normal(scale=spread, size=(count, ENCODING_SIZE)).astype(np.float32)
+    return centres[labels] + noise, labels
+
+
+def synthetic_images(folder, count, size, seed):
+    """Draw simple face-like pictures (skin-toned ovals with eyes) as JPEG files"""
+    rng = np.random.default_rng(seed)
+    os.makedirs(folder, exist_ok=True)
+    paths = []
+    for i in range(count):
+        background = tuple(int(v) for v in rng.integers(0, 255, 3))
+        img = Image.new("RGB", size, background)
+        draw = ImageDraw.Draw(img)
+        for _ in range(int(rng.integers(1, 4))):
+            w = int(rng.integers(size[0] // 10, size[0] // 4))
+            h = int(w * 1.3)
+            x = int(rng.integers(0, size[0] - w))
+            y = int(rng.integers(0, size[1] - h))
+            draw.ellipse((x, y, x + w, y + h), fill=(224, 172, 105))
+            for ex in (x + w // 3, x + 2 * w // 3):
+                draw.ellipse((ex - w // 16, y + h // 3, ex + w // 16, y + h // 3 + w // 10), fill=(40, 30, 20))
+            draw.line((x + w // 3, y + 3 * h // 4, x + 2 * w // 3, y + 3 * h // 4), fill=(150, 60, 60), width=3)
+        path = os.path.join(folder, f"synthetic_{i:05d}.jpg")
+        img.save(path, quality=90)
+        paths.append(path)
+    return paths
+
+
+def synthetic_grouped_faces(paths, seed):
+    """Fake grouping results with a few faces per generated image"""
+    rng = np.random.default_rng(seed)
+    grouped_faces = {}
+    for path in paths:
+        for _ in range(int(rng.integers(1, 4))):
+            top, left = int(rng.integers(0, 400)), int(rng.integers(0, 600))
+            face = {'filename': os.path.basename(path), 'filepath': path,
+                    'location': (top, left + 120, top + 150, left)}
+            grouped_faces.setdefault(f"Person_{int(rng.integers(1, 20))}", []).append(face)
+    return grouped_faces
+
+
+def bench_detect(size, workdir, seed):
+    from grouper.index import FaceGrouper
+    paths = synthetic_images(os.path.join(workdir, "images"), size, (1024, 768), seed)
+    face_grouper = FaceGrouper(workers=1)
+    start = time.perf_counter()
+    # In-process detection, with the decode prefetcher overlapping reads and decoding
+    faces = sum(len(locations) for _, locations, _, error in face_grouper.detector.detect(paths)
+                if error is None)
+    return time.perf_counter() - start, {'faces': faces}
+
+
+def bench_match(size, workdir, seed, backend="exact", batch_size=512):
+    from grouper.identity_index import create_index
+    from grouper.matching import match_encodings
+    from grouper.prototypes import IdentityPrototypes
+    encodings, labels = synthetic_encodings(size, max(1, size // 20), seed)
+    prototypes = IdentityPrototypes(create_index(backend), exemplar_index=create_index(backend))
+    start = time.perf_counter()
+    # Match in batches and update the prototypes in between, as greedy grouping does
+    for batch_start in range(0, len(encodings), batch_size):
+        batch = encodings[batch_start:batch_start + batch_size]
+        assigned, _ = match_encodings(prototypes, batch, 0.6)
+        prototypes.observe(assigned, batch)
+    return time.perf_counter() - start, {'identities': len(prototypes),
+                                         'prototypes': prototypes.prototype_count,
+                                         'true_identities': int(len(set(labels)))}
+
+
+def bench_cluster(size, workdir, seed):
+    from grouper.clustering import cluster_encodings
+    encodings, labels = synthetic_encodings(size, max(1, size // 20), seed)
+    start = time.perf_counter()
+    clusters = cluster_encodings(encodings, 0.6)
+    return time.perf_counter() - start, {'clusters': int(clusters.max()) + 1,
+                                         'true_identities': int(len(set(labels)))}
+
+
+def bench_label(size, workdir, seed):
+    from grouper.labeling import build_label_index, label_images
+    paths = synthetic_images(os.path.join(workdir, "images"), size, (1024, 768), seed)
+    grouped_faces = synthetic_grouped_faces(paths, seed)
+    start = time.perf_counter()
+    labeled = label_images(build_label_index(grouped_faces), os.path.join(workdir, "labeled"))
+    return time.perf_counter() - start, {'images': len(labeled)}
+
+
+def bench_thumbnails(size, workdir, seed):
+    from utils.thumbnail_cache import ThumbnailCache
+    paths = synthetic_images(os.path.join(workdir, "images"), size, (2048, 1536), seed)
+    cache = ThumbnailCache(os.path.join(workdir, "thumbnails"))
+    start = time.perf_counter()
+    for path in paths:
+        cache.get(path)
+    cold = time.perf_counter() - start
+
+    # Warm lookups come from disk, not the in-memory LRU
+    cache.clear_memory()
+    start = time.perf_counter()
+    for path in paths:
+        cache.get(path)
+    return cold, {'warm_seconds': time.perf_counter() - start}
+
+
+BENCHMARKS = {
+    "detect": bench_detect,
+    "match": bench_match,
+    "match_ivf": lambda size, workdir, seed: bench_match(size, workdir, seed, backend="ivf"),
+    "cluster": bench_cluster,
+    "label": bench_label,
+    "thumbnails": bench_thumbnails,
+}
+
+# Workload sizes per stage: faces for match/cluster, images for the others
+DEFAULT_SIZES = {
+    "detect": [20],
+    "match": [1000, 10000, 100000],
+    "match_ivf": [1000, 10000, 100000],
+    "cluster": [1000, 10000],
+    "label": [50],
+    "thumbnails": [50],
+}
+
+
+def _run_in_child(stage, size, seed, repeat, results):
+    """Child process entry point: run one stage and report timings and peak RSS"""
+    workdir = tempfile.mkdtemp(prefix=f"face-grouper-bench-{stage}-")
+    try:
+        runs = []
+        extra = {}
+        for _ in range(repeat):
+            seconds, extra = BENCHMARKS[stage](size, workdir, seed)
+            runs.append(seconds)
+        results.put({'runs': runs, 'extra': extra, 'peak_rss_mb': peak_rss_mb()})
+    except Exception as e:
+        results.put({'error': f"{type(e).__name__}: {e}"})
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_stage(stage, size, seed, repeat):
+    """Run one stage/size in a fresh process and summarize it"""
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    process = context.Process(target=_run_in_child, args=(stage, size, seed, repeat, results))
+    process.start()
+    outcome = results.get()
+    process.join()
+
+    record = {'stage': stage, 'size': size}
+    if 'error' in outcome:
+        record['error'] = outcome['error']
+        return record
+    median = statistics.median(outcome['runs'])
+    record.update({
+        'seconds': median,
+        'runs': outcome['runs'],
+        'items_per_second': size / median if median > 0 else None,
+        'peak_rss_mb': outcome['peak_rss_mb'],
+    })
+    record.update(outcome['extra'])
+    return record
+
+
+def compare(results, baseline, threshold):
+    """Return the results that are slower than the baseline by more than threshold"""
+    previous = {(r['stage'], r['size']): r for r in baseline['results'] if 'seconds' in r}
+    regressions = []
+    for record in results['results']:
+        before = previous.get((record['stage'], record['size']))
+        if before is None or 'seconds' not in record:
+            continue
+        ratio = record['seconds'] / before['seconds'] if before['seconds'] > 0 else 1.0
+        record['baseline_seconds'] = before['seconds']
+        record['ratio'] = ratio
+        if ratio > 1.0 + threshold:
+            regressions.append(record)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=None,
+                        help="Override the workload sizes for every selected stage")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per stage; the median is reported")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", default=None, help="Write results JSON here")
+    parser.add_argument("--baseline", default=None, help="Compare against a previous results JSON")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="Allowed slowdown vs the baseline before failing (0.2 = 20%%)")
+    args = parser.parse_args(argv)
+
+    results = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'results': [],
+    }
+
+    for stage in args.stages:
+        for size in args.sizes or DEFAULT_SIZES[stage]:
+            record = run_stage(stage, size, args.seed, args.repeat)
+            results['results'].append(record)
+            if 'error' in record:
+                print(f"{stage:>10} {size:>8}  failed: {record['error']}")
+            else:
+                rss = f"{record['peak_rss_mb']:.0f} MiB" if record['peak_rss_mb'] else "n/a"
+                print(f"{stage:>10} {size:>8}  {record['seconds']:.3f}s  "
+                      f"{record['items_per_second']:.1f}/s  peak RSS {rss}")
+
+    status = 0
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for record in regressions:
+            print(f"REGRESSION {record['stage']} {record['size']}: "
+                  f"{record['baseline_seconds']:.3f}s -> {record['seconds']:.3f}s "
+                  f"({record['ratio']:.2f}x)")
+        status = 1 if regressions else 0
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Wrote {args.output}")
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,397 @@
+import os
+import sys
+import csv
+import contextlib
+import json
+import argparse
+
+# Get the absolute path to the project root directory
+project_root = os.path.dirname(os.path.abspath(__file__))
+
+# Add the project root to Python path
+if project_root not in sys.path:
+    sys.path.insert(0, project_root)
+
+# Only headless modules are imported here; nothing below pulls in tkinter
+from grouper.index import FaceGrouper
+from grouper.cache import default_cache_dir
+from grouper.detection import compare_detection_modes
+from grouper.identity_index import INDEX_BACKENDS
+from grouper.instrumentation import PROFILERS, profile
+from grouper.labeling import OUTPUT_FORMATS
+from grouper.results import save_grouped_faces
+from grouper.service import DEFAULT_HOST, DEFAULT_PORT, GroupingService, call_service, serve
+from utils.scanner import scan_images
+
+
+def add_scan_options(parser):
+    parser.add_argument("folder", help="Folder containing images")
+    parser.add_argument("--no-recursive", action="store_true", help="Do not descend into subfolders")
+    parser.add_argument("--include", action="append", metavar="GLOB",
+                        help="Only include matching files (repeatable)")
+    parser.add_argument("--exclude", action="append", metavar="GLOB",
+                        help="Skip matching files and folders (repeatable)")
+    parser.add_argument("--sniff", action="store_true",
+                        help="Detect images by content instead of extension")
+
+
+def add_detection_options(parser, workers=None):
+    parser.add_argument("--workers", type=int, default=workers,
+                        help=f"Detection worker processes (default: {workers or 'CPU count'})")
+    parser.add_argument("--chunksize", type=int, default=8, help="Images per worker task")
+    parser.add_argument("--model", choices=["hog", "cnn"], default="hog", help="Face detector model")
+    parser.add_argument("--upsample", type=int, default=1, help="Detector upsampling passes")
+    parser.add_argument("--max-side", type=int, default=None,
+                        help="Detect on a copy downscaled to this longest side")
+    parser.add_argument("--decode-threads", type=int, default=2,
+                        help="Threads per detecting process that read and decode images ahead (0: inline)")
+    parser.add_argument("--prefetch-depth", type=int, default=4,
+                        help="Images decoded ahead of the detector, per process")
+    parser.add_argument("--prefetch-mb", type=int, default=256,
+                        help="Memory cap for decoded images waiting for the detector, per process")
+    parser.add_argument("--cache-dir", default=None, help="Embedding cache directory")
+    parser.add_argument("--no-cache", action="store_true", help="Disable the embedding cache")
+    parser.add_argument("--index", choices=sorted(INDEX_BACKENDS), default="exact",
+                        help="Identity index backend")
+    parser.add_argument("--tolerance", type=float, default=0.6,
+                        help="Face matching tolerance (lower is stricter)")
+    parser.add_argument("--exemplars", type=int, default=4,
+                        help="Diverse faces kept per person for matching, besides its centroid")
+    parser.add_argument("--no-dedupe", action="store_true",
+                        help="Detect every image, even exact copies of another one")
+    parser.add_argument("--near-distance", type=int, default=-1,
+                        help="Also reuse the faces of near-duplicates within this perceptual-hash distance (bits), e.g. 3; off by default")
+
+
+def make_grouper(args, grouping="greedy", project=None):
+    """Create a FaceGrouper from the detection options"""
+    face_grouper = FaceGrouper(
+        workers=args.workers, chunksize=args.chunksize, model=args.model,
+        upsample=args.upsample, detect_max_side=args.max_side,
+        cache_dir=None if args.no_cache else (args.cache_dir or default_cache_dir()),
+        index_backend=args.index, grouping=grouping, dedupe=not args.no_dedupe,
+        max_exemplars=args.exemplars, decode_threads=args.decode_threads,
+        prefetch_depth=args.prefetch_depth, prefetch_max_bytes=args.prefetch_mb * 1024 * 1024,
+        near_duplicate_distance=None if args.near_distance < 0 else args.near_distance,
+        project=project
+    )
+    face_grouper.tolerance = args.tolerance
+    return face_grouper
+
+
+def add_summary_format(parser, default="text"):
+    parser.add_argument("--format", choices=["text", "json", "csv"], default=default,
+                        help="Summary output format")
+
+
+def add_instrument_options(parser):
+    parser.add_argument("--stats", metavar="PATH", help="Write per-stage timings and counters (JSON)")
+    parser.add_argument("--trace", metavar="PATH", help="Write a Chrome trace of every stage")
+    parser.add_argument("--profile", choices=sorted(PROFILERS), default=None,
+                        help="Profile the run (use --workers 1 to include detection)")
+    parser.add_argument("--profile-output", metavar="PATH",
+                        help="Where to save profiler data (pstats or folded stacks)")
+
+
+def profiled(args):
+    """Context manager profiling the command when --profile is given"""
+    if args.profile is None:
+        return contextlib.nullcontext()
+    return profile(args.profile, args.profile_output)
+
+
+def write_instrumentation(face_grouper, args):
+    """Print the stage report and save the stats/trace files that were requested"""
+    instruments = face_grouper.instruments
+    print(instruments.report(), file=sys.stderr)
+    if args.stats:
+        instruments.save_json(args.stats)
+        print(f"Saved stage statistics to {args.stats}", file=sys.stderr)
+    if args.trace:
+        instruments.save_chrome_trace(args.trace)
+        print(f"Saved Chrome trace to {args.trace}", file=sys.stderr)
+
+
+def scan_folder(args):
+    """Yield (filename, filepath) for the images selected by the scan options"""
+    for batch in scan_images(args.folder, recursive=not args.no_recursive,
+                             include=args.include, exclude=args.exclude, sniff=args.sniff):
+        yield from batch
+
+
+def write_summary(summary, output_format, out=sys.stdout):
+    """Print a grouping summary as text, JSON or CSV"""
+    if output_format == "json":
+        json.dump(summary, out, indent=2)
+        out.write("\n")
+    elif output_format == "csv":
+        writer = csv.writer(out)
+        writer.writerow(["name", "count", "unique_count", "images"])
+        for person in summary['people']:
+            writer.writerow([person['name'], person['count'], person['unique_count'],
+                             ";".join(person['images'])])
+    else:
+        out.write(f"Found {summary['total_people']} unique people\n")
+        if summary['duplicate_images']:
+            out.write(f"{summary['duplicate_images']} images are copies of other images\n")
+        for person in summary['people']:
+            line = f"{person['name']}: {person['count']} appearances"
+            if person['unique_count'] != person['count']:
+                line += f" ({person['unique_count']} not counting copies)"
+            out.write(line + "\n")
+
+
+def cmd_scan(args):
+    count = 0
+    for filename, filepath in scan_folder(args):
+        print(filepath if args.absolute else filename)
+        count += 1
+    print(f"{count} images", file=sys.stderr)
+    return 0
+
+
+def cmd_group(args):
+    face_grouper = make_grouper(args, args.grouping, args.project)
+    try:
+        if args.shard:
+            shard_index, shard_count = args.shard
+            if not args.shard_dir:
+                print("--shard needs --shard-dir", file=sys.stderr)
+                return 2
+            with contextlib.redirect_stdout(sys.stderr), profiled(args) as profiler:
+                directory = face_grouper.group_shard(scan_folder(args), shard_index, shard_count,
+                                                     args.shard_dir)
+            print(f"Saved shard {shard_index + 1}/{shard_count} to {directory}", file=sys.stderr)
+        else:
+            # Stream the scan straight into detection; progress goes to stderr so stdout stays parseable
+            with contextlib.redirect_stdout(sys.stderr), profiled(args) as profiler:
+                face_grouper.group_faces(scan_folder(args))
+            save_grouped_faces(face_grouper.grouped_faces, args.output)
+            print(f"Saved grouping results to {args.output}", file=sys.stderr)
+        if args.library:
+            face_grouper.save_library(args.library)
+            print(f"Saved face library to {args.library}", file=sys.stderr)
+        write_instrumentation(face_grouper, args)
+        if profiler is not None:
+            print(profiler.report(), file=sys.stderr)
+
+        write_summary(face_grouper.get_summary(), args.format)
+        return 0
+    finally:
+        face_grouper.detector.close()
+
+
+def cmd_merge(args):
+    face_grouper = FaceGrouper(workers=1, index_backend=args.index, project=args.project)
+    face_grouper.tolerance = args.tolerance
+    try:
+        with contextlib.redirect_stdout(sys.stderr):
+            face_grouper.merge_shards(args.shard_dir)
+        save_grouped_faces(face_grouper.grouped_faces, args.output)
+        print(f"Saved merged grouping results to {args.output}", file=sys.stderr)
+        if args.library:
+            face_grouper.save_library(args.library)
+            print(f"Saved face library to {args.library}", file=sys.stderr)
+
+        write_summary(face_grouper.get_summary(), args.format)
+        return 0
+    finally:
+        face_grouper.detector.close()
+
+
+def parse_shard(value):
+    """Parse a 1-based "I/N" shard spec into a 0-based (index, count)"""
+    try:
+        index, count = (int(part) for part in value.split("/"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected I/N, got '{value}'") from None
+    if not 1 <= index <= count:
+        raise argparse.ArgumentTypeError(f"shard {index} is not between 1 and {count}")
+    return index - 1, count
+
+
+def cmd_label(args):
+    face_grouper = FaceGrouper(workers=1)
+    try:
+        face_grouper.load_results(args.results)
+        with contextlib.redirect_stdout(sys.stderr), profiled(args) as profiler:
+            labeled_images = face_grouper.label_faces(
+                args.output_dir, workers=args.workers, output_format=args.image_format,
+                quality=args.quality
+            )
+        write_instrumentation(face_grouper, args)
+        if profiler is not None:
+            print(profiler.report(), file=sys.stderr)
+        print(f"Saved {len(labeled_images)} labeled images to {args.output_dir}")
+        return 0
+    finally:
+        face_grouper.detector.close()
+
+
+def cmd_summary(args):
+    face_grouper = FaceGrouper(workers=1)
+    try:
+        face_grouper.load_results(args.results)
+        write_summary(face_grouper.get_summary(), args.format)
+        return 0
+    finally:
+        face_grouper.detector.close()
+
+
+def cmd_compare_detection(args):
+    image_paths = [filepath for _, filepath in scan_folder(args)]
+    if args.limit:
+        image_paths = image_paths[:args.limit]
+    if not image_paths:
+        print("No images found", file=sys.stderr)
+        return 1
+    report = compare_detection_modes(image_paths, args.max_side, model=args.model, upsample=args.upsample,
+                                     tolerance=args.tolerance)
+    if args.format == "json":
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    speedup = f"{report['speedup']:.2f}x" if report['speedup'] else "n/a"
+    print(f"{report['images']} images, downscaled to a longest side of {report['max_side']}")
+    print(f"Full resolution: {report['full_seconds']:.2f}s, {report['full_faces']} faces")
+    print(f"Downscaled:      {report['downscaled_seconds']:.2f}s, {report['downscaled_faces']} faces "
+          f"({speedup} faster)")
+    print(f"Faces also found downscaled: {report['face_recall']:.1%}")
+    print(f"Encoding distance of paired faces: mean {report['mean_encoding_distance']:.3f}, "
+          f"max {report['max_encoding_distance']:.3f}")
+    print(f"Paired faces within tolerance: {report['same_identity_rate']:.1%}")
+    return 0
+
+
+def cmd_serve(args):
+    face_grouper = make_grouper(args, project=args.project)
+    service = GroupingService(face_grouper, library=args.library, batch_max_images=args.max_batch,
+                              batch_wait=args.batch_wait_ms / 1000, save_interval=args.save_interval)
+    serve(service, args.host, args.port)
+    return 0
+
+
+def cmd_assign(args):
+    paths = [os.path.abspath(path) for path in args.images]
+    try:
+        reply = call_service(args.url, "/assign", {'paths': paths}, timeout=args.timeout)
+    except OSError as e:
+        print(f"Could not reach the service at {args.url}: {e}", file=sys.stderr)
+        return 1
+    if args.format == "json":
+        json.dump(reply, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return 0
+    for path, result in reply['images'].items():
+        if result['error']:
+            print(f"{path}: {result['error']}")
+        else:
+            people = ", ".join(face['person'] or "unassigned" for face in result['faces'])
+            print(f"{path}: {people or 'no faces'}")
+    return 0
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Group and label faces in image folders")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    scan = subparsers.add_parser("scan", help="List the images that would be processed")
+    add_scan_options(scan)
+    scan.add_argument("--absolute", action="store_true", help="Print full paths")
+    scan.set_defaults(func=cmd_scan)
+
+    group = subparsers.add_parser("group", help="Detect and group faces in a folder")
+    add_scan_options(group)
+    group.add_argument("-o", "--output", default="face_groups.json",
+                       help="Where to write the grouping results (JSON)")
+    add_detection_options(group)
+    group.add_argument("--grouping", choices=["greedy", "cluster"], default="greedy",
+                       help="Grouping engine")
+    group.add_argument("--library", metavar="DIR", default=None,
+                       help="Also save a memory-mapped face library (columns and encodings)")
+    group.add_argument("--project", metavar="FILE", default=None,
+                       help="Also write the results to an SQLite project database")
+    group.add_argument("--shard", type=parse_shard, metavar="I/N", default=None,
+                       help="Only process shard I of N (1-based) and write a partial result")
+    group.add_argument("--shard-dir", metavar="DIR", default=None,
+                       help="Shared directory for shard results (used with --shard)")
+    add_summary_format(group)
+    add_instrument_options(group)
+    group.set_defaults(func=cmd_group)
+
+    merge = subparsers.add_parser("merge", help="Merge shard results into global groups")
+    merge.add_argument("shard_dir", help="Directory holding the shard results")
+    merge.add_argument("-o", "--output", default="face_groups.json",
+                       help="Where to write the merged grouping results (JSON)")
+    merge.add_argument("--library", metavar="DIR", default=None,
+                       help="Also save the merged face library")
+    merge.add_argument("--project", metavar="FILE", default=None,
+                       help="Also write the merged results to an SQLite project database")
+    merge.add_argument("--index", choices=sorted(INDEX_BACKENDS), default="exact",
+                       help="Identity index backend used to match shard identities")
+    merge.add_argument("--tolerance", type=float, default=0.6,
+                       help="Face matching tolerance for merging identities")
+    add_summary_format(merge)
+    merge.set_defaults(func=cmd_merge)
+
+    label = subparsers.add_parser("label", help="Write labeled copies of grouped images")
+    label.add_argument("results", help="Grouping results (JSON), face library or project database written by 'group'")
+    label.add_argument("output_dir", help="Directory for labeled images")
+    label.add_argument("--image-format", choices=sorted(OUTPUT_FORMATS), default=None,
+                       help="Output image format (default: same as source)")
+    label.add_argument("--quality", type=int, default=90, help="JPEG/WebP quality")
+    label.add_argument("--workers", type=int, default=None, help="Labeling threads")
+    add_instrument_options(label)
+    label.set_defaults(func=cmd_label)
+
+    summary = subparsers.add_parser("summary", help="Summarize saved grouping results")
+    summary.add_argument("results", help="Grouping results (JSON), face library or project database written by 'group'")
+    add_summary_format(summary)
+    summary.set_defaults(func=cmd_summary)
+
+    compare = subparsers.add_parser("compare-detection",
+                                    help="Compare full-resolution and downscaled detection on a folder")
+    add_scan_options(compare)
+    compare.add_argument("--max-side", type=int, required=True,
+                         help="Longest side of the downscaled copy")
+    compare.add_argument("--model", choices=["hog", "cnn"], default="hog", help="Face detector model")
+    compare.add_argument("--upsample", type=int, default=1, help="Detector upsampling passes")
+    compare.add_argument("--tolerance", type=float, default=0.6,
+                         help="Face matching tolerance the encoding distances are checked against")
+    compare.add_argument("--limit", type=int, default=None, help="Only compare the first N images")
+    compare.add_argument("--format", choices=["text", "json"], default="text", help="Report format")
+    compare.set_defaults(func=cmd_compare_detection)
+
+    serve_parser = subparsers.add_parser("serve", help="Run a local service that groups images as they arrive")
+    serve_parser.add_argument("--host", default=DEFAULT_HOST, help="Address to listen on (default: localhost only)")
+    serve_parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="Port to listen on (0: any free port)")
+    add_detection_options(serve_parser, workers=1)
+    serve_parser.add_argument("--max-batch", type=int, default=64,
+                              help="Most images detected and matched in one pass")
+    serve_parser.add_argument("--batch-wait-ms", type=float, default=20,
+                              help="How long a pass waits for more requests to join it")
+    serve_parser.add_argument("--library", metavar="DIR", default=None,
+                              help="Face library loaded at startup and saved periodically and on exit")
+    serve_parser.add_argument("--save-interval", type=float, default=60,
+                              help="Seconds between saves of the face library, when it changed")
+    serve_parser.add_argument("--project", metavar="FILE", default=None,
+                              help="SQLite project database loaded at startup and updated after every pass")
+    serve_parser.set_defaults(func=cmd_serve)
+
+    assign = subparsers.add_parser("assign", help="Send images to a running service and print their people")
+    assign.add_argument("images", nargs="+", help="Image files")
+    assign.add_argument("--url", default=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", help="Service address")
+    assign.add_argument("--timeout", type=float, default=None, help="Seconds to wait for the reply")
+    assign.add_argument("--format", choices=["text", "json"], default="text", help="Output format")
+    assign.set_defaults(func=cmd_assign)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    return args.func(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,148 @@
+import os
+import hashlib
+import struct
+import time
+import numpy as np
+from grouper.detection import ENCODING_SIZE
+from grouper.decoding import DECODE_VERSION
+from utils.scanner import hash_file
+
+# Binary entry layout: magic, face count, int32 locations, float32 encodings
+ENTRY_MAGIC = b"FGE1"
+ENTRY_HEADER = struct.Struct("<4sI")
+ENTRY_SUFFIX = ".emb"
+
+
+def default_cache_dir():
+    """Return the per-user directory used for the embedding cache"""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "face-grouper", "embeddings")
+
+
+class EmbeddingCache:
+    """Persistent on-disk cache of face locations and encodings per image.
+
+    Entries are keyed by path, size, mtime and (optionally) a content hash,
+    together with the detector settings, and evicted least-recently-used
+    first once the cache grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024, hash_content=False):
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.hash_content = hash_content
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key -> [size in bytes, last used timestamp]
+        self._entries = {}
+        self._total_bytes = 0
+        with os.scandir(cache_dir) as it:
+            for entry in it:
+                if entry.name.endswith(ENTRY_SUFFIX) and entry.is_file():
+                    st = entry.stat()
+                    self._entries[entry.name[:-len(ENTRY_SUFFIX)]] = [st.st_size, st.st_mtime]
+                    self._total_bytes += st.st_size
+        self.evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def make_key(self, image_path, model, upsample, stat=None, max_side=None):
+        """Build the cache key for an image and detector settings"""
+        st = stat if stat is not None else os.stat(image_path)
+        parts = [os.path.abspath(image_path), str(st.st_size), str(st.st_mtime_ns),
+                 hash_file(image_path) if self.hash_content else "",
+                 str(model), str(upsample), f"decode={DECODE_VERSION}"]
+        if max_side:
+            parts.append(f"max_side={max_side}")
+        return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.cache_dir, key + ENTRY_SUFFIX)
+
+    def get(self, key):
+        """Return cached (locations, encodings) for a key, or None"""
+        if key not in self._entries:
+            self.misses += 1
+            return None
+
+        entry_path = self._entry_path(key)
+        try:
+            with open(entry_path, "rb") as f:
+                data = f.read()
+            magic, count = ENTRY_HEADER.unpack_from(data)
+            if magic != ENTRY_MAGIC:
+                raise ValueError("bad cache entry header")
+            offset = ENTRY_HEADER.size
+            locations = np.frombuffer(data, dtype="<i4", count=count * 4, offset=offset)
+            offset += locations.nbytes
+            encodings = np.frombuffer(data, dtype="<f4", count=count * ENCODING_SIZE, offset=offset)
+        except (OSError, ValueError, struct.error) as e:
+            print(f"Discarding unreadable cache entry {entry_path}: {e}")
+            self._remove(key)
+            self.misses += 1
+            return None
+
+        # Mark as recently used so eviction keeps it
+        self._touch(key)
+        self.hits += 1
+        return (locations.reshape(count, 4).astype(np.int32),
+                encodings.reshape(count, ENCODING_SIZE).astype(np.float32))
+
+    def put(self, key, locations, encodings):
+        """Store the detection result for a key"""
+        locations = np.ascontiguousarray(locations, dtype="<i4").reshape(-1, 4)
+        encodings = np.ascontiguousarray(encodings, dtype="<f4").reshape(-1, ENCODING_SIZE)
+        data = (ENTRY_HEADER.pack(ENTRY_MAGIC, len(locations))
+                + locations.tobytes() + encodings.tobytes())
+
+        # Write atomically so a crash never leaves a truncated entry behind
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, entry_path)
+
+        if key in self._entries:
+            self._total_bytes -= self._entries[key][0]
+        self._entries[key] = [len(data), os.path.getmtime(entry_path)]
+        self._total_bytes += len(data)
+        self.evict()
+
+    def _touch(self, key):
+        now = time.time()
+        self._entries[key][1] = now
+        try:
+            os.utime(self._entry_path(key), (now, now))
+        except OSError:
+            pass
+
+    def _remove(self, key):
+        size, _ = self._entries.pop(key, (0, 0))
+        self._total_bytes -= size
+        try:
+            os.remove(self._entry_path(key))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        if self._total_bytes <= self.max_bytes:
+            return
+        for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+            if self._total_bytes <= self.max_bytes:
+                break
+            self._remove(key)
+
+    def clear(self):
+        """Remove every entry from the cache"""
+        for key in list(self._entries):
+            self._remove(key)
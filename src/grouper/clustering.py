@@ -0,0 +1,156 @@
+import numpy as np
+from grouper.matching import squared_distances
+
+
+def neighbor_graph(encodings, radius, block_size=2048):
+    """Build the sparse graph of encoding pairs closer than radius.
+
+    Distances are computed in (block_size x block_size) tiles over the upper
+    triangle, so memory stays bounded no matter how many encodings there
+    are. Returns the symmetric graph in CSR form as (indptr, indices).
+    """
+    encodings = np.ascontiguousarray(encodings, dtype=np.float32)
+    n = len(encodings)
+    sq_norms = np.einsum("ij,ij->i", encodings, encodings)
+    sq_radius = np.float32(radius) ** 2
+
+    sources, targets = [], []
+    for row_start in range(0, n, block_size):
+        rows = encodings[row_start:row_start + block_size]
+        for col_start in range(row_start, n, block_size):
+            cols = encodings[col_start:col_start + block_size]
+            sq = squared_distances(rows, cols, sq_norms[col_start:col_start + block_size])
+            close = sq <= sq_radius
+            if col_start == row_start:
+                # Only keep pairs above the diagonal within the same tile
+                close = np.triu(close, k=1)
+            i, j = np.nonzero(close)
+            sources.append(i + row_start)
+            targets.append(j + col_start)
+
+    sources = np.concatenate(sources) if sources else np.empty(0, dtype=np.int64)
+    targets = np.concatenate(targets) if targets else np.empty(0, dtype=np.int64)
+
+    # Store both directions and sort by source to get CSR
+    all_sources = np.concatenate([sources, targets])
+    all_targets = np.concatenate([targets, sources])
+    order = np.argsort(all_sources, kind="stable")
+    indices = all_targets[order]
+    indptr = np.zeros(n + 1, dtype=np.int64)
+    np.cumsum(np.bincount(all_sources, minlength=n), out=indptr[1:])
+    return indptr, indices
+
+
+def connected_components(n, indptr, indices, mask=None):
+    """Label connected components of a CSR graph, restricted to masked nodes"""
+    labels = np.arange(n)
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    targets = indices
+    if mask is not None:
+        keep = mask[sources] & mask[targets]
+        sources, targets = sources[keep], targets[keep]
+
+    # Propagate the minimum label along edges, with pointer jumping, until stable
+    while True:
+        previous = labels.copy()
+        np.minimum.at(labels, sources, labels[targets])
+        labels = labels[labels]
+        if np.array_equal(labels, previous):
+            return labels
+
+
+def dbscan(n, indptr, indices, min_samples=1):
+    """DBSCAN over a precomputed radius graph.
+
+    Core points (with at least min_samples - 1 neighbours) are joined into
+    clusters; border points take the cluster of a core neighbour and noise
+    points become clusters of their own.
+    """
+    degree = np.diff(indptr)
+    core = degree >= (min_samples - 1)
+    labels = connected_components(n, indptr, indices, mask=core)
+
+    for node in np.nonzero(~core)[0]:
+        neighbours = indices[indptr[node]:indptr[node + 1]]
+        core_neighbours = neighbours[core[neighbours]]
+        if len(core_neighbours):
+            labels[node] = labels[core_neighbours[0]]
+    return labels
+
+
+def _majority_labels(nodes, neighbour_labels):
+    """Return (nodes, label) with the most common neighbour label per node, ties to the lowest label"""
+    order = np.lexsort((neighbour_labels, nodes))
+    nodes, neighbour_labels = nodes[order], neighbour_labels[order]
+
+    # Count each (node, label) run, then keep the largest count per node
+    starts = np.flatnonzero(np.r_[True, (nodes[1:] != nodes[:-1]) | (neighbour_labels[1:] != neighbour_labels[:-1])])
+    counts = np.diff(np.r_[starts, len(nodes)])
+    nodes, neighbour_labels = nodes[starts], neighbour_labels[starts]
+    order = np.lexsort((neighbour_labels, -counts, nodes))
+    first = order[np.r_[True, nodes[order][1:] != nodes[order][:-1]]]
+    return nodes[first], neighbour_labels[first]
+
+
+def chinese_whispers(n, indptr, indices, iterations=20, seed=0, batches=8):
+    """Chinese whispers clustering over a radius graph.
+
+    Each iteration visits the nodes in a random order, split into
+    ``batches`` groups; the nodes of a group all adopt the most common
+    label among their neighbours at once, so a pass is a few sorts over
+    the edges rather than a Python loop per node. Updating group by group
+    instead of all nodes together keeps labels from oscillating between
+    neighbours.
+    """
+    rng = np.random.default_rng(seed)
+    labels = np.arange(n)
+    sources = np.repeat(np.arange(n), np.diff(indptr))
+    if not len(sources):
+        return labels
+    batches = max(1, min(batches, n))
+
+    for _ in range(iterations):
+        group = np.empty(n, dtype=np.int64)
+        group[rng.permutation(n)] = np.arange(n) * batches // n
+        edge_group = group[sources]
+        edge_order = np.argsort(edge_group, kind="stable")
+        bounds = np.searchsorted(edge_group[edge_order], np.arange(batches + 1))
+
+        changed = 0
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            edges = edge_order[start:end]
+            if not len(edges):
+                continue
+            nodes, best = _majority_labels(sources[edges], labels[indices[edges]])
+            moved = best != labels[nodes]
+            labels[nodes[moved]] = best[moved]
+            changed += int(moved.sum())
+        if not changed:
+            break
+    return labels
+
+
+# Clustering methods selectable by name
+CLUSTER_METHODS = {
+    "chinese_whispers": chinese_whispers,
+    "dbscan": dbscan,
+}
+
+
+def cluster_encodings(encodings, radius, method="chinese_whispers", block_size=2048, **options):
+    """Cluster encodings in one pass; returns labels numbered by first appearance"""
+    if method not in CLUSTER_METHODS:
+        raise ValueError(f"Unknown clustering method '{method}', "
+                         f"expected one of {sorted(CLUSTER_METHODS)}")
+    n = len(encodings)
+    if n == 0:
+        return np.empty(0, dtype=np.int64)
+
+    indptr, indices = neighbor_graph(encodings, radius, block_size)
+    labels = CLUSTER_METHODS[method](n, indptr, indices, **options)
+
+    # Renumber clusters 0..K-1 in order of their first face, like the greedy pass
+    _, first, inverse = np.unique(labels, return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=np.int64)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    return rank[inverse]
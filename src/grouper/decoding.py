@@ -0,0 +1,159 @@
+import io
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, Optional
+import numpy as np
+from PIL import Image, ImageOps
+from grouper.instrumentation import timed
+
+# Bumped when decoding changes the pixels the detector sees (2: EXIF orientation applied)
+DECODE_VERSION = 2
+
+# EXIF orientations that swap width and height
+TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+
+def load_rgb(source):
+    """Decode an image file (path or file object) to an upright RGB array.
+
+    Like face_recognition.load_image_file, but the EXIF orientation is
+    applied, so faces in rotated phone pictures are upright for the detector.
+    """
+    with Image.open(source) as img:
+        return np.asarray(ImageOps.exif_transpose(img).convert("RGB"))
+
+
+def load_downscaled(source, max_side):
+    """Decode an image with its longest side at most max_side pixels, upright.
+
+    JPEGs are decoded in draft mode, so libjpeg skips most of the work.
+    Returns the RGB array and the (x, y) factors mapping its pixels back to
+    the full-resolution upright image.
+    """
+    with Image.open(source) as img:
+        full_width, full_height = img.size
+        if img.getexif().get(0x0112, 1) in TRANSPOSED_ORIENTATIONS:
+            full_width, full_height = full_height, full_width
+        if img.format == "JPEG":
+            ratio = max_side / max(full_width, full_height)
+            img.draft("RGB", (int(img.size[0] * ratio), int(img.size[1] * ratio)))
+        img = ImageOps.exif_transpose(img).convert("RGB")
+    img.thumbnail((max_side, max_side), reducing_gap=2.0)
+    return (np.asarray(img),
+            (full_width / img.size[0], full_height / img.size[1]))
+
+
+class DecodedImage(NamedTuple):
+    """An image read and decoded ahead of detection"""
+    path: str
+    image: np.ndarray               # Full-resolution RGB, or the downscaled copy when scale is set
+    scale: Optional[tuple] = None   # (x, y) factors back to full resolution for a downscaled copy
+    data: Optional[bytes] = None    # File contents, kept to decode full resolution later
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes + (len(self.data) if self.data is not None else 0)
+
+    def full_image(self):
+        """Return the full-resolution RGB array, decoding it from the kept file contents if needed"""
+        if self.scale is None:
+            return self.image
+        return load_rgb(io.BytesIO(self.data) if self.data is not None else self.path)
+
+
+def decode_image(image_path, max_side=None, spans=None):
+    """Read an image file and decode it for detection, recording read and decode spans.
+
+    With ``max_side`` only the downscaled copy is decoded; the file
+    contents are kept so the full-resolution image can be decoded later
+    without touching the disk again.
+    """
+    with timed(spans, "read"):
+        with open(image_path, "rb") as f:
+            data = f.read()
+    with timed(spans, "decode", downscaled=bool(max_side)):
+        if max_side:
+            small, scale = load_downscaled(io.BytesIO(data), max_side)
+            return DecodedImage(image_path, small, scale, data)
+        return DecodedImage(image_path, load_rgb(io.BytesIO(data)))
+
+
+class DecodePrefetcher:
+    """Reads and decodes images on a small thread pool ahead of the detector.
+
+    At most ``depth`` images are queued or being decoded, and no new one
+    is started while the decoded images waiting for the consumer hold more
+    than ``max_bytes`` (one is always allowed, so huge images still go
+    through). File reads and decoding release the GIL, so on slow disks or
+    network shares the reads overlap with detection. The threads are kept
+    between runs; call close() to stop them.
+    """
+
+    def __init__(self, threads=2, depth=4, max_bytes=256 * 1024 * 1024, max_side=None):
+        self.threads = max(1, threads)
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.max_side = max_side
+        self.peak_bytes = 0
+        self._held = 0
+        self._lock = threading.Lock()
+        self._executor = None
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+
+    def _decode(self, image_path, spans):
+        decoded = decode_image(image_path, self.max_side, spans)
+        with self._lock:
+            self._held += decoded.nbytes
+            self.peak_bytes = max(self.peak_bytes, self._held)
+        return decoded
+
+    def decoded(self, image_paths, spans=None):
+        """Yield (path, DecodedImage or None, error or None) for each path, in input order.
+
+        Time the consumer spends waiting for a decode is recorded as a
+        "prefetch_wait" span.
+        """
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.threads, thread_name_prefix="decode")
+        paths = iter(image_paths)
+        pending = deque()
+        exhausted = False
+        try:
+            while True:
+                # Keep the queue topped up within the depth and memory limits
+                while (not exhausted and len(pending) < self.depth
+                       and (not pending or self._held < self.max_bytes)):
+                    image_path = next(paths, None)
+                    if image_path is None:
+                        exhausted = True
+                        break
+                    pending.append((image_path, self._executor.submit(self._decode, image_path, spans)))
+                if not pending:
+                    return
+
+                image_path, future = pending.popleft()
+                if not future.done():
+                    with timed(spans, "prefetch_wait"):
+                        error = future.exception()
+                else:
+                    error = future.exception()
+                if error is not None:
+                    yield image_path, None, str(error)
+                    continue
+                decoded = future.result()
+                with self._lock:
+                    self._held -= decoded.nbytes
+                yield image_path, decoded, None
+        finally:
+            # Drop decodes the consumer will never take
+            for _, future in pending:
+                future.cancel()
+            for _, future in pending:
+                if not future.cancelled() and future.exception() is None:
+                    with self._lock:
+                        self._held -= future.result().nbytes
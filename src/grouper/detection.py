@@ -0,0 +1,325 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from collections import deque
+from itertools import chain, islice
+import numpy as np
+from grouper.instrumentation import timed
+from grouper.models import MODELS, init_worker
+from grouper.decoding import DecodePrefetcher, decode_image
+
+# Size of the face embedding produced by face_recognition
+ENCODING_SIZE = 128
+
+
+def empty_result():
+    """Return the compact arrays for an image without faces"""
+    return (np.empty((0, 4), dtype=np.int32),
+            np.empty((0, ENCODING_SIZE), dtype=np.float32))
+
+
+def scale_locations(face_locations, scale, full_shape):
+    """Map (top, right, bottom, left) boxes from a downscaled image to full resolution"""
+    scale_x, scale_y = scale
+    height, width = full_shape[:2]
+    return [
+        (min(height - 1, int(round(top * scale_y))),
+         min(width - 1, int(round(right * scale_x))),
+         min(height - 1, int(round(bottom * scale_y))),
+         min(width - 1, int(round(left * scale_x))))
+        for top, right, bottom, left in face_locations
+    ]
+
+
+def detect_faces(image_path, model="hog", upsample=1, max_side=None, spans=None, decoded=None):
+    """Detect and encode the faces in one image.
+
+    With ``max_side`` set, the detector runs on a copy downscaled to at
+    most that many pixels on its longest side; the boxes are mapped back
+    and the encodings are still computed from the full-resolution pixels.
+    ``decoded`` is the image already read by decode_image (e.g. by a
+    DecodePrefetcher) with the same max_side; otherwise it is read here.
+    If ``spans`` is a list, read/decode/detect/encode timing spans are appended to it.
+
+    Returns a tuple of an int32 (N, 4) array of (top, right, bottom, left)
+    locations and a float32 (N, 128) encoding matrix.
+    """
+    face_recognition = MODELS.get()
+    if decoded is None:
+        decoded = decode_image(image_path, max_side, spans)
+    image = None
+    if decoded.scale is not None:
+        # Find faces on the small copy of the image
+        with timed(spans, "detect"):
+            face_locations = face_recognition.face_locations(
+                decoded.image, number_of_times_to_upsample=upsample, model=model
+            )
+        if face_locations:
+            with timed(spans, "decode"):
+                image = decoded.full_image()
+            face_locations = scale_locations(face_locations, decoded.scale, image.shape)
+    else:
+        image = decoded.image
+
+        # Find all face locations in the image
+        with timed(spans, "detect"):
+            face_locations = face_recognition.face_locations(
+                image, number_of_times_to_upsample=upsample, model=model
+            )
+    if not face_locations:
+        return empty_result()
+
+    # Get face encodings from the full-resolution image
+    with timed(spans, "encode", faces=len(face_locations)):
+        face_encodings = face_recognition.face_encodings(image, face_locations)
+
+    locations = np.asarray(face_locations, dtype=np.int32).reshape(-1, 4)
+    encodings = np.asarray(face_encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    return locations, encodings
+
+
+def _box_iou(a, b):
+    top, right = max(a[0], b[0]), min(a[1], b[1])
+    bottom, left = min(a[2], b[2]), max(a[3], b[3])
+    inter = max(0, right - left) * max(0, bottom - top)
+    area_a = (a[1] - a[3]) * (a[2] - a[0])
+    area_b = (b[1] - b[3]) * (b[2] - b[0])
+    union = area_a + area_b - inter
+    return inter / union if union > 0 else 0.0
+
+
+def compare_detection_modes(image_paths, max_side, model="hog", upsample=1,
+                            tolerance=0.6, iou_threshold=0.5):
+    """Run full-resolution and downscaled detection side by side and report the difference.
+
+    Faces are paired by box overlap (IoU). The report gives the time of
+    each mode, faces found by each, how many full-resolution faces the
+    downscaled mode also found, and how far apart the paired encodings are.
+    """
+    full_time = fast_time = 0.0
+    full_faces = fast_faces = matched = 0
+    distances = []
+
+    for image_path in image_paths:
+        start = time.perf_counter()
+        full_locations, full_encodings = detect_faces(image_path, model, upsample)
+        full_time += time.perf_counter() - start
+
+        start = time.perf_counter()
+        fast_locations, fast_encodings = detect_faces(image_path, model, upsample, max_side)
+        fast_time += time.perf_counter() - start
+
+        full_faces += len(full_locations)
+        fast_faces += len(fast_locations)
+        for i, box in enumerate(full_locations):
+            overlaps = [_box_iou(box, other) for other in fast_locations]
+            if overlaps and max(overlaps) >= iou_threshold:
+                j = int(np.argmax(overlaps))
+                matched += 1
+                distances.append(float(np.linalg.norm(full_encodings[i] - fast_encodings[j])))
+
+    distances = np.asarray(distances)
+    return {
+        'images': len(image_paths),
+        'max_side': max_side,
+        'full_seconds': full_time,
+        'downscaled_seconds': fast_time,
+        'speedup': full_time / fast_time if fast_time > 0 else None,
+        'full_faces': full_faces,
+        'downscaled_faces': fast_faces,
+        'face_recall': matched / full_faces if full_faces else 1.0,
+        'mean_encoding_distance': float(distances.mean()) if len(distances) else 0.0,
+        'max_encoding_distance': float(distances.max()) if len(distances) else 0.0,
+        'same_identity_rate': float(np.mean(distances <= tolerance)) if len(distances) else 1.0
+    }
+
+
+def _detect_stream(image_paths, model, upsample, max_side=None, spans=None, prefetcher=None):
+    """Yield (path, locations, encodings, error) per image, decoding ahead with a prefetcher if given"""
+    if prefetcher is None:
+        decoded_images = ((image_path, None, None) for image_path in image_paths)
+    else:
+        decoded_images = prefetcher.decoded(image_paths, spans)
+    try:
+        for image_path, decoded, error in decoded_images:
+            if error is not None:
+                yield (image_path, None, None, error)
+                continue
+            try:
+                with timed(spans, "image", path=image_path):
+                    locations, encodings = detect_faces(image_path, model, upsample, max_side, spans,
+                                                        decoded)
+                yield (image_path, locations, encodings, None)
+            except Exception as e:
+                yield (image_path, None, None, str(e))
+    finally:
+        decoded_images.close()
+
+
+# Per-process prefetcher reused by the chunks a pool worker runs, keyed by its settings
+_worker_prefetcher = None
+
+
+def _prefetcher_for(settings):
+    global _worker_prefetcher
+    if settings is None:
+        return None
+    if _worker_prefetcher is None or _worker_prefetcher[0] != settings:
+        if _worker_prefetcher is not None:
+            _worker_prefetcher[1].close()
+        threads, depth, max_bytes, max_side = settings
+        _worker_prefetcher = (settings, DecodePrefetcher(threads, depth, max_bytes, max_side))
+    return _worker_prefetcher[1]
+
+
+def _detect_chunk(image_paths, model, upsample, max_side=None, collect_spans=False, prefetch=None):
+    """Worker entry point: detect faces for a chunk of images.
+
+    ``prefetch`` is (threads, depth, max_bytes, max_side) for the worker's
+    decode prefetcher, or None to decode inline. Returns the per-image
+    results and, with ``collect_spans``, the timing spans recorded while
+    producing them (otherwise None).
+    """
+    spans = [] if collect_spans else None
+    results = list(_detect_stream(image_paths, model, upsample, max_side, spans,
+                                  _prefetcher_for(prefetch)))
+    return results, spans
+
+
+class DetectionEngine:
+    """Runs face detection and encoding over many images, optionally in parallel.
+
+    The worker pool is started on first use and kept between runs, so each
+    worker loads the models once; call close() to stop it. In every
+    process that detects, ``decode_threads`` threads read and decode the
+    next images while the current one is detected (0 decodes inline).
+    """
+
+    def __init__(self, workers=None, chunksize=8, model="hog", upsample=1, max_side=None,
+                 instruments=None, decode_threads=2, prefetch_depth=4,
+                 prefetch_max_bytes=256 * 1024 * 1024):
+        self.workers = workers if workers else (os.cpu_count() or 1)
+        self.chunksize = max(1, chunksize)
+        self.model = model
+        self.upsample = upsample
+        self.max_side = max_side  # Detect on a copy at most this large; None for full resolution
+        self.instruments = instruments  # Optional Instrumentation receiving per-image spans
+        self.decode_threads = decode_threads
+        self.prefetch_depth = prefetch_depth  # Images decoded ahead, per detecting process
+        self.prefetch_max_bytes = prefetch_max_bytes  # Cap on decoded images waiting, per process
+        self._executor = None
+        self._prefetcher = None
+
+    def _pool(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, initializer=init_worker)
+        return self._executor
+
+    def warm(self):
+        """Load the models ahead of the first run without blocking the caller.
+
+        With a pool, the workers are started and load the models in their
+        own processes; otherwise they load on a background thread here.
+        """
+        if self.workers <= 1:
+            MODELS.warm()
+            return
+        executor = self._pool()
+        # Each queued task makes the pool start another worker, which runs init_worker
+        for _ in range(self.workers):
+            executor.submit(int)
+
+    def close(self):
+        """Shut down the worker pool and decode threads, if they were started"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        if self._prefetcher is not None:
+            self._prefetcher[1].close()
+            self._prefetcher = None
+
+    def _prefetch_settings(self):
+        if self.decode_threads <= 0:
+            return None
+        return (self.decode_threads, self.prefetch_depth, self.prefetch_max_bytes, self.max_side)
+
+    def _local_prefetcher(self):
+        """The in-process prefetcher, recreated when the settings change"""
+        settings = self._prefetch_settings()
+        if settings is None:
+            return None
+        if self._prefetcher is None or self._prefetcher[0] != settings:
+            if self._prefetcher is not None:
+                self._prefetcher[1].close()
+            self._prefetcher = (settings, DecodePrefetcher(*settings))
+        return self._prefetcher[1]
+
+    def _chunks(self, image_paths):
+        paths = iter(image_paths)
+        while True:
+            chunk = list(islice(paths, self.chunksize))
+            if not chunk:
+                return
+            yield chunk
+
+    def _unpack(self, chunk_result):
+        """Merge a chunk's spans into the instruments and return its results"""
+        results, spans = chunk_result
+        if spans:
+            self.instruments.extend(spans)
+        return results
+
+    def detect(self, image_paths):
+        """Yield (path, locations, encodings, error) for each image, in input order.
+
+        ``image_paths`` may be any iterable, including a generator that is
+        still scanning; chunks are submitted as they fill up and at most
+        two chunks per worker are in flight at once.
+        """
+        chunks = self._chunks(image_paths)
+        first = next(chunks, None)
+        second = next(chunks, None) if first is not None else None
+
+        collect = self.instruments is not None and self.instruments.enabled
+
+        # Run in-process when there is nothing to gain from a pool
+        if self.workers <= 1 or second is None:
+            # Decode threads append spans while the detector runs, so hand them over as they come
+            spans = deque() if collect else None
+            paths = chain.from_iterable(chunk for chunk in chain([first, second], chunks) if chunk)
+            results = _detect_stream(paths, self.model, self.upsample, self.max_side, spans,
+                                     self._local_prefetcher())
+            try:
+                for result in results:
+                    while spans:
+                        self.instruments.add_span(*spans.popleft())
+                    yield result
+            finally:
+                results.close()
+                while spans:
+                    self.instruments.add_span(*spans.popleft())
+            return
+
+        executor = self._pool()
+        prefetch = self._prefetch_settings()
+        pending = deque()
+        try:
+            for chunk in chain([first, second], chunks):
+                pending.append(executor.submit(_detect_chunk, chunk, self.model, self.upsample,
+                                               self.max_side, collect, prefetch))
+
+                # Hand back finished chunks in order, and wait when too many are queued
+                while pending and (pending[0].done() or len(pending) >= 2 * self.workers):
+                    yield from self._unpack(pending.popleft().result())
+            while pending:
+                yield from self._unpack(pending.popleft().result())
+        except BrokenProcessPool:
+            # A worker died; start a fresh pool next time
+            self._executor = None
+            raise
+        finally:
+            # Drop queued chunks if the consumer stopped early (e.g. cancelled)
+            for future in pending:
+                future.cancel()
+            wait(pending)
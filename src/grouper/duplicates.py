@@ -0,0 +1,173 @@
+import numpy as np
+from collections import defaultdict
+from PIL import Image, ImageOps
+from grouper.detection import scale_locations
+from grouper.decoding import TRANSPOSED_ORIENTATIONS
+from utils.scanner import file_stat, hash_file
+
+
+def image_signature(image_path, hash_size=8):
+    """Return (difference hash, (width, height), mean RGB colour) of an image.
+
+    The dHash compares neighbouring pixels of a (hash_size + 1) x hash_size
+    grayscale thumbnail, so resized and re-encoded copies get the same or a
+    very close hash. The mean colour tells apart flat images, whose hashes
+    are all zero. JPEGs are decoded in draft mode at a fraction of their size.
+    The hash and the size both describe the upright image (EXIF orientation
+    applied), like the face locations, so a rotated copy still matches.
+    """
+    with Image.open(image_path) as img:
+        size = img.size
+        if img.getexif().get(0x0112, 1) in TRANSPOSED_ORIENTATIONS:
+            size = size[::-1]
+        img.draft("RGB", (hash_size * 8, hash_size * 8))
+        small = ImageOps.exif_transpose(img).convert("RGB").resize((hash_size + 1, hash_size), Image.BOX)
+    colour = np.asarray(small, dtype=np.float32)
+    gray = np.asarray(small.convert("L"), dtype=np.int16)
+    bits = (gray[:, 1:] > gray[:, :-1]).ravel()
+    return (int.from_bytes(np.packbits(bits).tobytes(), "big"), size,
+            colour.reshape(-1, 3).mean(axis=0))
+
+
+def hamming(a, b):
+    return bin(a ^ b).count("1")
+
+
+class HashIndex:
+    """Finds stored hashes within a Hamming distance using multi-index hashing.
+
+    The bits are split into max_distance + 1 bands. Two hashes within
+    max_distance of each other must agree exactly on at least one band, so
+    a query only compares the items sharing one of its band values instead
+    of every stored hash.
+    """
+
+    def __init__(self, max_distance=3, bits=64):
+        self.max_distance = max_distance
+        self.bands = max_distance + 1
+        self.band_bits = -(-bits // self.bands)
+        self.tables = [defaultdict(list) for _ in range(self.bands)]
+        self.items = []
+
+    def __len__(self):
+        return len(self.items)
+
+    def _band_keys(self, value):
+        mask = (1 << self.band_bits) - 1
+        return [(value >> (i * self.band_bits)) & mask for i in range(self.bands)]
+
+    def add(self, value, item):
+        """Store an item under a hash value"""
+        item_id = len(self.items)
+        self.items.append((value, item))
+        for table, key in zip(self.tables, self._band_keys(value)):
+            table[key].append(item_id)
+
+    def query(self, value):
+        """Return [(distance, item)] for stored hashes within max_distance, closest first"""
+        candidates = set()
+        for table, key in zip(self.tables, self._band_keys(value)):
+            candidates.update(table.get(key, ()))
+        matches = []
+        for item_id in candidates:
+            stored, item = self.items[item_id]
+            distance = hamming(value, stored)
+            if distance <= self.max_distance:
+                matches.append((distance, item_id, item))
+        return [(distance, item) for distance, _, item in sorted(matches)]
+
+
+class DuplicateFinder:
+    """Streaming pre-pass that maps each image to an earlier copy of it, if any.
+
+    Exact copies are found by content hash; only files that share their
+    size with an earlier file are hashed. Near-duplicates (resized or
+    re-encoded copies, burst shots) are only looked for when
+    ``near_distance`` is set: they are found by dHash within that many bits,
+    with the same aspect ratio and mean colour. A near-duplicate is not
+    always the same photo, so by default only exact copies are caught.
+    Images that are not copies become originals that later images are
+    compared against.
+    """
+
+    def __init__(self, near_distance=None, hash_size=8, aspect_tolerance=0.01, colour_tolerance=6.0):
+        self.near_distance = near_distance
+        self.hash_size = hash_size
+        self.aspect_tolerance = aspect_tolerance
+        self.colour_tolerance = colour_tolerance  # Max difference of any mean channel (0-255)
+        self.index = HashIndex(near_distance, hash_size * hash_size) if near_distance is not None else None
+        self.originals = {}    # duplicate path -> original path
+        self.exact = 0
+        self.near = 0
+
+        self._unhashed = defaultdict(list)  # file size -> originals not hashed yet
+        self._hashed_sizes = set()          # file sizes whose originals are all hashed
+        self._by_content = {}               # content hash -> original path
+        self._signatures = {}               # path -> ((width, height), mean colour), for near-duplicates
+
+    def _content_hash(self, path, file_size):
+        """Hash a file if an earlier original has the same size; None when its size is unique"""
+        unhashed = self._unhashed.pop(file_size, None)
+        if unhashed is None and file_size not in self._hashed_sizes:
+            return None
+        # Earlier originals of this size are hashed the first time a match is possible
+        for other in unhashed or ():
+            self._by_content.setdefault(hash_file(other), other)
+        self._hashed_sizes.add(file_size)
+        return hash_file(path)
+
+    def check(self, path, stat=None):
+        """Return the original an image duplicates, or None (registering it as an original).
+
+        ``stat`` is the FileStat a scan recorded for the file, if any.
+        """
+        try:
+            file_size = file_stat(path, stat).st_size
+            digest = self._content_hash(path, file_size)
+            if digest is not None and digest in self._by_content:
+                self.exact += 1
+                original = self.originals[path] = self._by_content[digest]
+                return original
+
+            value = None
+            if self.index is not None:
+                value, size, colour = image_signature(path, self.hash_size)
+                for _, original in self.index.query(value):
+                    if self._similar((size, colour), self._signatures[original]):
+                        self.near += 1
+                        self._signatures[path] = (size, colour)
+                        self.originals[path] = original
+                        return original
+        except Exception:
+            # Unreadable files are left to the detector, which reports the error
+            return None
+
+        # Not a copy: later images are compared against this one
+        if digest is not None:
+            self._by_content.setdefault(digest, path)
+        else:
+            self._unhashed[file_size].append(path)
+        if value is not None:
+            self._signatures[path] = (size, colour)
+            self.index.add(value, path)
+        return None
+
+    def _similar(self, signature, other):
+        """Check the aspect ratio and mean colour of two images with close hashes"""
+        (width, height), colour = signature
+        (other_width, other_height), other_colour = other
+        aspect = (width / height) / (other_width / other_height)
+        return (abs(aspect - 1) <= self.aspect_tolerance
+                and float(np.abs(colour - other_colour).max()) <= self.colour_tolerance)
+
+    def map_locations(self, path, locations):
+        """Map face locations found in a duplicate's original onto the duplicate itself"""
+        original = self.originals[path]
+        if path not in self._signatures or len(locations) == 0:
+            return locations
+        size, original_size = self._signatures[path][0], self._signatures[original][0]
+        if size == original_size:
+            return locations
+        scale = (size[0] / original_size[0], size[1] / original_size[1])
+        mapped = scale_locations(locations.tolist(), scale, (size[1], size[0]))
+        return np.asarray(mapped, dtype=np.int32).reshape(-1, 4)
@@ -0,0 +1,397 @@
+import os
+import json
+import numpy as np
+from collections.abc import Mapping, Sequence
+from grouper.detection import ENCODING_SIZE
+
+# Bumped when the on-disk layout of a saved store changes
+STORE_VERSION = 1
+
+# Per-face columns: name -> (dtype, shape of one row)
+FACE_COLUMNS = {
+    'path_ids': (np.int32, ()),
+    'locations': (np.int32, (4,)),
+    'identities': (np.int32, ()),
+    'encodings': (np.float32, (ENCODING_SIZE,)),
+}
+
+# Identity id of faces that have been added but not grouped yet
+UNASSIGNED = -1
+
+
+def _save_array(path, array):
+    """np.save via a temporary file, so a store mapped from the old file keeps working"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.save(f, np.ascontiguousarray(array))
+    os.replace(tmp_path, path)
+
+
+class FaceStore:
+    """Columnar store of face records.
+
+    Every face is one row across four arrays: the id of its image in an
+    interned path table, its (top, right, bottom, left) location, its
+    identity id and its float32 encoding. Paths and file names are stored
+    once per image and names once per identity, and running per-identity
+    encoding sums and counts are kept alongside for centroids.
+
+    save() writes each column as a .npy file; open() maps them back with
+    np.load(mmap_mode='r'), so a large library reopens without reading its
+    encodings into memory. The first append or removal on a mapped store
+    copies the columns into memory; the files are left untouched until the
+    next save().
+    """
+
+    def __init__(self, capacity=1024):
+        self.size = 0
+        self.columns = {
+            name: np.empty((max(1, capacity),) + shape, dtype=dtype)
+            for name, (dtype, shape) in FACE_COLUMNS.items()
+        }
+        self.paths = []         # path id -> filepath
+        self.filenames = []     # path id -> filename shown to the user
+        self.duplicate_of = []  # path id -> path id of the image it is a copy of, or -1
+        self.names = []         # identity id -> name
+        self._path_ids = {}     # filepath -> path id, for images still in the store
+        self.identity_sums = np.zeros((0, ENCODING_SIZE), dtype=np.float64)
+        self.identity_counts = np.zeros(0, dtype=np.int64)
+        self.has_encodings = True
+        self._groups = None
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def path_ids(self):
+        return self.columns['path_ids'][:self.size]
+
+    @property
+    def locations(self):
+        return self.columns['locations'][:self.size]
+
+    @property
+    def identities(self):
+        return self.columns['identities'][:self.size]
+
+    @property
+    def encodings(self):
+        return self.columns['encodings'][:self.size]
+
+    @property
+    def image_count(self):
+        """Number of images in the store, including those without faces"""
+        return len(self._path_ids)
+
+    def has_image(self, filepath):
+        return filepath in self._path_ids
+
+    def images(self, first_path_id=0):
+        """Yield (path id, filepath, filename, duplicate_of path id or -1) for images still in the store"""
+        for path_id in range(first_path_id, len(self.paths)):
+            filepath = self.paths[path_id]
+            if self._path_ids.get(filepath) == path_id:
+                yield path_id, filepath, self.filenames[path_id], self.duplicate_of[path_id]
+
+    @property
+    def duplicate_count(self):
+        """Number of images in the store that are copies of another image"""
+        return sum(1 for path_id in self._path_ids.values() if self.duplicate_of[path_id] >= 0)
+
+    def image_rows(self, filepaths):
+        """Return the row indices of the faces in the given images"""
+        path_ids = [self._path_ids[p] for p in filepaths if p in self._path_ids]
+        return np.flatnonzero(np.isin(self.path_ids, path_ids))
+
+    def image_faces(self, filepath):
+        """Return the (locations, encodings) stored for one image"""
+        rows = np.flatnonzero(self.path_ids == self._path_ids[filepath])
+        return np.array(self.locations[rows]), np.array(self.encodings[rows])
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        capacity = len(self.columns['path_ids'])
+        if needed <= capacity and all(type(c) is np.ndarray for c in self.columns.values()):
+            return
+        # Grow geometrically so appends stay amortized O(1); this also detaches mapped columns
+        capacity = max(needed, 2 * capacity)
+        for name, (dtype, shape) in FACE_COLUMNS.items():
+            column = np.empty((capacity,) + shape, dtype=dtype)
+            column[:self.size] = self.columns[name][:self.size]
+            self.columns[name] = column
+
+    def add_image(self, filepath, filename, locations, encodings, duplicate_of=None):
+        """Add an image and its faces as unassigned rows; returns the first new row.
+
+        ``duplicate_of`` names an image already in the store that this one is a copy of.
+        """
+        path_id = self._path_ids.get(filepath)
+        if path_id is None:
+            path_id = self._path_ids[filepath] = len(self.paths)
+            self.paths.append(filepath)
+            self.filenames.append(filename)
+            self.duplicate_of.append(self._path_ids.get(duplicate_of, -1))
+
+        start, count = self.size, len(locations)
+        self._reserve(count)
+        end = start + count
+        self.columns['path_ids'][start:end] = path_id
+        self.columns['locations'][start:end] = np.asarray(locations, dtype=np.int32).reshape(-1, 4)
+        self.columns['identities'][start:end] = UNASSIGNED
+        self.columns['encodings'][start:end] = encodings
+        self.size = end
+        return start
+
+    def assign(self, start, identities):
+        """Set the identity of rows start..start+len(identities) and update the identity stats.
+
+        Rows given UNASSIGNED stay out of the statistics.
+        """
+        identities = np.asarray(identities, dtype=np.int32)
+        end = start + len(identities)
+        self.columns['identities'][start:end] = identities
+
+        # Grow the per-identity statistics to cover new identities
+        identity_count = max(len(self.names), int(identities.max()) + 1 if len(identities) else 0)
+        extra = identity_count - len(self.identity_counts)
+        if extra > 0:
+            self.identity_sums = np.vstack([self.identity_sums, np.zeros((extra, ENCODING_SIZE))])
+            self.identity_counts = np.concatenate([self.identity_counts, np.zeros(extra, dtype=np.int64)])
+        assigned = identities != UNASSIGNED
+        np.add.at(self.identity_sums, identities[assigned], self.encodings[start:end][assigned])
+        np.add.at(self.identity_counts, identities[assigned], 1)
+        self._groups = None
+
+    def append_store(self, other, identity_map):
+        """Append another store's images and faces, mapping its identity ids through identity_map.
+
+        ``identity_map`` is an array giving this store's identity id for
+        each of the other store's; the names are not copied.
+        """
+        # Re-intern the other store's images, keeping its path order
+        path_map = np.full(len(other.paths), -1, dtype=np.int32)
+        for path_id in sorted(other._path_ids.values()):
+            filepath = other.paths[path_id]
+            new_id = self._path_ids.get(filepath)
+            if new_id is None:
+                new_id = self._path_ids[filepath] = len(self.paths)
+                self.paths.append(filepath)
+                self.filenames.append(other.filenames[path_id])
+                self.duplicate_of.append(-1)
+            path_map[path_id] = new_id
+        for path_id in other._path_ids.values():
+            original = other.duplicate_of[path_id]
+            if original >= 0 and path_map[original] >= 0:
+                self.duplicate_of[path_map[path_id]] = int(path_map[original])
+
+        start, count = self.size, len(other)
+        self._reserve(count)
+        end = start + count
+        self.columns['path_ids'][start:end] = path_map[other.path_ids]
+        self.columns['locations'][start:end] = other.locations
+        self.columns['encodings'][start:end] = other.encodings
+        self.size = end
+
+        # UNASSIGNED is -1, so it picks the UNASSIGNED appended at the end
+        lookup = np.append(np.asarray(identity_map, dtype=np.int32), UNASSIGNED)
+        self.assign(start, lookup[other.identities])
+        return start
+
+    def remove_images(self, filepaths):
+        """Drop images and their faces; returns the identity ids left without faces"""
+        removed_ids = [self._path_ids.pop(p) for p in filepaths if p in self._path_ids]
+        if not removed_ids:
+            return []
+        removed = np.isin(self.path_ids, removed_ids)
+        if not removed.any():
+            return []
+
+        identities = self.identities[removed]
+        assigned = identities != UNASSIGNED
+        np.subtract.at(self.identity_sums, identities[assigned], self.encodings[removed][assigned])
+        np.subtract.at(self.identity_counts, identities[assigned], 1)
+
+        # Compact the columns, keeping the remaining faces in order
+        keep = ~removed
+        for name in FACE_COLUMNS:
+            self.columns[name] = np.ascontiguousarray(self.columns[name][:self.size][keep])
+        self.size = len(self.columns['path_ids'])
+        self._groups = None
+
+        affected = np.unique(identities[assigned])
+        return [int(i) for i in affected if self.identity_counts[i] == 0]
+
+    def unique_face_counts(self):
+        """Faces per identity id, not counting faces in images that are copies"""
+        identities = self.identities
+        copies = np.asarray(self.duplicate_of, dtype=np.int32) >= 0
+        unique = identities != UNASSIGNED
+        if len(copies):
+            unique &= ~copies[self.path_ids]
+        return np.bincount(identities[unique], minlength=len(self.names))
+
+    def centroids(self):
+        """Return {identity id: mean encoding} for every identity that still has faces"""
+        return {
+            i: (self.identity_sums[i] / count).astype(np.float32)
+            for i, count in enumerate(self.identity_counts) if count > 0
+        }
+
+    def _group_rows(self):
+        """Return {identity id: row indices in store order} for identities with faces"""
+        if self._groups is None:
+            identities = self.identities
+            rows = np.flatnonzero(identities != UNASSIGNED)
+            order = rows[np.argsort(identities[rows], kind="stable")]
+            counts = np.bincount(identities[rows], minlength=len(self.names))
+            offsets = np.concatenate([[0], np.cumsum(counts)])
+            self._groups = {
+                int(i): order[offsets[i]:offsets[i + 1]]
+                for i in np.flatnonzero(counts)
+            }
+        return self._groups
+
+    def face(self, row):
+        """Return one face as the {'filename', 'filepath', 'location'} dict used elsewhere"""
+        path_id = int(self.columns['path_ids'][row])
+        return {
+            'filename': self.filenames[path_id],
+            'filepath': self.paths[path_id],
+            'location': tuple(int(v) for v in self.columns['locations'][row])
+        }
+
+    def view(self):
+        """Return a read-only {name: [face dict]} mapping over the store"""
+        return GroupedFacesView(self)
+
+    def faces_by_path(self):
+        """Group assigned faces by image: {filepath: (filename, [(name, location)])}"""
+        identities = self.identities
+        rows = np.flatnonzero(identities != UNASSIGNED)
+        rows = rows[np.argsort(self.path_ids[rows], kind="stable")]
+        faces_by_path = {}
+        for row, path_id, identity, location in zip(rows, self.path_ids[rows], identities[rows],
+                                                     self.locations[rows].tolist()):
+            filepath = self.paths[path_id]
+            entry = faces_by_path.get(filepath)
+            if entry is None:
+                entry = faces_by_path[filepath] = (self.filenames[path_id], [])
+            entry[1].append((self.names[identity], tuple(location)))
+        return faces_by_path
+
+    def save(self, directory):
+        """Write the store to a directory of .npy columns plus a JSON table of paths and names"""
+        os.makedirs(directory, exist_ok=True)
+        for name in FACE_COLUMNS:
+            _save_array(os.path.join(directory, f"{name}.npy"), self.columns[name][:self.size])
+        _save_array(os.path.join(directory, "identity_sums.npy"), self.identity_sums)
+        _save_array(os.path.join(directory, "identity_counts.npy"), self.identity_counts)
+
+        meta = {
+            'version': STORE_VERSION,
+            'faces': self.size,
+            'paths': self.paths,
+            'filenames': self.filenames,
+            'duplicate_of': self.duplicate_of,
+            'removed': [i for i, p in enumerate(self.paths) if self._path_ids.get(p) != i],
+            'names': self.names,
+            'has_encodings': self.has_encodings
+        }
+        tmp_path = os.path.join(directory, "store.json.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(tmp_path, os.path.join(directory, "store.json"))
+
+    @classmethod
+    def open(cls, directory, mmap=True):
+        """Open a saved store; with mmap the face columns are memory-mapped, not read"""
+        with open(os.path.join(directory, "store.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if meta.get('version') != STORE_VERSION:
+            raise ValueError(f"Unsupported face store version in {directory}: {meta.get('version')}")
+
+        store = cls(capacity=1)
+        mmap_mode = "r" if mmap else None
+        for name in FACE_COLUMNS:
+            store.columns[name] = np.load(os.path.join(directory, f"{name}.npy"), mmap_mode=mmap_mode)
+        store.size = meta['faces']
+        store.paths = meta['paths']
+        store.filenames = meta['filenames']
+        store.duplicate_of = meta.get('duplicate_of', [-1] * len(store.paths))
+        store.names = meta['names']
+        removed = set(meta['removed'])
+        store._path_ids = {p: i for i, p in enumerate(store.paths) if i not in removed}
+        store.identity_sums = np.load(os.path.join(directory, "identity_sums.npy"))
+        store.identity_counts = np.load(os.path.join(directory, "identity_counts.npy"))
+        store.has_encodings = meta['has_encodings']
+        return store
+
+    @classmethod
+    def from_grouped_faces(cls, grouped_faces):
+        """Build a store from {name: [face dict]} results; these carry no encodings"""
+        store = cls()
+        store.has_encodings = False
+        identities = []
+        no_encoding = np.zeros((1, ENCODING_SIZE), dtype=np.float32)
+        for name, faces in grouped_faces.items():
+            identity = len(store.names)
+            store.names.append(name)
+            for face in faces:
+                store.add_image(face['filepath'], face['filename'], [face['location']], no_encoding)
+                identities.append(identity)
+        store.assign(0, identities)
+        return store
+
+
+class FaceList(Sequence):
+    """Lazy sequence of face dicts for a set of store rows"""
+
+    def __init__(self, store, rows):
+        self.store = store
+        self.rows = rows
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return FaceList(self.store, self.rows[index])
+        return self.store.face(self.rows[index])
+
+
+class GroupedFacesView(Mapping):
+    """Read-only {name: FaceList} view of a FaceStore, shaped like the old grouped_faces dict.
+
+    People are listed by identity id, which is the order they were first
+    seen; identities without faces are left out.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self._name_ids = None
+
+    def _ids(self):
+        return self.store._group_rows()
+
+    def __getitem__(self, name):
+        if self._name_ids is None or len(self._name_ids) != len(self.store.names):
+            self._name_ids = {n: i for i, n in enumerate(self.store.names)}
+        identity = self._name_ids.get(name)
+        rows = self._ids().get(identity)
+        if rows is None:
+            raise KeyError(name)
+        return FaceList(self.store, rows)
+
+    def __iter__(self):
+        names = self.store.names
+        return (names[i] for i in self._ids())
+
+    def __len__(self):
+        return len(self._ids())
+
+    def items(self):
+        names = self.store.names
+        return [(names[i], FaceList(self.store, rows)) for i, rows in self._ids().items()]
+
+    def values(self):
+        return [FaceList(self.store, rows) for rows in self._ids().values()]
@@ -0,0 +1,218 @@
+import math
+import numpy as np
+from grouper.detection import ENCODING_SIZE
+from grouper.matching import EncodingMatrix, squared_distances
+
+
+class ExactIndex:
+    """Brute-force identity index: every query is compared with every identity"""
+
+    def __init__(self, dim=ENCODING_SIZE):
+        self.vectors = EncodingMatrix(dim=dim)
+        self.removed = set()
+        self._excluded = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.vectors)
+
+    def add(self, encodings):
+        """Add identity encodings and return their ids"""
+        return self.vectors.extend(encodings)
+
+    def update(self, ids, encodings):
+        """Replace the encodings stored for existing ids"""
+        self.vectors.set(ids, encodings)
+
+    def remove(self, ids):
+        """Stop returning the given identities from searches"""
+        self.removed.update(int(i) for i in ids)
+        self._excluded = np.fromiter(sorted(self.removed), dtype=np.int64)
+
+    def search(self, queries):
+        """Return (ids, distances) of the nearest identity per query, -1 when empty"""
+        return self.vectors.nearest(queries, exclude=self._excluded)
+
+
+class IVFIndex:
+    """Approximate identity index using k-means (inverted file) partitioning.
+
+    Identities are bucketed by their nearest k-means centroid and a query is
+    only compared with the identities in its ``nprobe`` nearest buckets.
+    Until ``train_size`` identities exist the index answers exactly; the
+    partitioning is rebuilt each time the index doubles in size.
+    """
+
+    def __init__(self, dim=ENCODING_SIZE, nlist=None, nprobe=8, train_size=2048,
+                 kmeans_iterations=10, seed=0):
+        self.vectors = EncodingMatrix(dim=dim)
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = train_size
+        self.kmeans_iterations = kmeans_iterations
+        self.rng = np.random.default_rng(seed)
+        self.centroids = None
+        self.lists = []
+        self._bucket_of = {}
+        self.removed = set()
+        self._excluded = np.empty(0, dtype=np.int64)
+        self._trained_at = 0
+
+    def __len__(self):
+        return len(self.vectors)
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self):
+        """(Re)build the k-means partitioning over all stored identities"""
+        active = np.setdiff1d(np.arange(len(self.vectors)), self._excluded)
+        data = self.vectors.matrix[active]
+        if len(data) == 0:
+            self.centroids, self.lists, self._bucket_of = None, [], {}
+            return
+        nlist = self.nlist or max(1, int(4 * math.sqrt(len(data))))
+        nlist = min(nlist, len(data))
+
+        # Lloyd's k-means, seeded from a random sample of the identities
+        centroids = data[self.rng.choice(len(data), nlist, replace=False)].copy()
+        for _ in range(self.kmeans_iterations):
+            labels = self._nearest_centroids(data, centroids, 1)[:, 0]
+            counts = np.bincount(labels, minlength=nlist)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, data)
+            filled = counts > 0
+            centroids[filled] = sums[filled] / counts[filled, None]
+
+        self.centroids = centroids
+        labels = self._nearest_centroids(data, centroids, 1)[:, 0]
+        order = np.argsort(labels, kind="stable")
+        bounds = np.searchsorted(labels[order], np.arange(nlist + 1))
+        self.lists = [active[order[bounds[i]:bounds[i + 1]]].tolist() for i in range(nlist)]
+        self._bucket_of = dict(zip(active.tolist(), labels.tolist()))
+        self._trained_at = len(self.vectors)
+
+    @staticmethod
+    def _nearest_centroids(queries, centroids, count):
+        sq = squared_distances(queries, centroids)
+        if count >= sq.shape[1]:
+            return np.argsort(sq, axis=1)
+        return np.argpartition(sq, count - 1, axis=1)[:, :count]
+
+    def add(self, encodings):
+        """Add identity encodings and return their ids"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.vectors.dim)
+        ids = self.vectors.extend(encodings)
+
+        if not self.is_trained:
+            if len(self.vectors) >= self.train_size:
+                self.train()
+        elif len(self.vectors) >= 2 * self._trained_at:
+            self.train()
+        else:
+            labels = self._nearest_centroids(encodings, self.centroids, 1)[:, 0]
+            for identity, label in zip(ids.tolist(), labels.tolist()):
+                self.lists[label].append(identity)
+                self._bucket_of[identity] = label
+        return ids
+
+    def update(self, ids, encodings):
+        """Replace the encodings stored for existing ids, moving them to their new nearest bucket"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.vectors.dim)
+        self.vectors.set(ids, encodings)
+        if not self.is_trained:
+            return
+        labels = self._nearest_centroids(encodings, self.centroids, 1)[:, 0]
+        for identity, label in zip(np.asarray(ids).tolist(), labels.tolist()):
+            bucket = self._bucket_of.get(identity)
+            if bucket is None or bucket == label:
+                continue
+            self.lists[bucket].remove(identity)
+            self.lists[label].append(identity)
+            self._bucket_of[identity] = label
+
+    def remove(self, ids):
+        """Stop returning the given identities from searches"""
+        ids = [int(i) for i in ids]
+        self.removed.update(ids)
+        self._excluded = np.fromiter(sorted(self.removed), dtype=np.int64)
+        for identity in ids:
+            bucket = self._bucket_of.pop(identity, None)
+            if bucket is not None:
+                self.lists[bucket].remove(identity)
+
+    def search(self, queries):
+        """Return (ids, distances) of the approximate nearest identity per query"""
+        if not self.is_trained:
+            return self.vectors.nearest(queries, exclude=self._excluded)
+
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.vectors.dim)
+        best_ids = np.full(len(queries), -1, dtype=np.int64)
+        best_sq = np.full(len(queries), np.inf, dtype=np.float32)
+        probes = self._nearest_centroids(queries, self.centroids, self.nprobe)
+
+        # Group (query, bucket) pairs by bucket so each bucket is visited once
+        flat = probes.ravel()
+        query_ids = np.repeat(np.arange(len(queries)), probes.shape[1])
+        order = np.argsort(flat, kind="stable")
+        flat, query_ids = flat[order], query_ids[order]
+        buckets, starts = np.unique(flat, return_index=True)
+        ends = np.append(starts[1:], len(flat))
+
+        data = self.vectors.matrix
+        for bucket, start, end in zip(buckets, starts, ends):
+            members = self.lists[bucket]
+            if not members:
+                continue
+            query_idx = query_ids[start:end]
+            members = np.asarray(members)
+            sq = squared_distances(queries[query_idx], data[members])
+            nearest = np.argmin(sq, axis=1)
+            nearest_sq = sq[np.arange(len(query_idx)), nearest]
+            closer = nearest_sq < best_sq[query_idx]
+            best_sq[query_idx[closer]] = nearest_sq[closer]
+            best_ids[query_idx[closer]] = members[nearest[closer]]
+
+        return best_ids, np.sqrt(best_sq)
+
+
+# Identity index backends selectable by name
+INDEX_BACKENDS = {
+    "exact": ExactIndex,
+    "ivf": IVFIndex,
+}
+
+
+def create_index(backend="exact", **options):
+    """Create an identity index by backend name"""
+    if backend not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown identity index backend '{backend}', "
+                         f"expected one of {sorted(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[backend](**options)
+
+
+def measure_recall(index, queries, tolerance):
+    """Compare an index's answers with an exact search over the same identities.
+
+    Returns the fraction of queries whose nearest identity matches the
+    exact backend, and the fraction whose within-tolerance decision
+    (match vs new identity) agrees with it.
+    """
+    queries = np.asarray(queries, dtype=np.float32).reshape(-1, index.vectors.dim)
+    if len(queries) == 0:
+        return {"queries": 0, "nearest_recall": 1.0, "match_agreement": 1.0}
+
+    exact = ExactIndex(dim=index.vectors.dim)
+    exact.add(index.vectors.matrix)
+    if index.removed:
+        exact.remove(index.removed)
+    exact_ids, exact_dist = exact.search(queries)
+    approx_ids, approx_dist = index.search(queries)
+
+    exact_match = exact_dist <= tolerance
+    approx_match = approx_dist <= tolerance
+    return {
+        "queries": len(queries),
+        "nearest_recall": float(np.mean(exact_ids == approx_ids)),
+        "match_agreement": float(np.mean(exact_match == approx_match)),
+    }
@@ -1,142 +1,583 @@
 import os
-import face_recognition
-from PIL import Image, ImageDraw
 import numpy as np
-from collections import defaultdict
+from collections import deque
+from itertools import chain
+from grouper.detection import DetectionEngine, ENCODING_SIZE, detect_faces
+from grouper.cache import EmbeddingCache
+from grouper.matching import match_encodings
+from grouper.identity_index import create_index, measure_recall
+from grouper.prototypes import IdentityPrototypes
+from grouper.clustering import cluster_encodings
+from grouper.labeling import label_images
+from grouper.progress import ProgressTracker, is_cancelled
+from grouper.instrumentation import Instrumentation
+from grouper.face_store import FaceStore
+from grouper.project_db import ProjectDatabase, is_project_file
+from grouper.duplicates import DuplicateFinder
+from grouper import shards
+from grouper.results import load_grouped_faces
+from utils.scanner import file_stat, scanned_stat
 
 class FaceGrouper:
-    def __init__(self):
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.grouped_faces = defaultdict(list)
+    def __init__(self, workers=None, chunksize=8, model="hog", upsample=1, detect_max_side=None,
+                 cache_dir=None, cache_max_bytes=512 * 1024 * 1024, hash_content=False,
+                 index_backend="exact", index_options=None,
+                 grouping="greedy", cluster_method="chinese_whispers", cluster_options=None,
+                 dedupe=True, near_duplicate_distance=None, instrument=True, project=None,
+                 max_exemplars=4, exemplar_spacing=0.35,
+                 decode_threads=2, prefetch_depth=4, prefetch_max_bytes=256 * 1024 * 1024):
+        self.index_backend = index_backend
+        self.index_options = dict(index_options or {})
         self.tolerance = 0.6  # Face matching tolerance - lower is more strict
+        self.match_batch_size = 512  # Encodings matched per vectorized call; prototypes update in between
+        
+        # Each identity is matched by its running centroid plus up to max_exemplars diverse faces
+        self.max_exemplars = max_exemplars
+        self.exemplar_spacing = exemplar_spacing
+        
+        # Grouping engine: "greedy" assigns faces in order, "cluster" groups them all at once
+        self.grouping = grouping
+        self.cluster_method = cluster_method
+        self.cluster_options = dict(cluster_options or {})
+        self.cluster_block_size = 2048  # Tile size for the neighbour graph
+        
+        # Timing spans, counters and latency histograms for every stage
+        self.instruments = Instrumentation(enabled=instrument)
+        
+        # Detection settings, shared by the serial and parallel paths
+        self.detector = DetectionEngine(workers=workers, chunksize=chunksize,
+                                        model=model, upsample=upsample, max_side=detect_max_side,
+                                        instruments=self.instruments, decode_threads=decode_threads,
+                                        prefetch_depth=prefetch_depth,
+                                        prefetch_max_bytes=prefetch_max_bytes)
+        
+        # Duplicate pre-pass: copies reuse the detection of the first image seen
+        self.dedupe = dedupe
+        self.near_duplicate_distance = near_duplicate_distance  # dHash bits; None (default) for exact copies only
+        
+        # Optional persistent cache of detection results
+        self.cache = EmbeddingCache(cache_dir, max_bytes=cache_max_bytes,
+                                    hash_content=hash_content) if cache_dir else None
+        
+        # Optional SQLite project database the results are written to
+        self.project = None
+        
+        self.reset()
+        if project:
+            self.open_project(project)
 
     def process_image(self, image_path):
         """Process a single image to find and encode faces"""
+        instruments = self.instruments
         try:
-            # Load the image
-            image = face_recognition.load_image_file(image_path)
-            
-            # Find all face locations in the image
-            face_locations = face_recognition.face_locations(image)
+            cache_key = self._cache_key(image_path)
+            cached = self.cache.get(cache_key) if cache_key else None
+            if cached is not None:
+                instruments.count('cache_hits')
+                locations, encodings = cached
+            else:
+                spans = [] if instruments.enabled else None
+                with instruments.span("image", path=image_path):
+                    locations, encodings = detect_faces(image_path, self.detector.model,
+                                                        self.detector.upsample, self.detector.max_side,
+                                                        spans)
+                instruments.extend(spans or [])
+                if cache_key:
+                    instruments.count('cache_misses')
+                    self.cache.put(cache_key, locations, encodings)
+            instruments.count('images')
+            instruments.count('faces', len(locations))
             
             # If no faces found, return empty list
-            if not face_locations:
+            if len(locations) == 0:
                 print(f"No faces found in {image_path}")
                 return []
             
-            # Get face encodings
-            face_encodings = face_recognition.face_encodings(image, face_locations)
-            
-            return {
-                'path': image_path,
-                'locations': face_locations,
-                'encodings': face_encodings
-            }
+            return self._make_result(image_path, locations, encodings)
         except Exception as e:
             print(f"Error processing image {image_path}: {e}")
+            instruments.error(image_path, e)
             return []
-            
-    def group_faces(self, image_files):
-        """Group faces across multiple images"""
-        self.known_face_encodings = []
-        self.known_face_names = []
-        self.grouped_faces = defaultdict(list)
-        
-        # Process all images
-        results = []
-        for i, (filename, filepath) in enumerate(image_files):
-            print(f"Processing image {i+1}/{len(image_files)}: {filename}")
-            result = self.process_image(filepath)
-            if result:
-                results.append((filename, result))
-        
-        # Group similar faces
-        face_id = 1
-        
-        for filename, result in results:
-            face_found = False
-            for i, face_encoding in enumerate(result['encodings']):
-                # Compare with known faces
-                matches = face_recognition.compare_faces(
-                    self.known_face_encodings, face_encoding, tolerance=self.tolerance
-                ) if self.known_face_encodings else []
-                
-                # If we found a match
-                if True in matches:
-                    matched_face_idx = matches.index(True)
-                    face_name = self.known_face_names[matched_face_idx]
-                    face_found = True
+    
+    def _make_result(self, image_path, locations, encodings):
+        """Build the per-image result dict from compact detection arrays"""
+        return {
+            'path': image_path,
+            'locations': [tuple(int(v) for v in row) for row in locations],
+            'encodings': encodings
+        }
+    
+    def _cache_key(self, image_path, stat=None):
+        """Return the cache key for an image, or None when caching is off.
+        
+        ``stat`` is the FileStat a scan recorded for the file; without it the file is stat'ed now.
+        """
+        if self.cache is None:
+            return None
+        try:
+            return self.cache.make_key(image_path, self.detector.model, self.detector.upsample,
+                                       stat=file_stat(image_path, stat), max_side=self.detector.max_side)
+        except OSError:
+            return None
+    
+    def _detect_cached(self, paths):
+        """Yield detections in input order, only running the detector on cache misses.
+        
+        ``paths`` yields (path, FileStat from the scan or None).
+        
+        With duplicate detection on, copies of an earlier image are not
+        detected at all; they get the original's faces instead, taken from
+        the store once the original has been yielded (and stored by the
+        consumer).
+        """
+        # [path, cache key, detection or None, (original path, original's entry or None) or None]
+        # for every path read but not yet yielded
+        pending = deque()
+        counts = {'hits': 0, 'misses': 0, 'copies': 0}
+        
+        # Pending entries of originals not yielded yet, for copies read in the meantime
+        in_flight = {}
+        
+        def misses():
+            # Feed the detector lazily so a streaming input starts detection early
+            for path, stat in paths:
+                original = self._find_original(path, stat, in_flight)
+                if original is not None:
+                    counts['copies'] += 1
+                    pending.append([path, None, None, (original, in_flight.get(original))])
+                    continue
+                key = self._cache_key(path, stat)
+                hit = self.cache.get(key) if key else None
+                item = [path, key, None if hit is None else (path, hit[0], hit[1], None), None]
+                pending.append(item)
+                if self.duplicates is not None:
+                    in_flight[path] = item
+                if hit is None:
+                    counts['misses'] += 1
+                    yield path
                 else:
-                    # This is a new face
-                    face_name = f"Person_{face_id}"
-                    face_id += 1
-                    self.known_face_encodings.append(face_encoding)
-                    self.known_face_names.append(face_name)
-                    face_found = True
+                    counts['hits'] += 1
+        
+        detections = self.detector.detect(misses())
+        try:
+            for detection in chain(detections, [None]):
+                if detection is not None:
+                    # Fill in the oldest miss still waiting for its result
+                    item = next(item for item in pending if item[2] is None and item[3] is None)
+                    item[2] = detection
+                    if item[1] and detection[3] is None:
+                        self.cache.put(item[1], detection[1], detection[2])
+                # A copy is always behind its original, so it can be filled in once it reaches the front
+                while pending and (pending[0][2] is not None or pending[0][3] is not None):
+                    path, _, detection, original = pending.popleft()
+                    if original is not None:
+                        original, entry = original
+                        detection = self._copy_detection(path, original, entry[2] if entry else None)
+                    else:
+                        in_flight.pop(path, None)
+                    yield detection
+        finally:
+            # Shut the worker pool down promptly if we stop early
+            detections.close()
+            if self.cache is not None:
+                self.instruments.count('cache_hits', counts['hits'])
+                self.instruments.count('cache_misses', counts['misses'])
+                print(f"Embedding cache: {counts['hits']} hits, {counts['misses']} detected")
+            if counts['copies']:
+                self.instruments.count('duplicate_images', counts['copies'])
+                print(f"Duplicates: {counts['copies']} copies reused an earlier detection")
+    
+    def _find_original(self, path, stat, in_flight):
+        """Return the image a path duplicates, if its detection is available, else None"""
+        if self.duplicates is None:
+            return None
+        original = self.duplicates.check(path, stat)
+        if original is None:
+            return None
+        if original in in_flight or self.store.has_image(original):
+            return original
+        # The original failed, was removed since or was never stored; detect this copy after all
+        del self.duplicates.originals[path]
+        return None
+    
+    def _copy_detection(self, path, original, detection=None):
+        """Build a copy's detection from its original's, mapping the boxes to the copy's size.
+        
+        ``detection`` is the original's own detection while it is still in
+        flight; otherwise its faces are read from the store.
+        """
+        if detection is None:
+            locations, encodings = self.store.image_faces(original)
+            detection = (original, locations, encodings, None)
+        _, locations, encodings, error = detection
+        if error is not None:
+            return (path, None, None, f"copy of {original}: {error}")
+        return (path, self.duplicates.map_locations(path, locations), encodings.copy(), None)
+    
+    def _iter_detections(self, image_files, progress_callback=None, cancel_event=None):
+        """Yield (filename, path, locations, encodings) for each successfully processed image"""
+        total = len(image_files) if hasattr(image_files, '__len__') else None
+        progress = ProgressTracker("detect", total, progress_callback)
+        
+        # Filenames wait here until their detection comes back, in the same order
+        filenames = deque()
+        
+        def paths():
+            for entry in image_files:
+                filename, filepath = entry
+                filenames.append(filename)
+                yield filepath, scanned_stat(entry)
+        
+        detections = self._detect_cached(paths())
+        
+        try:
+            for i, detection in enumerate(detections):
+                filename = filenames.popleft()
+                image_path, locations, encodings, error = detection
+                print(f"Processed image {i+1}/{total or '?'}: {filename}")
+                self.instruments.count('images')
+                if error is not None:
+                    print(f"Error processing image {image_path}: {error}")
+                    self.instruments.error(image_path, error)
+                else:
+                    self.instruments.count('faces', len(locations))
+                    if len(locations) == 0:
+                        print(f"No faces found in {image_path}")
+                    yield filename, image_path, locations, encodings
+                progress.update(faces=0 if error is not None else len(locations))
                 
-                # Add to grouped faces
-                face_location = result['locations'][i]
-                self.grouped_faces[face_name].append({
-                    'filename': filename,
-                    'filepath': result['path'],
-                    'location': face_location
-                })
+                # Stop early, keeping what has been processed so far
+                if is_cancelled(cancel_event):
+                    print(f"Cancelled after {i+1}/{total or '?'} images")
+                    break
+        finally:
+            detections.close()
+    
+    def detect_images(self, image_files, progress_callback=None, cancel_event=None):
+        """Detect faces in all images, using the worker pool when configured"""
+        return [
+            (filename, self._make_result(image_path, locations, encodings))
+            for filename, image_path, locations, encodings
+            in self._iter_detections(image_files, progress_callback, cancel_event)
+            if len(locations)
+        ]
+            
+    def reset(self):
+        """Forget all identities and grouped faces, and restart the instrumentation"""
+        self.instruments.reset()
+        self.identity_index = IdentityPrototypes(
+            create_index(self.index_backend, **self.index_options), self.max_exemplars, self.exemplar_spacing,
+            exemplar_index=create_index(self.index_backend, **self.index_options)
+        )
+        self._index_stale = False  # Set when a loaded store's prototypes have not been built yet
         
+        # Columnar face records for every processed image, with identity names and stats
+        self._store = FaceStore()
+        self.duplicates = DuplicateFinder(self.near_duplicate_distance) if self.dedupe else None
+    
+    @property
+    def store(self):
+        """The face store; an opened project is only read into it when first needed"""
+        return self.load_store()
+    
+    def load_store(self):
+        """Read an opened project's faces and encodings now, if not done yet, and return the store"""
+        if self._store is None:
+            self._store = self.project.load_store()
+            self._index_stale = True
+        return self._store
+    
+    @store.setter
+    def store(self, store):
+        self._store = store
+    
+    @property
+    def known_face_names(self):
+        """Identity id -> name"""
+        return self.store.names
+    
+    @property
+    def grouped_faces(self):
+        """{name: [face dict]} view of the store, or of the project database until the store is loaded"""
+        if self._store is None:
+            return self.project.view()
+        return self.store.view()
+    
+    def open_project(self, path):
+        """Use a project database, creating it if needed, and take over any results it holds.
+        
+        Summaries, browsing and labeling read the database directly; its
+        faces and encodings are only loaded when more images are grouped.
+        Later grouping runs write their results to it.
+        """
+        self.reset()
+        if self.project is not None:
+            self.project.close()
+        self.project = ProjectDatabase(path)
+        if self.project.image_count:
+            self._store = None
         return self.grouped_faces
     
-    def label_faces(self, output_dir):
-        """Save labeled images to output directory"""
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
+    def _write_project(self, first_image=0, first_row=0, replace=False):
+        """Write store images and faces added since first_image / first_row to the project, if any"""
+        if self.project is not None:
+            with self.instruments.span("project_write", faces=len(self.store) - first_row):
+                self.project.write_store(self.store, first_image, first_row, replace)
+    
+    def save_library(self, directory):
+        """Save the face store so it can be reopened (memory-mapped) with load_results"""
+        self.store.save(directory)
+    
+    def load_results(self, path):
+        """Load a saved library directory or a JSON results file in place of the current results.
         
-        labeled_images = {}
+        A library or project brings its encodings, so more images can be
+        added and matched against it; JSON results only serve summaries and
+        labeling. Loading a library or JSON replaces the open project's contents.
+        """
+        if is_project_file(path):
+            return self.open_project(path)
+        self.reset()
+        if os.path.isdir(path):
+            self.store = FaceStore.open(path)
+        else:
+            self.store = FaceStore.from_grouped_faces(load_grouped_faces(path))
+        self._index_stale = True
+        self._write_project(replace=True)
+        return self.grouped_faces
+    
+    def group_shard(self, image_files, shard_index, shard_count, output_dir,
+                    progress_callback=None, cancel_event=None):
+        """Group one shard's slice of image_files and write its partial result.
         
-        for person, faces in self.grouped_faces.items():
-            for face_info in faces:
-                filepath = face_info['filepath']
-                filename = face_info['filename']
-                
-                # Only process each image once
-                if filepath in labeled_images:
-                    continue
-                
-                try:
-                    # Load image
-                    image = face_recognition.load_image_file(filepath)
-                    pil_image = Image.fromarray(image)
-                    draw = ImageDraw.Draw(pil_image)
-                    
-                    # Find all faces in this image
-                    for person_name, person_faces in self.grouped_faces.items():
-                        for face in person_faces:
-                            if face['filepath'] == filepath:
-                                # Draw rectangle and label
-                                top, right, bottom, left = face['location']
-                                draw.rectangle(((left, top), (right, bottom)), outline=(0, 255, 0), width=2)
-                                draw.rectangle(((left, bottom - 20), (right, bottom)), fill=(0, 255, 0))
-                                draw.text((left + 6, bottom - 17), person_name, fill=(255, 255, 255))
-                    
-                    # Save the image
-                    output_path = os.path.join(output_dir, f"labeled_{filename}")
-                    pil_image.save(output_path)
-                    labeled_images[filepath] = output_path
-                except Exception as e:
-                    print(f"Error labeling image {filepath}: {e}")
-        
-        return labeled_images
+        Every node must list the same images in the same order. The partial
+        result goes to a shard directory under output_dir, which
+        merge_shards reads back. Returns that directory.
+        """
+        image_files = shards.shard_slice(image_files, shard_index, shard_count)
+        self.group_faces(image_files, progress_callback, cancel_event)
+        
+        directory = os.path.join(output_dir, shards.shard_name(shard_index, shard_count))
+        settings = {
+            'model': self.detector.model,
+            'upsample': self.detector.upsample,
+            'max_side': self.detector.max_side,
+            'tolerance': self.tolerance,
+            'grouping': self.grouping
+        }
+        shards.write_shard(self.store, directory, shard_index, shard_count, settings)
+        return directory
+    
+    def merge_shards(self, directory):
+        """Replace the current results with the merged shard results found under directory"""
+        self.reset()
+        self.store = shards.merge_shards(directory, self.tolerance, self.index_backend,
+                                         self.index_options)
+        self._index_stale = True
+        self._write_project(replace=True)
+        return self.grouped_faces
+    
+    def _prepare_index(self):
+        """Build the identity prototypes of a loaded store before they are first matched against.
+        
+        Loading only marks them stale, so summaries and labeling of a saved
+        library never pay for replaying its faces. Results loaded without
+        encodings (JSON) have nothing to match against, so new faces would
+        land in unrelated people; they raise ValueError instead.
+        """
+        self.load_store()
+        if not self._index_stale:
+            return
+        if not self.store.has_encodings:
+            raise ValueError("The loaded results have no face encodings to match new faces against; "
+                             "load a face library or project instead, or group all the images again")
+        self._index_stale = False
+        self._rebuild_index()
+    
+    def _rebuild_index(self):
+        """Rebuild the identity prototypes by replaying the stored faces; empty identities stay unmatchable"""
+        centroids = self.store.centroids()
+        vectors = np.zeros((len(self.known_face_names), ENCODING_SIZE), dtype=np.float32)
+        for identity, centroid in centroids.items():
+            vectors[identity] = centroid
+        self.identity_index.add(vectors)
+        identities = self.store.identities
+        assigned = np.flatnonzero(identities >= 0)
+        self.identity_index.observe(identities[assigned], self.store.encodings[assigned])
+        emptied = [i for i in range(len(vectors)) if i not in centroids]
+        if emptied:
+            self.identity_index.remove(emptied)
+    
+    def group_faces(self, image_files, progress_callback=None, cancel_event=None):
+        """Group faces across multiple images.
+        
+        image_files is any iterable of (filename, filepath), such as
+        utils.scanner.iter_image_files, so detection can start while a
+        folder is still being scanned. progress_callback receives progress event dicts; if cancel_event is
+        set, detection stops and the images processed so far are grouped.
+        """
+        self.reset()
+        
+        if self.grouping == "cluster":
+            # Cluster the whole set at once
+            start = self._detect_new_faces(image_files, progress_callback, cancel_event)
+            encodings = self.store.encodings[start:]
+            if len(encodings):
+                self.store.assign(start, self._group_clusters(encodings))
+        else:
+            self._add_new_faces(image_files, progress_callback, cancel_event)
+        
+        self._write_project(replace=True)
+        return self.grouped_faces
+    
+    def add_images(self, image_files, progress_callback=None, cancel_event=None):
+        """Detect and group images that are not grouped yet, keeping existing identities.
+        
+        New faces are matched greedily against the people known so far,
+        whose centroids and exemplars move as faces join them, so the
+        groups depend on the order and batching of the images: adding a
+        folder in several calls can group it differently from one
+        group_faces over the same images. Existing faces keep their people.
+        
+        Images already grouped are skipped; to pick up changes to a file,
+        remove it with remove_images first. Raises ValueError when the
+        current results were loaded from JSON, which has no encodings.
+        """
+        # Fail before detecting anything if there is nothing to match against
+        self._prepare_index()
+        first_image = len(self.store.paths)
+        start = self._add_new_faces(image_files, progress_callback, cancel_event)
+        self._write_project(first_image, start)
+        return self.grouped_faces
+    
+    def _add_new_faces(self, image_files, progress_callback=None, cancel_event=None):
+        """Detect new images and match their faces greedily; returns the first new store row"""
+        start = self._detect_new_faces(image_files, progress_callback, cancel_event)
+        encodings = self.store.encodings[start:]
+        if len(encodings):
+            self.store.assign(start, self._group_greedy(encodings))
+        return start
+    
+    def remove_images(self, image_paths):
+        """Remove images and their faces, dropping identities left without faces"""
+        image_paths = list(image_paths)
+        # An opened project is read first; loading it is what marks its prototypes stale
+        self.load_store()
+        
+        # Take the removed faces out of their identities' prototypes; stale prototypes are rebuilt later anyway
+        touched = []
+        if not self._index_stale:
+            rows = self.store.image_rows(image_paths)
+            identities = self.store.identities[rows]
+            assigned = identities >= 0
+            touched = self.identity_index.forget(identities[assigned], self.store.encodings[rows][assigned])
+        
+        emptied = self.store.remove_images(image_paths)
+        if self.project is not None:
+            self.project.remove_images(image_paths, self.store)
+        
+        if len(touched):
+            # Identities without faces can no longer be matched; the others choose exemplars
+            # again from their remaining faces, as the old ones may have been removed
+            if emptied:
+                self.identity_index.remove(emptied)
+            rows = np.flatnonzero(np.isin(self.store.identities, touched))
+            self.identity_index.reselect(self.store.identities[rows], self.store.encodings[rows])
+        return self.grouped_faces
+    
+    def identity_centroids(self):
+        """Return {name: mean encoding} for every identity that still has faces"""
+        return {self.known_face_names[i]: centroid for i, centroid in self.store.centroids().items()}
+    
+    def _detect_new_faces(self, image_files, progress_callback=None, cancel_event=None):
+        """Detect faces in images not in the store yet; returns the first new store row"""
+        new_files = (entry for entry in image_files if not self.store.has_image(entry[1]))
+        if hasattr(image_files, '__len__'):
+            new_files = list(new_files)
+        
+        # Faces are appended as unassigned rows; only processed images are added,
+        # so a cancelled run can be resumed
+        start = len(self.store)
+        detections = self._iter_detections(new_files, progress_callback, cancel_event)
+        originals = self.duplicates.originals if self.duplicates is not None else {}
+        for filename, filepath, locations, encodings in detections:
+            self.store.add_image(filepath, filename, locations, encodings,
+                                 duplicate_of=originals.get(filepath))
+        return start
+    
+    def _group_greedy(self, encodings):
+        """Assign faces in order, matching a whole batch of encodings per call"""
+        self._prepare_index()
+        self.identity_index.match_radius = self.tolerance
+        identities = np.empty(len(encodings), dtype=np.int64)
+        for start in range(0, len(encodings), self.match_batch_size):
+            batch = encodings[start:start + self.match_batch_size]
+            with self.instruments.span("match", faces=len(batch)):
+                assigned, is_new = match_encodings(self.identity_index, batch, self.tolerance)
+                self.identity_index.observe(assigned, batch)
+            
+            for identity, new in zip(assigned, is_new):
+                if new:
+                    # This is a new face
+                    self.known_face_names.append(f"Person_{len(self.known_face_names) + 1}")
+            identities[start:start + len(batch)] = assigned
+        
+        # Report how closely an approximate index tracks exact search
+        if self.index_backend != "exact":
+            sample = encodings[np.linspace(0, len(encodings) - 1, min(len(encodings), 512)).astype(int)]
+            self.index_recall = measure_recall(self.identity_index.index, sample, self.tolerance)
+            print(f"Identity index '{self.index_backend}' recall vs exact: {self.index_recall}")
+        return identities
+    
+    def _group_clusters(self, encodings):
+        """Cluster all encodings at once over a tolerance-radius neighbour graph"""
+        with self.instruments.span("cluster", faces=len(encodings)):
+            labels = cluster_encodings(encodings, self.tolerance, method=self.cluster_method,
+                                       block_size=self.cluster_block_size, **self.cluster_options)
+        
+        # Clusters are numbered by their first face, so names follow input order
+        cluster_count = int(labels.max()) + 1
+        self.known_face_names.extend(f"Person_{i + 1}" for i in range(cluster_count))
+        
+        # Index each cluster by its centroid and exemplars so later lookups can match it
+        sums = np.zeros((cluster_count, encodings.shape[1]), dtype=np.float64)
+        np.add.at(sums, labels, encodings)
+        centroids = sums / np.bincount(labels, minlength=cluster_count)[:, None]
+        self.identity_index.add(centroids.astype(np.float32))
+        self.identity_index.observe(labels, encodings)
+        return labels
+    
+    def label_faces(self, output_dir, workers=None, output_format=None, quality=90,
+                    progress_callback=None, cancel_event=None):
+        """Save labeled images to output directory"""
+        # Index faces by image once, then draw and save images in parallel
+        if self._store is None:
+            faces_by_path = self.project.faces_by_path()
+        else:
+            faces_by_path = self.store.faces_by_path()
+        return label_images(faces_by_path, output_dir, workers=workers,
+                            output_format=output_format, quality=quality,
+                            progress_callback=progress_callback, cancel_event=cancel_event,
+                            instruments=self.instruments)
     
     def get_summary(self):
         """Return a summary of the face grouping"""
+        if self._store is None:
+            return self.project.summary()
         summary = {
             'total_people': len(self.grouped_faces),
+            'duplicate_images': self.store.duplicate_count,
             'people': []
         }
         
+        # Faces in duplicate images are listed, but unique_count leaves them out
+        unique_counts = self.store.unique_face_counts()
+        identity_ids = {name: i for i, name in enumerate(self.known_face_names)}
         for person, faces in self.grouped_faces.items():
             person_info = {
                 'name': person,
                 'count': len(faces),
+                'unique_count': int(unique_counts[identity_ids[person]]),
                 'images': [face['filename'] for face in faces]
             }
             summary['people'].append(person_info)
@@ -0,0 +1,334 @@
+import os
+import io
+import sys
+import json
+import time
+import bisect
+import cProfile
+import pstats
+import threading
+from collections import Counter, deque
+from contextlib import contextmanager
+
+# Upper bounds (seconds) of the latency histogram buckets; one more bucket catches the rest
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+@contextmanager
+def timed(spans, name, **args):
+    """Append a (name, start, duration, pid, tid, args) span to a list around a block.
+
+    Does nothing when ``spans`` is None. Worker processes use this to
+    collect spans that are shipped back and merged with Instrumentation.extend.
+    """
+    if spans is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        spans.append((name, start, time.perf_counter() - start,
+                      os.getpid(), threading.get_ident(), args))
+
+
+class Histogram:
+    """Fixed-bucket latency histogram with exact count, total, min and max"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS):
+        self.bounds = bounds
+        self.buckets = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value):
+        self.buckets[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    def percentile(self, q):
+        """Approximate the q-th percentile by the upper bound of its bucket"""
+        if not self.count:
+            return None
+        rank = q / 100 * self.count
+        seen = 0
+        for i, n in enumerate(self.buckets):
+            seen += n
+            if seen >= rank and n:
+                return min(self.bounds[i], self.max) if i < len(self.bounds) else self.max
+        return self.max
+
+    def to_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.total / self.count if self.count else None,
+            'min': self.min,
+            'max': self.max,
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+            'buckets': {
+                (f"<={bound}" if i < len(self.bounds) else f">{self.bounds[-1]}"): n
+                for i, (bound, n) in enumerate(zip(self.bounds + (None,), self.buckets)) if n
+            }
+        }
+
+
+class Instrumentation:
+    """Collects timing spans, counters and latency histograms for one run.
+
+    Spans feed a histogram per name (so the "image" span gives per-image
+    latency) and are also kept, up to ``max_spans``, for Chrome trace
+    export. It is safe to record from several threads. When disabled,
+    spans and counters cost next to nothing and nothing is recorded.
+    """
+
+    def __init__(self, enabled=True, max_spans=100000, max_errors=100):
+        self.enabled = enabled
+        self.max_spans = max_spans
+        self.max_errors = max_errors
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        """Drop everything recorded so far and restart the clock"""
+        with self._lock:
+            self.spans = []
+            self.dropped_spans = 0
+            self.counters = Counter()
+            self.histograms = {}
+            self.windows = {}  # span name -> [first start, last end, {(pid, tid)}]
+            self.errors = deque(maxlen=self.max_errors)
+            self.started = time.perf_counter()
+
+    @contextmanager
+    def span(self, name, **args):
+        """Time a block as a span called name"""
+        if not self.enabled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_span(name, start, time.perf_counter() - start, args=args)
+
+    def add_span(self, name, start, duration, pid=None, tid=None, args=None):
+        """Record a finished span; start is a time.perf_counter() value"""
+        if not self.enabled:
+            return
+        pid, tid = pid or os.getpid(), tid or threading.get_ident()
+        with self._lock:
+            if len(self.spans) < self.max_spans:
+                self.spans.append((name, start, duration, pid, tid, args or {}))
+            else:
+                self.dropped_spans += 1
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+                self.windows[name] = [start, start + duration, set()]
+            histogram.observe(duration)
+            window = self.windows[name]
+            window[0] = min(window[0], start)
+            window[1] = max(window[1], start + duration)
+            window[2].add((pid, tid))
+
+    def extend(self, spans):
+        """Merge spans collected with timed(), e.g. in a worker process"""
+        for name, start, duration, pid, tid, args in spans:
+            self.add_span(name, start, duration, pid, tid, args)
+
+    def count(self, name, n=1):
+        """Add n to a counter"""
+        if self.enabled and n:
+            with self._lock:
+                self.counters[name] += n
+
+    def error(self, source, message):
+        """Count an error and keep its message among the most recent ones"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters['errors'] += 1
+            self.errors.append({'source': source, 'message': str(message)})
+
+    def utilization(self):
+        """Return how busy the threads running each stage were.
+
+        For every span name: the number of threads (across processes) that
+        recorded it, the total time spent in it, the window from its first
+        start to its last end, and busy time / (threads * window). A low
+        value for "decode" means the decode threads were starved by the disk
+        or idle; a large "prefetch_wait" total means the detector waited on
+        them.
+        """
+        with self._lock:
+            stages = {}
+            for name, (first, last, threads) in self.windows.items():
+                busy = self.histograms[name].total
+                window = last - first
+                stages[name] = {
+                    'threads': len(threads),
+                    'busy': busy,
+                    'window': window,
+                    'utilization': busy / (len(threads) * window) if window > 0 else None
+                }
+            return stages
+
+    def summary(self):
+        """Return counters, per-stage latency statistics and utilization, and recent errors as a dict"""
+        utilization = self.utilization()
+        with self._lock:
+            return {
+                'elapsed': time.perf_counter() - self.started,
+                'counters': dict(self.counters),
+                'stages': {name: h.to_dict() for name, h in sorted(self.histograms.items())},
+                'utilization': utilization,
+                'errors': list(self.errors),
+                'dropped_spans': self.dropped_spans
+            }
+
+    def chrome_trace(self):
+        """Return the spans and counters in Chrome trace event format (chrome://tracing, Perfetto)"""
+        with self._lock:
+            events = [
+                {'name': name, 'cat': 'face-grouper', 'ph': 'X',
+                 'ts': (start - self.started) * 1e6, 'dur': duration * 1e6,
+                 'pid': pid, 'tid': tid, 'args': args}
+                for name, start, duration, pid, tid, args in self.spans
+            ]
+            end = (time.perf_counter() - self.started) * 1e6
+            events.extend(
+                {'name': name, 'ph': 'C', 'ts': end, 'pid': os.getpid(), 'args': {name: value}}
+                for name, value in self.counters.items()
+            )
+        return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+    def save_json(self, path):
+        """Write summary() to a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=2)
+
+    def save_chrome_trace(self, path):
+        """Write chrome_trace() to a JSON file"""
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.chrome_trace(), f)
+
+    def report(self):
+        """Return a short text table of stage timings and counters"""
+        summary = self.summary()
+        lines = [f"{'stage':<14}{'count':>8}{'total s':>10}{'mean ms':>10}{'p95 ms':>10}"
+                 f"{'threads':>9}{'util %':>8}"]
+        for name, stats in summary['stages'].items():
+            usage = summary['utilization'][name]
+            busy = f"{usage['utilization'] * 100:.0f}" if usage['utilization'] is not None else "-"
+            lines.append(f"{name:<14}{stats['count']:>8}{stats['total']:>10.2f}"
+                         f"{stats['mean'] * 1000:>10.1f}{stats['p95'] * 1000:>10.1f}"
+                         f"{usage['threads']:>9}{busy:>8}")
+        for name, value in sorted(summary['counters'].items()):
+            lines.append(f"{name}: {value}")
+        return "\n".join(lines)
+
+
+class CProfileProfiler:
+    """Deterministic profiler; only sees the thread that started it"""
+
+    def __init__(self):
+        self.profiler = cProfile.Profile()
+
+    def start(self):
+        self.profiler.enable()
+
+    def stop(self):
+        self.profiler.disable()
+
+    def save(self, path):
+        """Write pstats data, readable with pstats or snakeviz"""
+        self.profiler.dump_stats(path)
+
+    def report(self, limit=25):
+        out = io.StringIO()
+        pstats.Stats(self.profiler, stream=out).sort_stats("cumulative").print_stats(limit)
+        return out.getvalue()
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of every thread each ``interval`` seconds.
+
+    Overhead stays low and background threads (labeling, thumbnail loading)
+    are included, unlike cProfile. Stacks are saved in the folded format
+    used by flamegraph.pl and speedscope.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def save(self, path):
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+    def report(self, limit=25):
+        """Functions ranked by the share of samples they were running in (self time)"""
+        leaves = Counter()
+        for stack, count in self.samples.items():
+            leaves[stack.rsplit(";", 1)[-1]] += count
+        total = sum(leaves.values()) or 1
+        return "\n".join(f"{100 * count / total:6.1f}%  {name}"
+                         for name, count in leaves.most_common(limit))
+
+
+PROFILERS = {
+    "cprofile": CProfileProfiler,
+    "sampling": SamplingProfiler,
+}
+
+
+@contextmanager
+def profile(kind="cprofile", output=None, **options):
+    """Profile a block with one of PROFILERS, saving the result to output if given.
+
+    Detection running in worker processes is not visible to either
+    profiler; use a single worker to profile it.
+    """
+    if kind not in PROFILERS:
+        raise ValueError(f"Unknown profiler '{kind}', expected one of {sorted(PROFILERS)}")
+    profiler = PROFILERS[kind](**options)
+    profiler.start()
+    try:
+        yield profiler
+    finally:
+        profiler.stop()
+        if output:
+            profiler.save(output)
@@ -0,0 +1,121 @@
+import os
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from PIL import Image, ImageDraw, ImageOps
+from grouper.progress import ProgressTracker, is_cancelled
+from grouper.instrumentation import Instrumentation
+
+# Stand-in used when the caller does not collect instrumentation
+NULL_INSTRUMENTS = Instrumentation(enabled=False)
+
+# Output formats supported for labeled images: PIL format name and file extension
+OUTPUT_FORMATS = {
+    "jpeg": ("JPEG", ".jpg"),
+    "png": ("PNG", ".png"),
+    "webp": ("WEBP", ".webp"),
+}
+
+
+def build_label_index(grouped_faces):
+    """Index grouped faces by image in one pass: {filepath: (filename, [(name, location)])}"""
+    faces_by_path = {}
+    for person_name, faces in grouped_faces.items():
+        for face in faces:
+            entry = faces_by_path.get(face['filepath'])
+            if entry is None:
+                entry = faces_by_path[face['filepath']] = (face['filename'], [])
+            entry[1].append((person_name, face['location']))
+    return faces_by_path
+
+
+def output_name(filename, output_format=None):
+    """Return the labeled file name for a source file name (relative paths keep their folders)"""
+    folder, name = os.path.split(filename)
+    if output_format is not None:
+        name = os.path.splitext(name)[0] + OUTPUT_FORMATS[output_format][1]
+    return os.path.join(folder, f"labeled_{name}")
+
+
+def draw_labels(image, faces):
+    """Draw a box and name tag for each (name, location) on a PIL image"""
+    draw = ImageDraw.Draw(image)
+    for person_name, (top, right, bottom, left) in faces:
+        draw.rectangle(((left, top), (right, bottom)), outline=(0, 255, 0), width=2)
+        draw.rectangle(((left, bottom - 20), (right, bottom)), fill=(0, 255, 0))
+        draw.text((left + 6, bottom - 17), person_name, fill=(255, 255, 255))
+    return image
+
+
+def label_image(filepath, faces, output_path, output_format=None, quality=90, instruments=None):
+    """Decode one image, draw its labels and save it"""
+    instruments = instruments or NULL_INSTRUMENTS
+    with instruments.span("label_image", path=filepath):
+        with instruments.span("label_decode"):
+            with Image.open(filepath) as source:
+                # Face locations are in the upright (EXIF-rotated) frame the detector saw
+                image = ImageOps.exif_transpose(source).convert("RGB")
+        with instruments.span("draw", faces=len(faces)):
+            draw_labels(image, faces)
+        os.makedirs(os.path.dirname(output_path), exist_ok=True)
+
+        with instruments.span("save"):
+            if output_format is None:
+                image.save(output_path)
+            else:
+                pil_format = OUTPUT_FORMATS[output_format][0]
+                options = {} if pil_format == "PNG" else {"quality": quality}
+                image.save(output_path, format=pil_format, **options)
+    return output_path
+
+
+def label_images(faces_by_path, output_dir, workers=None, output_format=None, quality=90,
+                 max_in_flight=None, progress_callback=None, cancel_event=None, instruments=None):
+    """Write labeled copies of every indexed image using a thread pool.
+
+    At most ``max_in_flight`` images are decoded or being encoded at once,
+    which bounds memory regardless of how many images there are. Setting
+    ``cancel_event`` stops submitting new images. Spans and counters go to
+    the optional ``instruments``. Returns {filepath: output_path} for the
+    images that were written.
+    """
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        raise ValueError(f"Unknown output format '{output_format}', "
+                         f"expected one of {sorted(OUTPUT_FORMATS)}")
+    os.makedirs(output_dir, exist_ok=True)
+
+    instruments = instruments or NULL_INSTRUMENTS
+    workers = workers or min(32, (os.cpu_count() or 1) + 4)
+    max_in_flight = max_in_flight or 2 * workers
+    labeled_images = {}
+    progress = ProgressTracker("label", len(faces_by_path), progress_callback)
+
+    def collect(done):
+        for future in done:
+            filepath = pending.pop(future)
+            try:
+                labeled_images[filepath] = future.result()
+                instruments.count('labeled_images')
+            except Exception as e:
+                print(f"Error labeling image {filepath}: {e}")
+                instruments.error(filepath, e)
+            progress.update(faces=len(faces_by_path[filepath][1]))
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for filepath, (filename, faces) in faces_by_path.items():
+            if is_cancelled(cancel_event):
+                print(f"Cancelled after labeling {len(labeled_images)} images")
+                break
+
+            # Wait for a slot before submitting more work
+            if len(pending) >= max_in_flight:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(done)
+
+            output_path = os.path.join(output_dir, output_name(filename, output_format))
+            future = executor.submit(label_image, filepath, faces, output_path,
+                                     output_format, quality, instruments)
+            pending[future] = filepath
+
+        collect(list(pending))
+
+    return labeled_images
@@ -0,0 +1,133 @@
+import numpy as np
+from grouper.detection import ENCODING_SIZE
+
+
+def squared_distances(queries, rows, row_sq_norms=None):
+    """Return the (Q, K) squared euclidean distances between two float32 matrices"""
+    if row_sq_norms is None:
+        row_sq_norms = np.einsum("ij,ij->i", rows, rows)
+
+    # |q - r|^2 = |q|^2 + |r|^2 - 2 q.r, with the cross term done as one BLAS call
+    sq = np.einsum("ij,ij->i", queries, queries)[:, None] + row_sq_norms[None, :]
+    sq -= 2.0 * (queries @ rows.T)
+    return np.maximum(sq, 0.0, out=sq)
+
+
+class EncodingMatrix:
+    """Preallocated, growable float32 matrix of known face encodings"""
+
+    def __init__(self, dim=ENCODING_SIZE, capacity=1024):
+        self.dim = dim
+        self.size = 0
+        self._data = np.empty((max(1, capacity), dim), dtype=np.float32)
+        self._sq_norms = np.empty(max(1, capacity), dtype=np.float32)
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        return iter(self.matrix)
+
+    def __getitem__(self, index):
+        return self.matrix[index]
+
+    @property
+    def matrix(self):
+        """View of the rows in use"""
+        return self._data[:self.size]
+
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self._data):
+            return
+        # Grow geometrically so appends stay amortized O(1)
+        capacity = max(needed, 2 * len(self._data))
+        data = np.empty((capacity, self.dim), dtype=np.float32)
+        sq_norms = np.empty(capacity, dtype=np.float32)
+        data[:self.size] = self._data[:self.size]
+        sq_norms[:self.size] = self._sq_norms[:self.size]
+        self._data, self._sq_norms = data, sq_norms
+
+    def append(self, encoding):
+        """Add one encoding and return its row index"""
+        return self.extend(np.asarray(encoding).reshape(1, self.dim))[0]
+
+    def extend(self, encodings):
+        """Add several encodings and return their row indices"""
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        self._reserve(len(encodings))
+        start, end = self.size, self.size + len(encodings)
+        self._data[start:end] = encodings
+        self._sq_norms[start:end] = np.einsum("ij,ij->i", encodings, encodings)
+        self.size = end
+        return np.arange(start, end)
+
+    def set(self, rows, encodings):
+        """Overwrite existing rows in place"""
+        rows = np.asarray(rows, dtype=np.int64)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        self._data[rows] = encodings
+        self._sq_norms[rows] = np.einsum("ij,ij->i", encodings, encodings)
+
+    def distances(self, queries, start=0):
+        """Return the (Q, K) euclidean distance matrix between queries and rows[start:]"""
+        queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+        rows = self._data[start:self.size]
+        if len(rows) == 0:
+            return np.empty((len(queries), 0), dtype=np.float32)
+
+        sq = squared_distances(queries, rows, self._sq_norms[start:self.size])
+        return np.sqrt(sq, out=sq)
+
+    def nearest(self, queries, start=0, exclude=None):
+        """Return (indices, distances) of the nearest row for each query, -1 when empty.
+
+        Rows listed in ``exclude`` (absolute indices) are never returned.
+        """
+        dist = self.distances(queries, start)
+        if exclude is not None and len(exclude):
+            dist[:, np.asarray(exclude) - start] = np.inf
+        if dist.shape[1] == 0:
+            return (np.full(len(dist), -1, dtype=np.int64),
+                    np.full(len(dist), np.inf, dtype=np.float32))
+        indices = np.argmin(dist, axis=1)
+        best = dist[np.arange(len(dist)), indices]
+        return np.where(np.isinf(best), -1, indices + start), best
+
+
+def match_encodings(index, encodings, tolerance):
+    """Assign each encoding to its nearest identity within tolerance.
+
+    ``index`` is an identity index (see grouper.identity_index). Encodings
+    that match nothing are added to it as new identities, and later
+    encodings in the same batch can match them. Returns the identity id for
+    every encoding and a boolean array marking the newly added ones.
+    """
+    encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, ENCODING_SIZE)
+    assigned = np.empty(len(encodings), dtype=np.int64)
+    is_new = np.zeros(len(encodings), dtype=bool)
+
+    # Match the whole batch against the existing identities in one call
+    indices, distances = index.search(encodings)
+
+    # Identities created within this batch are checked one query at a time
+    batch_new = EncodingMatrix(capacity=64)
+    batch_new_ids = []
+
+    for i, encoding in enumerate(encodings):
+        best, best_dist = indices[i], distances[i]
+
+        if len(batch_new):
+            new_idx, new_dist = batch_new.nearest(encoding)
+            if new_dist[0] < best_dist:
+                best, best_dist = batch_new_ids[new_idx[0]], new_dist[0]
+
+        if best >= 0 and best_dist <= tolerance:
+            assigned[i] = best
+        else:
+            assigned[i] = index.add(encoding)[0]
+            is_new[i] = True
+            batch_new.append(encoding)
+            batch_new_ids.append(assigned[i])
+
+    return assigned, is_new
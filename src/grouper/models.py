@@ -0,0 +1,59 @@
+import threading
+
+
+class ModelHolder:
+    """Loads face_recognition, and with it dlib and its models, once per process.
+
+    Importing face_recognition builds the face detector, shape predictor
+    and recognition network, which takes a second or more. Nothing loads
+    until get() is first called; warm() does it on a background thread so
+    it can start right after the window is shown.
+    """
+
+    def __init__(self):
+        self._module = None
+        self.error = None  # Exception from the last failed warm(), if any
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def loaded(self):
+        return self._module is not None
+
+    def get(self):
+        """Return the face_recognition module, loading it on first use"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    import face_recognition
+                    self._module = face_recognition
+        return self._module
+
+    def warm(self, on_ready=None, on_error=None):
+        """Start loading on a daemon thread; callbacks run on that thread when it finishes"""
+        if self._module is not None or (self._thread is not None and self._thread.is_alive()):
+            return
+
+        def load():
+            try:
+                self.get()
+            except Exception as e:
+                self.error = e
+                print(f"Could not load face recognition models: {e}")
+                if on_error:
+                    on_error(e)
+                return
+            if on_ready:
+                on_ready()
+
+        self._thread = threading.Thread(target=load, name="model-loader", daemon=True)
+        self._thread.start()
+
+
+# Shared by every thread in this process; each worker process gets its own
+MODELS = ModelHolder()
+
+
+def init_worker():
+    """Process pool initializer: load the models once per worker, before its first task"""
+    MODELS.get()
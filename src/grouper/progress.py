@@ -0,0 +1,55 @@
+import time
+
+
+def is_cancelled(cancel_event):
+    """Return True when an optional cancel event has been set"""
+    return cancel_event is not None and cancel_event.is_set()
+
+
+class ProgressTracker:
+    """Counts work done in one stage and reports it to an optional callback.
+
+    Events are plain dicts with the stage name, images done/total, faces
+    found, elapsed seconds, throughput (images per second) and an ETA in
+    seconds. ``total`` may be None when the amount of work is not known up
+    front (e.g. while a folder is still being scanned). Events are throttled
+    to one per ``interval`` seconds, except the first and last, which are
+    always sent.
+    """
+
+    def __init__(self, stage, total, callback=None, interval=0.2):
+        self.stage = stage
+        self.total = total
+        self.callback = callback
+        self.interval = interval
+        self.done = 0
+        self.faces = 0
+        self.started = time.perf_counter()
+        self._last_emit = None
+
+    def event(self):
+        """Return the current progress as an event dict"""
+        elapsed = time.perf_counter() - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = self.total - self.done if self.total is not None else None
+        return {
+            'stage': self.stage,
+            'done': self.done,
+            'total': self.total,
+            'faces': self.faces,
+            'elapsed': elapsed,
+            'rate': rate,
+            'eta': remaining / rate if rate > 0 and remaining is not None else None
+        }
+
+    def update(self, done=1, faces=0):
+        """Record finished work and emit an event if one is due"""
+        self.done += done
+        self.faces += faces
+        if self.callback is None:
+            return
+        now = time.perf_counter()
+        finished = self.total is not None and self.done >= self.total
+        if self._last_emit is None or finished or now - self._last_emit >= self.interval:
+            self._last_emit = now
+            self.callback(self.event())
@@ -0,0 +1,347 @@
+import os
+import hashlib
+import sqlite3
+import threading
+import numpy as np
+from collections.abc import Mapping, Sequence
+from grouper.cache import default_cache_dir
+from grouper.detection import ENCODING_SIZE
+from grouper.face_store import FaceStore
+
+# Bumped when the database schema changes
+PROJECT_VERSION = 1
+
+SQLITE_HEADER = b"SQLite format 3\x00"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE,
+    filename TEXT NOT NULL,
+    duplicate_of INTEGER
+);
+CREATE TABLE IF NOT EXISTS identities (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    face_count INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS faces (
+    id INTEGER PRIMARY KEY,
+    image_id INTEGER NOT NULL,
+    identity_id INTEGER NOT NULL,
+    box_top INTEGER NOT NULL,
+    box_right INTEGER NOT NULL,
+    box_bottom INTEGER NOT NULL,
+    box_left INTEGER NOT NULL,
+    encoding BLOB
+);
+CREATE INDEX IF NOT EXISTS faces_by_identity ON faces (identity_id, id);
+CREATE INDEX IF NOT EXISTS faces_by_image ON faces (image_id, id);
+"""
+
+FACE_QUERY = """
+SELECT images.filename, images.path, box_top, box_right, box_bottom, box_left
+FROM faces JOIN images ON images.id = faces.image_id
+"""
+
+
+def default_project_path(folder):
+    """Return the per-user project database used by the app for an image folder"""
+    key = hashlib.sha1(os.path.abspath(folder).encode("utf-8")).hexdigest()[:16]
+    return os.path.join(os.path.dirname(default_cache_dir()), "projects", f"{key}.sqlite")
+
+
+def is_project_file(path):
+    """Check whether a path is an SQLite database, i.e. a project rather than JSON results"""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(SQLITE_HEADER)) == SQLITE_HEADER
+    except OSError:
+        return False
+
+
+def _face_dict(row):
+    filename, filepath, top, right, bottom, left = row
+    return {'filename': filename, 'filepath': filepath, 'location': (top, right, bottom, left)}
+
+
+class ProjectDatabase:
+    """SQLite file holding a project's images, faces, identities and encodings.
+
+    Image and identity ids are the FaceStore's path and identity ids, and
+    faces are numbered in store order, so a person's faces come back in
+    the order they were grouped. Faces are indexed by identity and by
+    image, which makes browsing a person or an image an indexed lookup
+    rather than a walk over every face. Writes go in one transaction per
+    call; the connection may be shared between the Tk and worker threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        with self.conn:
+            self.conn.executescript(SCHEMA)
+            version = self._meta('version')
+            if version is None:
+                self._set_meta('version', PROJECT_VERSION)
+            elif int(version) != PROJECT_VERSION:
+                raise ValueError(f"Unsupported project version in {path}: {version}")
+
+    def close(self):
+        with self._lock:
+            self.conn.close()
+
+    def _meta(self, key):
+        row = self.conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_meta(self, key, value):
+        self.conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def _scalar(self, query, params=()):
+        with self._lock:
+            return self.conn.execute(query, params).fetchone()[0]
+
+    @property
+    def image_count(self):
+        return self._scalar("SELECT COUNT(*) FROM images")
+
+    @property
+    def face_count(self):
+        return self._scalar("SELECT COUNT(*) FROM faces")
+
+    @property
+    def duplicate_count(self):
+        return self._scalar("SELECT COUNT(*) FROM images WHERE duplicate_of IS NOT NULL")
+
+    @property
+    def people_count(self):
+        return self._scalar("SELECT COUNT(*) FROM identities WHERE face_count > 0")
+
+    # Writing
+
+    def write_store(self, store, first_image=0, first_row=0, replace=False):
+        """Write the store's images from path id first_image and faces from row first_row on.
+
+        With replace, everything already in the database is dropped first,
+        in the same transaction. Identity names and face counts are always
+        rewritten in full.
+        """
+        images = [
+            (path_id, filepath, filename, original if original >= 0 else None)
+            for path_id, filepath, filename, original in store.images(first_image)
+        ]
+        rows = range(first_row, len(store))
+        boxes = store.locations[first_row:].tolist()
+        faces = (
+            (int(path_id), int(identity), *box, encoding.tobytes())
+            for path_id, identity, box, encoding
+            in zip(store.path_ids[first_row:], store.identities[first_row:], boxes,
+                   np.ascontiguousarray(store.encodings[first_row:]))
+        )
+        with self._lock, self.conn:
+            if replace:
+                self.conn.execute("DELETE FROM faces")
+                self.conn.execute("DELETE FROM images")
+                self.conn.execute("DELETE FROM identities")
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO images (id, path, filename, duplicate_of) VALUES (?, ?, ?, ?)",
+                images)
+            self.conn.executemany(
+                "INSERT INTO faces (image_id, identity_id, box_top, box_right, box_bottom, box_left, encoding) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)", faces)
+            self._write_identities(store)
+            self._set_meta('has_encodings', int(store.has_encodings))
+        print(f"Saved {len(images)} images and {len(rows)} faces to project {self.path}")
+
+    def _write_identities(self, store):
+        counts = np.bincount(store.identities[store.identities >= 0], minlength=len(store.names))
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO identities (id, name, face_count) VALUES (?, ?, ?)",
+            ((i, name, int(count)) for i, (name, count) in enumerate(zip(store.names, counts))))
+
+    def remove_images(self, filepaths, store):
+        """Delete images and their faces, then refresh the identity counts from the store"""
+        params = [(filepath,) for filepath in filepaths]
+        with self._lock, self.conn:
+            self.conn.executemany(
+                "DELETE FROM faces WHERE image_id = (SELECT id FROM images WHERE path = ?)", params)
+            self.conn.executemany("DELETE FROM images WHERE path = ?", params)
+            self._write_identities(store)
+
+    # Reading
+
+    def people(self, offset=0, limit=-1):
+        """Return a page of [(identity id, name, face count)] for identities with faces, by id"""
+        with self._lock:
+            return self.conn.execute(
+                "SELECT id, name, face_count FROM identities WHERE face_count > 0 "
+                "ORDER BY id LIMIT ? OFFSET ?", (limit, offset)).fetchall()
+
+    def person_faces(self, identity, offset=0, limit=-1):
+        """Return a page of one identity's face dicts, in grouping order"""
+        with self._lock:
+            rows = self.conn.execute(
+                FACE_QUERY + "WHERE faces.identity_id = ? ORDER BY faces.id LIMIT ? OFFSET ?",
+                (int(identity), limit, offset)).fetchall()
+        return [_face_dict(row) for row in rows]
+
+    def image_faces(self, filepath):
+        """Return [(name, location)] for the faces found in one image"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT identities.name, box_top, box_right, box_bottom, box_left "
+                "FROM images JOIN faces ON faces.image_id = images.id "
+                "JOIN identities ON identities.id = faces.identity_id "
+                "WHERE images.path = ? ORDER BY faces.id", (filepath,)).fetchall()
+        return [(name, tuple(box)) for name, *box in rows]
+
+    def faces_by_path(self):
+        """Group faces by image: {filepath: (filename, [(name, location)])}, as FaceStore does"""
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT images.path, images.filename, identities.name, "
+                "box_top, box_right, box_bottom, box_left "
+                "FROM faces JOIN images ON images.id = faces.image_id "
+                "JOIN identities ON identities.id = faces.identity_id "
+                "ORDER BY faces.image_id, faces.id").fetchall()
+        faces_by_path = {}
+        for filepath, filename, name, *box in rows:
+            entry = faces_by_path.get(filepath)
+            if entry is None:
+                entry = faces_by_path[filepath] = (filename, [])
+            entry[1].append((name, tuple(box)))
+        return faces_by_path
+
+    def summary(self):
+        """Return the same summary as FaceGrouper.get_summary, straight from the database"""
+        people = {
+            identity: {'name': name, 'count': count, 'unique_count': 0, 'images': []}
+            for identity, name, count in self.people()
+        }
+        with self._lock:
+            rows = self.conn.execute(
+                "SELECT faces.identity_id, images.filename, images.duplicate_of IS NULL "
+                "FROM faces JOIN images ON images.id = faces.image_id "
+                "WHERE faces.identity_id >= 0 ORDER BY faces.identity_id, faces.id").fetchall()
+        for identity, filename, unique in rows:
+            person = people[identity]
+            person['images'].append(filename)
+            person['unique_count'] += unique
+        return {
+            'total_people': len(people),
+            'duplicate_images': self.duplicate_count,
+            'people': list(people.values())
+        }
+
+    def view(self):
+        """Return a read-only {name: [face dict]} mapping that pages faces in from the database"""
+        return ProjectGroupsView(self)
+
+    def load_store(self, batch_size=65536):
+        """Read the whole project back into a FaceStore, e.g. to match more images against it"""
+        with self._lock:
+            has_encodings = self._meta('has_encodings') != "0"
+            images = self.conn.execute(
+                "SELECT id, path, filename, duplicate_of FROM images ORDER BY id").fetchall()
+            names = [name for name, in self.conn.execute("SELECT name FROM identities ORDER BY id")]
+            face_count = self.conn.execute("SELECT COUNT(*) FROM faces").fetchone()[0]
+
+            store = FaceStore(capacity=face_count)
+            path_count = images[-1][0] + 1 if images else 0
+            store.paths = [None] * path_count  # Ids of removed images stay unused
+            store.filenames = [None] * path_count
+            store.duplicate_of = [-1] * path_count
+            for path_id, filepath, filename, original in images:
+                store.paths[path_id] = filepath
+                store.filenames[path_id] = filename
+                store.duplicate_of[path_id] = -1 if original is None else original
+                store._path_ids[filepath] = path_id
+            store.names = names
+            store.has_encodings = has_encodings
+
+            # Read the faces in batches straight into the columns
+            cursor = self.conn.execute(
+                "SELECT image_id, identity_id, box_top, box_right, box_bottom, box_left, encoding "
+                "FROM faces ORDER BY id")
+            identities = np.empty(face_count, dtype=np.int32)
+            while True:
+                batch = cursor.fetchmany(batch_size)
+                if not batch:
+                    break
+                start, end = store.size, store.size + len(batch)
+                columns = list(zip(*batch))
+                store.columns['path_ids'][start:end] = columns[0]
+                identities[start:end] = columns[1]
+                store.columns['locations'][start:end] = np.array(columns[2:6], dtype=np.int32).T
+                store.columns['encodings'][start:end] = np.frombuffer(
+                    b"".join(columns[6]), dtype=np.float32).reshape(-1, ENCODING_SIZE)
+                store.size = end
+        store.assign(0, identities[:store.size])
+        return store
+
+
+class ProjectFaceList(Sequence):
+    """One person's faces, fetched a page at a time; slices become LIMIT/OFFSET queries"""
+
+    def __init__(self, db, identity, count):
+        self.db = db
+        self.identity = identity
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(self.count)
+            faces = self.db.person_faces(self.identity, start, max(0, stop - start))
+            return faces[::step] if step != 1 else faces
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError(index)
+        return self.db.person_faces(self.identity, index, 1)[0]
+
+
+class ProjectGroupsView(Mapping):
+    """Read-only {name: ProjectFaceList} view of a project, shaped like the old grouped_faces dict.
+
+    The list of people (names and counts) is read once; faces are only
+    queried when a list is indexed or sliced.
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._people = None
+
+    def _load(self):
+        if self._people is None:
+            self._people = {name: (identity, count) for identity, name, count in self.db.people()}
+        return self._people
+
+    def __getitem__(self, name):
+        identity, count = self._load()[name]
+        return ProjectFaceList(self.db, identity, count)
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def items(self):
+        return [(name, ProjectFaceList(self.db, identity, count))
+                for name, (identity, count) in self._load().items()]
+
+    def values(self):
+        return [faces for _, faces in self.items()]
@@ -0,0 +1,219 @@
+import numpy as np
+from grouper.detection import ENCODING_SIZE
+from grouper.identity_index import create_index
+from grouper.matching import squared_distances
+
+
+class IdentityPrototypes:
+    """Identity index that matches against a bounded set of prototypes per identity.
+
+    Each identity keeps a running centroid of the faces assigned to it
+    plus up to ``max_exemplars`` of those faces, chosen to be far from the
+    centroid and from each other so they cover different poses and
+    lighting. Centroids live in ``index`` (one row per identity, so rows
+    are identity ids) and exemplars in ``exemplar_index``, both index
+    backends (see grouper.identity_index). A query within ``match_radius``
+    of its nearest centroid takes that identity; only the others are also
+    compared with the exemplars, so a batch costs about one centroid
+    search however many exemplars are kept.
+
+    It has the same add/search/remove interface as the backends, with ids
+    being identity ids; observe() updates the prototypes as faces are
+    assigned, and forget() and reselect() as faces are removed.
+    """
+
+    def __init__(self, index, max_exemplars=4, min_spacing=0.35, dim=ENCODING_SIZE,
+                 exemplar_index=None, match_radius=0.6):
+        self.index = index
+        self.exemplar_index = exemplar_index if exemplar_index is not None else create_index("exact", dim=dim)
+        self.max_exemplars = max_exemplars
+        self.min_spacing = min_spacing  # Faces closer than this to a prototype add no coverage
+        self.match_radius = match_radius  # Queries this close to a centroid skip the exemplars
+        self.dim = dim
+        self.size = 0
+        self.sums = np.zeros((0, dim), dtype=np.float64)
+        self.counts = np.zeros(0, dtype=np.int64)
+        # identity id -> exemplar index rows, filled in order; -1 for unused slots
+        self.exemplar_rows = np.zeros((0, max_exemplars), dtype=np.int64)
+        self.exemplar_counts = np.zeros(0, dtype=np.int64)
+        self.removed = set()
+        self._owner = np.zeros(0, dtype=np.int64)  # exemplar index row -> identity id
+
+    def __len__(self):
+        return self.size
+
+    @property
+    def prototype_count(self):
+        return len(self.index) + len(self.exemplar_index)
+
+    def _grow(self, identities, rows):
+        """Make room for new identity ids and exemplar rows, doubling like EncodingMatrix"""
+        if identities > len(self.counts):
+            capacity = max(identities, 2 * len(self.counts), 64)
+            extra = capacity - len(self.counts)
+            self.sums = np.vstack([self.sums, np.zeros((extra, self.dim))])
+            self.counts = np.concatenate([self.counts, np.zeros(extra, dtype=np.int64)])
+            self.exemplar_rows = np.vstack([self.exemplar_rows,
+                                            np.full((extra, self.max_exemplars), -1, dtype=np.int64)])
+            self.exemplar_counts = np.concatenate([self.exemplar_counts, np.zeros(extra, dtype=np.int64)])
+        if rows > len(self._owner):
+            capacity = max(rows, 2 * len(self._owner), 64)
+            extra = np.full(capacity - len(self._owner), -1, dtype=np.int64)
+            self._owner = np.concatenate([self._owner, extra])
+
+    def add(self, encodings):
+        """Add new identities seeded with one encoding each and return their ids.
+
+        The seed is only the initial centroid; it counts as a face once it
+        is passed to observe().
+        """
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        ids = self.index.add(encodings)
+        self._grow(self.size + len(encodings), 0)
+        self.size += len(encodings)
+        return ids
+
+    def search(self, queries):
+        """Return (identity ids, distances) of the nearest prototype per query, -1 when empty.
+
+        Queries within match_radius of a centroid keep it, even if another
+        identity's exemplar is slightly closer.
+        """
+        identities, distances = self.index.search(queries)
+        if not len(self.exemplar_index):
+            return identities, distances
+        far = np.flatnonzero((identities < 0) | (distances > self.match_radius))
+        if len(far):
+            queries = np.asarray(queries, dtype=np.float32).reshape(-1, self.dim)
+            rows, exemplar_distances = self.exemplar_index.search(queries[far])
+            closer = (rows >= 0) & (exemplar_distances < distances[far])
+            identities[far[closer]] = self._owner[rows[closer]]
+            distances[far[closer]] = exemplar_distances[closer]
+        return identities, distances
+
+    def remove(self, ids):
+        """Stop returning the given identities from searches"""
+        ids = np.asarray(list(ids), dtype=np.int64)
+        if len(ids):
+            self.removed.update(ids.tolist())
+            self.index.remove(ids)
+            rows = self.exemplar_rows[ids]
+            if (rows >= 0).any():
+                self.exemplar_index.remove(rows[rows >= 0])
+
+    def _prototypes(self, identities):
+        """Return (N, 1 + max_exemplars, dim) centroid and exemplar vectors, and which slots are used"""
+        rows = self.exemplar_rows[identities]
+        used = rows >= 0
+        exemplars = self.exemplar_index.vectors.matrix[np.maximum(rows, 0)] if len(self.exemplar_index) else \
+            np.zeros(rows.shape + (self.dim,), dtype=np.float32)
+        prototypes = np.concatenate([self.index.vectors.matrix[identities][:, None], exemplars], axis=1)
+        return prototypes, np.concatenate([np.ones((len(rows), 1), dtype=bool), used], axis=1)
+
+    def observe(self, identities, encodings):
+        """Fold newly assigned faces into their identities' centroids and exemplars"""
+        identities = np.asarray(identities, dtype=np.int64)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if len(identities) == 0:
+            return
+        self._accumulate(identities, encodings, 1)
+        self._refresh_centroids(identities)
+        self.reselect(identities, encodings)
+
+    def reselect(self, identities, encodings):
+        """Offer faces already counted in their identities' centroids as exemplars"""
+        identities = np.asarray(identities, dtype=np.int64)
+        encodings = np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim)
+        if not self.max_exemplars or len(identities) == 0:
+            return
+
+        # Most faces sit close to a prototype of their identity; only the others are considered
+        prototypes, used = self._prototypes(identities)
+        offsets = prototypes - encodings[:, None]
+        gaps = np.where(used, np.einsum("ijk,ijk->ij", offsets, offsets), np.inf)
+        candidates = np.flatnonzero(gaps.min(axis=1) >= self.min_spacing ** 2)
+        if not len(candidates):
+            return
+
+        # One pass per identity over all of its candidates
+        candidates = candidates[np.argsort(identities[candidates], kind="stable")]
+        owners, starts = np.unique(identities[candidates], return_index=True)
+        for identity, group in zip(owners.tolist(), np.split(candidates, starts[1:])):
+            self._offer_exemplars(identity, encodings[group])
+
+    def forget(self, identities, encodings):
+        """Take removed faces out of their identities' centroids and drop those identities' exemplars.
+
+        The exemplars may be the removed faces themselves; pass the
+        identities' remaining faces to reselect() to choose new ones.
+        Returns the identities affected.
+        """
+        identities = np.asarray(identities, dtype=np.int64)
+        if len(identities) == 0:
+            return identities
+        self._accumulate(identities, np.asarray(encodings, dtype=np.float32).reshape(-1, self.dim), -1)
+        touched = np.unique(identities)
+        self._refresh_centroids(touched[self.counts[touched] > 0])
+
+        rows = self.exemplar_rows[touched]
+        used = rows[rows >= 0]
+        if len(used):
+            self.exemplar_index.remove(used)
+            self._owner[used] = -1
+        self.exemplar_rows[touched] = -1
+        self.exemplar_counts[touched] = 0
+        return touched
+
+    def _accumulate(self, identities, encodings, sign):
+        """Add (sign 1) or subtract (sign -1) faces from their identities' sums and counts"""
+        # Sorting by identity turns the scattered adds into one segmented sum, far cheaper than np.add.at
+        order = np.argsort(identities, kind="stable")
+        touched, starts, counts = np.unique(identities[order], return_index=True, return_counts=True)
+        self.sums[touched] += sign * np.add.reduceat(encodings[order].astype(np.float64), starts, axis=0)
+        self.counts[touched] += sign * counts
+
+    def _refresh_centroids(self, identities):
+        touched = np.unique(identities)
+        if len(touched):
+            centroids = self.sums[touched] / self.counts[touched, None]
+            self.index.update(touched, centroids.astype(np.float32))
+
+    def _offer_exemplars(self, identity, candidates):
+        """Keep the candidate faces that add the most coverage to one identity.
+
+        Free exemplar slots are filled farthest-first: each step takes the
+        candidate farthest from every prototype, as long as it is at least
+        min_spacing away. Once the slots are full, the farthest remaining
+        candidate replaces the least useful exemplar if it covers more.
+        """
+        count = int(self.exemplar_counts[identity])
+        prototypes, used = self._prototypes([identity])
+        prototypes = prototypes[0][used[0]]
+        gaps = np.sqrt(squared_distances(candidates, prototypes).min(axis=1))
+        while count < self.max_exemplars:
+            best = int(np.argmax(gaps))
+            if gaps[best] < self.min_spacing:
+                return
+            chosen = candidates[best:best + 1]
+            row = int(self.exemplar_index.add(chosen)[0])
+            self._grow(0, row + 1)
+            self._owner[row] = identity
+            self.exemplar_rows[identity, count] = row
+            count += 1
+            self.exemplar_counts[identity] = count
+            gaps = np.minimum(gaps, np.sqrt(squared_distances(candidates, chosen)[:, 0]))
+
+        best = int(np.argmax(gaps))
+        if gaps[best] < self.min_spacing:
+            return
+
+        # Full: the most redundant exemplar is the one closest to another prototype
+        prototypes = self._prototypes([identity])[0][0]
+        pairwise = np.sqrt(squared_distances(prototypes, prototypes))
+        np.fill_diagonal(pairwise, np.inf)
+        redundancy = pairwise[1:].min(axis=1)
+        weakest = int(np.argmin(redundancy))
+        distances = np.sqrt(squared_distances(candidates[best:best + 1], prototypes)[0])
+        if np.delete(distances, weakest + 1).min() > redundancy[weakest]:
+            self.exemplar_index.update(self.exemplar_rows[identity, weakest:weakest + 1],
+                                       candidates[best:best + 1])
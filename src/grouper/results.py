@@ -0,0 +1,40 @@
+import json
+from collections import defaultdict
+
+# Bumped when the layout of saved results changes
+RESULTS_VERSION = 1
+
+
+def save_grouped_faces(grouped_faces, path):
+    """Write grouped faces to a JSON file"""
+    data = {
+        'version': RESULTS_VERSION,
+        'grouped_faces': {
+            person: [
+                {
+                    'filename': face['filename'],
+                    'filepath': face['filepath'],
+                    'location': [int(v) for v in face['location']]
+                }
+                for face in faces
+            ]
+            for person, faces in grouped_faces.items()
+        }
+    }
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(data, f, indent=1)
+
+
+def load_grouped_faces(path):
+    """Read grouped faces written by save_grouped_faces"""
+    with open(path, encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('version') != RESULTS_VERSION:
+        raise ValueError(f"Unsupported results version in {path}: {data.get('version')}")
+
+    grouped_faces = defaultdict(list)
+    for person, faces in data['grouped_faces'].items():
+        for face in faces:
+            face['location'] = tuple(face['location'])
+            grouped_faces[person].append(face)
+    return grouped_faces
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import queue
+import threading
+import urllib.request
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, unquote, urlsplit
+from grouper.instrumentation import Instrumentation
+from grouper.models import MODELS
+from utils.scanner import ImageFile, file_stat
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+
+
+class GroupingService:
+    """Keeps a FaceGrouper warm and assigns faces for images as they arrive.
+
+    Requests from any thread are queued; one batching thread takes the
+    first waiting request, gathers whatever else arrives within
+    ``batch_wait`` seconds (up to ``batch_max_images`` images) and runs
+    them through a single add_images pass, so concurrent uploads share one
+    detection and matching pass. Identities persist across requests, and
+    the face store is saved to ``library`` every ``save_interval`` seconds
+    when it changed, and on stop(). Only the batching thread changes the
+    grouper; readers take the same lock.
+
+    An image posted again after its file changed (size or modification
+    time) is removed and detected afresh. Images loaded from the library
+    are taken as unchanged until they are first posted.
+    """
+
+    def __init__(self, face_grouper, library=None, batch_max_images=64, batch_wait=0.02,
+                 save_interval=60.0):
+        self.face_grouper = face_grouper
+        self.library = library
+        self.batch_max_images = max(1, batch_max_images)
+        self.batch_wait = batch_wait
+        self.save_interval = save_interval
+        self.instruments = Instrumentation()  # Request latency, queue wait and batch spans
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.batches = 0
+        self.last_save = None
+        self._dirty = False
+        self._stats = {}  # path -> FileStat of the file when its faces were assigned
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        """Load the saved library, warm the models and start the batching thread"""
+        if self.library and os.path.isfile(os.path.join(self.library, "store.json")):
+            self.face_grouper.load_results(self.library)
+            print(f"Loaded {self.face_grouper.store.image_count} images from {self.library}")
+        # Read an opened project's faces and encodings now rather than on the first request
+        self.face_grouper.load_store()
+        # Small batches run in this process, larger ones may also use the worker pool
+        MODELS.warm()
+        self.face_grouper.detector.warm()
+        self._thread = threading.Thread(target=self._run, name="grouping-service", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Finish the queued requests, stop the batching thread and save"""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.face_grouper.detector.close()
+        with self.lock:
+            self._save()
+
+    def submit(self, paths):
+        """Queue images for assignment; the Future resolves to {path: {'faces', 'error'}}"""
+        future = Future()
+        if self._stopping.is_set():
+            future.set_exception(RuntimeError("The service is stopping"))
+            return future
+        self.requests.put((list(paths), future, time.perf_counter()))
+        return future
+
+    def assign(self, paths, timeout=None):
+        """Assign faces for images and wait for the result"""
+        return self.submit(paths).result(timeout)
+
+    def _next_batch(self):
+        """Wait for a request, then gather more until the batch is full or batch_wait passes"""
+        try:
+            batch = [self.requests.get(timeout=0.25)]
+        except queue.Empty:
+            return []
+        images = len(batch[0][0])
+        deadline = time.perf_counter() + self.batch_wait
+        while images < self.batch_max_images:
+            remaining = deadline - time.perf_counter()
+            try:
+                request = self.requests.get(timeout=remaining) if remaining > 0 else self.requests.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(request)
+            images += len(request[0])
+        return batch
+
+    def _run(self):
+        while not (self._stopping.is_set() and self.requests.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._process(batch)
+            if (self._dirty and self.library and self.save_interval is not None
+                    and time.perf_counter() - (self.last_save or 0) >= self.save_interval):
+                with self.lock:
+                    self._save()
+
+    def _process(self, batch):
+        started = time.perf_counter()
+        for _, _, queued in batch:
+            self.instruments.add_span("queue_wait", queued, started - queued)
+
+        # One detection and matching pass for every image in the batch, each image once
+        paths = list(dict.fromkeys(path for request_paths, _, _ in batch for path in request_paths))
+        missing = {path for path in paths if not os.path.isfile(path)}
+        try:
+            image_files = [ImageFile(os.path.basename(path), path, file_stat(path))
+                           for path in paths if path not in missing]
+            with self.lock, self.instruments.span("batch", images=len(image_files), requests=len(batch)):
+                if image_files:
+                    store = self.face_grouper.store
+                    # Files that changed since their faces were assigned are detected again
+                    changed = [entry[1] for entry in image_files if store.has_image(entry[1])
+                               and self._stats.setdefault(entry[1], entry.stat) != entry.stat]
+                    if changed:
+                        self.face_grouper.remove_images(changed)
+                    known = self.face_grouper.store.image_count
+                    self.face_grouper.add_images(image_files)
+                    self._dirty |= bool(changed) or self.face_grouper.store.image_count > known
+                    self._stats.update((entry[1], entry.stat) for entry in image_files)
+                results = self._results(paths, missing)
+        except Exception as e:
+            for _, future, _ in batch:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.instruments.count('images', len(paths))
+        self.instruments.count('requests', len(batch))
+
+        finished = time.perf_counter()
+        for request_paths, future, queued in batch:
+            self.instruments.add_span("request", queued, finished - queued, args={'images': len(request_paths)})
+            future.set_result({path: results[path] for path in request_paths})
+
+    def _results(self, paths, missing):
+        """Return {path: {'faces': [{'person', 'location'}], 'error'}} for the batch's images"""
+        store = self.face_grouper.store
+        results = {}
+        for path in paths:
+            if path in missing:
+                results[path] = {'faces': [], 'error': "file not found"}
+            elif not store.has_image(path):
+                errors = [e['message'] for e in self.face_grouper.instruments.errors if e['source'] == path]
+                results[path] = {'faces': [], 'error': errors[-1] if errors else "image could not be processed"}
+            else:
+                results[path] = {'faces': [], 'error': None}
+
+        # Look the faces of every image up in one pass over the store
+        rows = store.image_rows(paths)
+        for path_id, identity, location in zip(store.path_ids[rows].tolist(), store.identities[rows].tolist(),
+                                               store.locations[rows].tolist()):
+            results[store.paths[path_id]]['faces'].append(
+                {'person': store.names[identity] if identity >= 0 else None, 'location': location}
+            )
+        return results
+
+    def save(self):
+        """Save the face store to the library now"""
+        with self.lock:
+            self._save()
+
+    def _save(self):
+        if not (self.library and self._dirty):
+            return
+        with self.instruments.span("save"):
+            self.face_grouper.save_library(self.library)
+        self._dirty = False
+        self.last_save = time.perf_counter()
+        print(f"Saved face library to {self.library}")
+
+    def status(self):
+        """Return store sizes, queue depth, batching and latency statistics"""
+        with self.lock:
+            store = self.face_grouper.store
+            state = {
+                'images': store.image_count,
+                'faces': len(store),
+                'people': len(self.face_grouper.grouped_faces),
+            }
+        summary = self.instruments.summary()
+        requests = summary['stages'].get('request')
+        state.update({
+            'models_loaded': MODELS.loaded,
+            'queued_requests': self.requests.qsize(),
+            'batches': self.batches,
+            'images_per_batch': summary['counters'].get('images', 0) / self.batches if self.batches else None,
+            'latency': {key: requests[key] for key in ('count', 'mean', 'p50', 'p95', 'p99')} if requests else None,
+            'seconds_since_save': time.perf_counter() - self.last_save if self.last_save else None,
+            'stages': summary['stages'],
+        })
+        return state
+
+    def people(self, offset=0, limit=50):
+        """Return a page of [{'name', 'count'}]"""
+        with self.lock:
+            grouped_faces = self.face_grouper.grouped_faces
+            names = list(grouped_faces)[offset:offset + limit]
+            return [{'name': name, 'count': len(grouped_faces[name])} for name in names]
+
+    def person_faces(self, name, offset=0, limit=50):
+        """Return a page of one person's faces as {'filename', 'filepath', 'location'} dicts"""
+        with self.lock:
+            faces = self.face_grouper.grouped_faces[name][offset:offset + limit]
+            return [dict(face, location=list(face['location'])) for face in faces]
+
+
+class ServiceHandler(BaseHTTPRequestHandler):
+    """JSON over HTTP front end of a GroupingService (set as the server's ``service``).
+
+    POST /assign {"paths": [...]}, GET /status, GET /people, GET /people/NAME,
+    POST /save and POST /shutdown; pages take ?offset= and &limit=.
+    """
+
+    server_version = "FaceGrouper"
+
+    def log_message(self, format, *args):
+        # Requests are counted in the service statistics instead
+        pass
+
+    def _send(self, status, body):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _page(self, query):
+        params = parse_qs(query)
+        return int(params.get('offset', [0])[0]), int(params.get('limit', [50])[0])
+
+    def do_GET(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        try:
+            if url.path == "/status":
+                self._send(200, service.status())
+            elif url.path == "/people":
+                self._send(200, {'people': service.people(*self._page(url.query))})
+            elif url.path.startswith("/people/"):
+                name = unquote(url.path[len("/people/"):])
+                self._send(200, {'name': name, 'faces': service.person_faces(name, *self._page(url.query))})
+            else:
+                self._send(404, {'error': f"unknown path {url.path}"})
+        except KeyError as e:
+            self._send(404, {'error': f"unknown person {e}"})
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+
+    def do_POST(self):
+        service = self.server.service
+        url = urlsplit(self.path)
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length) or b"{}")
+            if url.path == "/assign":
+                paths = body.get('paths')
+                if not isinstance(paths, list) or not all(isinstance(p, str) for p in paths):
+                    raise ValueError("expected {\"paths\": [image paths]}")
+                if not all(os.path.isabs(p) for p in paths):
+                    raise ValueError("image paths must be absolute")
+                self._send(200, {'images': service.assign(paths)})
+            elif url.path == "/save":
+                service.save()
+                self._send(200, {'saved': service.library})
+            elif url.path == "/shutdown":
+                self._send(200, {'stopping': True})
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+            else:
+                self._send(404, {'error': f"unknown path {url.path}"})
+        except ValueError as e:
+            self._send(400, {'error': str(e)})
+        except Exception as e:
+            self._send(500, {'error': str(e)})
+
+
+def make_server(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Create the HTTP server for a started service; port 0 picks a free port"""
+    server = ThreadingHTTPServer((host, port), ServiceHandler)
+    server.daemon_threads = True
+    server.service = service
+    return server
+
+
+def serve(service, host=DEFAULT_HOST, port=DEFAULT_PORT):
+    """Run the service until /shutdown or Ctrl+C, then save and stop"""
+    service.start()
+    try:
+        server = make_server(service, host, port)
+        print(f"Face grouper service listening on http://{server.server_address[0]}:{server.server_address[1]}")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+    finally:
+        service.stop()
+
+
+def call_service(url, path, body=None, timeout=None):
+    """Send a JSON request to a running service (POST when there is a body) and return the reply"""
+    data = json.dumps(body).encode("utf-8") if body is not None else None
+    request = urllib.request.Request(url.rstrip("/") + path, data=data,
+                                     headers={"Content-Type": "application/json"})
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
@@ -0,0 +1,116 @@
+import os
+import json
+import numpy as np
+from grouper.detection import ENCODING_SIZE
+from grouper.face_store import FaceStore
+from grouper.identity_index import create_index
+from grouper.matching import match_encodings
+
+# Bumped when the shard metadata layout changes
+SHARD_VERSION = 1
+SHARD_META = "shard.json"
+
+# Settings that change the encodings; every shard of a merge must agree on them
+DETECTION_SETTINGS = ("model", "upsample", "max_side")
+
+
+def shard_slice(items, shard_index, shard_count):
+    """Return the contiguous part of items handled by one shard.
+
+    Contiguous slices keep the global image order, so merged identities
+    are numbered as they would be in a single run.
+    """
+    if not 0 <= shard_index < shard_count:
+        raise ValueError(f"Shard index {shard_index} out of range for {shard_count} shards")
+    items = list(items)
+    start = len(items) * shard_index // shard_count
+    end = len(items) * (shard_index + 1) // shard_count
+    return items[start:end]
+
+
+def shard_name(shard_index, shard_count):
+    """Directory name of one shard's partial result"""
+    return f"shard-{shard_index:04d}-of-{shard_count:04d}"
+
+
+def write_shard(store, directory, shard_index, shard_count, settings):
+    """Save a shard's face store (encodings, locations, local identities) and its metadata"""
+    store.save(directory)
+    meta = {
+        'version': SHARD_VERSION,
+        'shard_index': shard_index,
+        'shard_count': shard_count,
+        'images': store.image_count,
+        'faces': len(store),
+        'identities': int(np.count_nonzero(store.identity_counts)),
+        'settings': settings
+    }
+    with open(os.path.join(directory, SHARD_META), "w", encoding="utf-8") as f:
+        json.dump(meta, f, indent=1)
+
+
+def find_shards(directory):
+    """Return [(meta, shard directory)] for the shards under a directory, in shard order"""
+    shards = []
+    for entry in sorted(os.scandir(directory), key=lambda e: e.name):
+        meta_path = os.path.join(entry.path, SHARD_META)
+        if entry.is_dir() and os.path.isfile(meta_path):
+            with open(meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            if meta.get('version') != SHARD_VERSION:
+                raise ValueError(f"Unsupported shard version in {entry.path}: {meta.get('version')}")
+            shards.append((meta, entry.path))
+    if not shards:
+        raise ValueError(f"No shards found in {directory}")
+
+    shards.sort(key=lambda shard: shard[0]['shard_index'])
+    first = shards[0][0]
+    for meta, path in shards:
+        for name in DETECTION_SETTINGS:
+            if meta['settings'].get(name) != first['settings'].get(name):
+                raise ValueError(f"Shard {path} used {name}={meta['settings'].get(name)!r}, "
+                                 f"others used {first['settings'].get(name)!r}")
+    found = {meta['shard_index'] for meta, _ in shards}
+    missing = sorted(set(range(first['shard_count'])) - found)
+    if missing:
+        print(f"Warning: merging without shards {missing} of {first['shard_count']}")
+    return shards
+
+
+def merge_shards(directory, tolerance, index_backend="exact", index_options=None):
+    """Merge shard results into one face store with global identities.
+
+    Each shard's local identities are represented by their centroids and
+    matched, shard by shard, against the centroids of the global identities
+    found so far; a local identity with no global match within tolerance
+    becomes a new global identity. After each shard the global centroids
+    are recomputed over all their faces, so an identity seen in several
+    shards is matched by its face-weighted mean rather than by the first
+    shard's view of it. Faces keep their shard order, and global names
+    follow first appearance.
+    """
+    merged = FaceStore()
+    index = create_index(index_backend, **(index_options or {}))
+    for meta, path in find_shards(directory):
+        shard = FaceStore.open(path)
+
+        # Local identities that still have faces, as prototypes
+        centroids = shard.centroids()
+        local_ids = sorted(centroids)
+        identity_map = np.full(len(shard.names), -1, dtype=np.int32)
+        if local_ids:
+            prototypes = np.stack([centroids[i] for i in local_ids]).reshape(-1, ENCODING_SIZE)
+            assigned, is_new = match_encodings(index, prototypes, tolerance)
+            for identity in assigned[is_new]:
+                merged.names.append(f"Person_{identity + 1}")
+            identity_map[local_ids] = assigned
+
+        merged.append_store(shard, identity_map)
+        if local_ids:
+            # Move the matched global identities to the mean of all their faces so far
+            touched = np.unique(identity_map[local_ids])
+            index.update(touched, (merged.identity_sums[touched]
+                                   / merged.identity_counts[touched, None]).astype(np.float32))
+        print(f"Merged {shard_name(meta['shard_index'], meta['shard_count'])}: "
+              f"{meta['images']} images, {meta['faces']} faces, {len(local_ids)} local identities")
+    return merged
@@ -1,10 +1,16 @@
+import queue
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
-import os
 # Use absolute imports
 from ui.image_gallery import ImageGallery
 from utils.file_handler import select_image_folder
 from grouper.index import FaceGrouper
+from grouper.cache import default_cache_dir
+from grouper.progress import is_cancelled
+from grouper.project_db import default_project_path
+from ui.background import BackgroundRunner, format_progress
+from utils.image_processor import warm_face_thumbnails
+from utils.scanner import scan_images
 
 class ApplicationWindow:
     def __init__(self, root):
@@ -31,13 +37,27 @@ class ApplicationWindow:
         # self.root.attributes('-zoomed', True)  # For Linux
         
         # Initialize face grouper
-        self.face_grouper = FaceGrouper()
+        self.face_grouper = FaceGrouper(cache_dir=default_cache_dir())
         
         # Store current folder path
         self.current_folder_path = None
         self.current_image_files = []
         
+        # Runs grouping and labeling off the Tk main thread
+        self.runner = BackgroundRunner(self.root)
+        
         self.setup_ui()
+        self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        
+        # Load the face models once the window is up, without blocking it: in the
+        # detection worker processes, or in this process when there is no pool
+        self.root.after(200, self.face_grouper.detector.warm)
+        
+    def on_close(self):
+        """Stop any running job and the detection workers, then close the window"""
+        self.runner.cancel()
+        self.face_grouper.detector.close()
+        self.root.destroy()
         
     def setup_ui(self):
         # Create header
@@ -53,9 +73,9 @@ class ApplicationWindow:
         controls_frame.pack(fill=tk.X, padx=20, pady=5)
         
         # Browse button
-        browse_button = ttk.Button(controls_frame, text="Browse Images", 
-                                  command=self.browse_for_images)
-        browse_button.pack(side=tk.LEFT, pady=5, padx=5)
+        self.browse_button = ttk.Button(controls_frame, text="Browse Images", 
+                                      command=self.browse_for_images)
+        self.browse_button.pack(side=tk.LEFT, pady=5, padx=5)
         
         # Group faces button
         self.group_button = ttk.Button(controls_frame, text="Group Faces", 
@@ -67,6 +87,11 @@ class ApplicationWindow:
                                     command=self.save_labeled_images, state=tk.DISABLED)
         self.save_button.pack(side=tk.LEFT, pady=5, padx=5)
         
+        # Cancel button for the running background job
+        self.cancel_button = ttk.Button(controls_frame, text="Cancel", 
+                                      command=self.cancel_job, state=tk.DISABLED)
+        self.cancel_button.pack(side=tk.LEFT, pady=5, padx=5)
+        
         # View mode controls
         self.view_mode_var = tk.StringVar(value="images")
         
@@ -95,15 +120,88 @@ class ApplicationWindow:
         folder_path = select_image_folder()
         if folder_path:
             self.current_folder_path = folder_path
-            self.gallery.load_and_display_images(folder_path)
+            self.current_image_files = []
+            
+            # Each folder keeps its results in a project database, so earlier groups reopen instantly
+            self.face_grouper.open_project(default_project_path(folder_path))
+            self.scan_folder(folder_path)
+    
+    def scan_folder(self, folder_path):
+        """List a folder's images in the background, adding them to the gallery batch by batch"""
+        self.set_busy(True)
+        self.status_var.set("Scanning folder...")
+        self.gallery.display_images([], scanning=True)
+        
+        # The scan hands its batches to the Tk thread through this queue
+        batches = queue.Queue()
+        
+        def job(progress_callback, cancel_event):
+            found = 0
+            for batch in scan_images(folder_path):
+                batches.put(batch)
+                found += len(batch)
+                progress_callback({'stage': "scan", 'done': found})
+                if is_cancelled(cancel_event):
+                    break
+            return found
+        
+        def add_batches():
+            while True:
+                try:
+                    batch = batches.get_nowait()
+                except queue.Empty:
+                    return
+                self.gallery.append_images(batch)
+        
+        def on_progress(event):
+            add_batches()
+            self.status_var.set(f"Scanning folder: {event['done']} images found")
+        
+        def on_done(found, cancelled):
+            add_batches()
+            self.gallery.finish_images()
             self.current_image_files = self.gallery.current_image_files
+            saved_people = self.face_grouper.project.people_count
             
             # Enable group faces button
-            self.group_button.config(state=tk.NORMAL)
-            self.save_button.config(state=tk.DISABLED)
+            self.set_busy(False)
+            self.save_button.config(state=tk.NORMAL if saved_people else tk.DISABLED)
             self.view_images_button.config(state=tk.NORMAL)
+            self.view_groups_button.config(state=tk.NORMAL if saved_people else tk.DISABLED)
+            status = f"Loaded {len(self.current_image_files)} images"
+            if cancelled:
+                status = f"Scan cancelled. Loaded the first {len(self.current_image_files)} images"
+            if saved_people:
+                self.status_var.set(f"{status}. Saved groups for {saved_people} people are available.")
+            else:
+                self.status_var.set(f"{status}. Ready to group faces.")
+        
+        def on_error(error):
+            self.set_busy(False)
+            messagebox.showerror("Error", f"An error occurred while scanning the folder: {error}")
+            self.status_var.set("Error scanning the folder.")
+        
+        self.runner.submit(job, on_done, on_error, on_progress)
+    
+    def set_busy(self, busy):
+        """Enable or disable the controls around a background job"""
+        state = tk.DISABLED if busy else tk.NORMAL
+        self.browse_button.config(state=state)
+        self.group_button.config(state=state)
+        self.cancel_button.config(state=tk.NORMAL if busy else tk.DISABLED)
+        if busy:
+            self.save_button.config(state=tk.DISABLED)
+            self.view_images_button.config(state=tk.DISABLED)
             self.view_groups_button.config(state=tk.DISABLED)
-            self.status_var.set(f"Loaded {len(self.current_image_files)} images. Ready to group faces.")
+    
+    def cancel_job(self):
+        """Stop the running job; whatever finished so far is kept"""
+        self.runner.cancel()
+        self.cancel_button.config(state=tk.DISABLED)
+        self.status_var.set("Cancelling...")
+    
+    def show_progress(self, event):
+        self.status_var.set(format_progress(event))
     
     def group_faces(self):
         if not self.current_image_files:
@@ -111,46 +209,62 @@ class ApplicationWindow:
             return
         
         # Disable buttons during processing
-        self.group_button.config(state=tk.DISABLED)
-        self.save_button.config(state=tk.DISABLED)
+        self.set_busy(True)
         self.status_var.set("Processing images... This may take a while.")
-        self.root.update()
         
-        # Process images and group faces
-        try:
-            grouped_faces = self.face_grouper.group_faces(self.current_image_files)
-            
-            # Show summary of grouping
-            summary = self.face_grouper.get_summary()
-            message = f"Found {summary['total_people']} unique people across {len(self.current_image_files)} images.\n\n"
-            
-            for person in summary['people']:
-                message += f"{person['name']}: {person['count']} appearances\n"
-            
-            messagebox.showinfo("Face Grouping Results", message)
-            
-            # Show grouped faces in the UI
-            self.gallery.display_face_groups(grouped_faces)
-            
-            # Enable buttons
-            self.save_button.config(state=tk.NORMAL)
-            self.group_button.config(state=tk.NORMAL)
-            self.view_images_button.config(state=tk.NORMAL)
-            self.view_groups_button.config(state=tk.NORMAL)
-            self.status_var.set(f"Completed face grouping. Found {summary['total_people']} unique people.")
-            
-            # Update current view mode
-            self.view_mode_var.set("groups")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred during face grouping: {e}")
-            self.status_var.set("Error during face grouping.")
-            self.group_button.config(state=tk.NORMAL)
+        # Files may have changed since the folder was scanned, so let the caches stat them afresh
+        image_files = [(filename, filepath) for filename, filepath in self.current_image_files]
+        
+        def job(progress_callback, cancel_event):
+            grouped_faces = self.face_grouper.group_faces(
+                image_files, progress_callback=progress_callback,
+                cancel_event=cancel_event)
+            # Decode the group thumbnails here so the Tk thread only wraps them
+            warm_face_thumbnails(grouped_faces)
+            return grouped_faces
+        
+        # Process images and group faces in the background
+        self.runner.submit(job, self.on_grouping_done, self.on_grouping_error, self.show_progress)
+    
+    def on_grouping_done(self, grouped_faces, cancelled):
+        self.restore_controls()
+        
+        # Show summary of grouping
+        summary = self.face_grouper.get_summary()
+        processed = self.face_grouper.store.image_count
+        message = f"Found {summary['total_people']} unique people across {processed} images.\n\n"
+        if summary['duplicate_images']:
+            message += f"{summary['duplicate_images']} images were copies and reused an earlier detection.\n\n"
+        if cancelled:
+            message = f"Cancelled after {processed} of {len(self.current_image_files)} images. Partial results:\n\n" + message
+        
+        for person in summary['people']:
+            message += f"{person['name']}: {person['count']} appearances\n"
+        
+        messagebox.showinfo("Face Grouping Results", message)
+        
+        # Show grouped faces in the UI
+        self.gallery.display_face_groups(grouped_faces)
+        
+        status = f"Completed face grouping. Found {summary['total_people']} unique people."
+        if cancelled:
+            status = f"Grouping cancelled. Found {summary['total_people']} unique people in {processed} images."
+        self.status_var.set(status)
+        
+        # Update current view mode
+        self.view_mode_var.set("groups")
+    
+    def on_grouping_error(self, error):
+        self.set_busy(False)
+        messagebox.showerror("Error", f"An error occurred during face grouping: {error}")
+        self.status_var.set("Error during face grouping.")
+        self.view_images_button.config(state=tk.NORMAL)
     
     def switch_view(self, mode):
         """Switch between viewing all images and face groups"""
         if mode == "images":
             if self.current_folder_path:
-                self.gallery.load_and_display_images(self.current_folder_path)
+                self.gallery.display_images(self.current_image_files)
                 self.status_var.set(f"Displaying all {len(self.current_image_files)} images")
                 self.view_mode_var.set("images")
         elif mode == "groups":
@@ -173,14 +287,30 @@ class ApplicationWindow:
             return
             
         # Update status
+        self.set_busy(True)
         self.status_var.set("Saving labeled images...")
-        self.root.update()
-        
-        # Save labeled images
-        try:
-            labeled_images = self.face_grouper.label_faces(output_dir)
-            messagebox.showinfo("Success", f"Saved {len(labeled_images)} labeled images to {output_dir}")
-            self.status_var.set(f"Saved labeled images to {output_dir}")
-        except Exception as e:
-            messagebox.showerror("Error", f"An error occurred when saving labeled images: {e}")
+        
+        def job(progress_callback, cancel_event):
+            return self.face_grouper.label_faces(output_dir, progress_callback=progress_callback,
+                                                 cancel_event=cancel_event)
+        
+        def on_done(labeled_images, cancelled):
+            self.restore_controls()
+            prefix = "Cancelled. " if cancelled else ""
+            messagebox.showinfo("Success", f"{prefix}Saved {len(labeled_images)} labeled images to {output_dir}")
+            self.status_var.set(f"{prefix}Saved labeled images to {output_dir}")
+        
+        def on_error(error):
+            self.restore_controls()
+            messagebox.showerror("Error", f"An error occurred when saving labeled images: {error}")
             self.status_var.set("Error saving labeled images.")
+        
+        # Save labeled images in the background
+        self.runner.submit(job, on_done, on_error, self.show_progress)
+    
+    def restore_controls(self):
+        """Re-enable the controls after a job that leaves the grouping intact"""
+        self.set_busy(False)
+        self.save_button.config(state=tk.NORMAL)
+        self.view_images_button.config(state=tk.NORMAL)
+        self.view_groups_button.config(state=tk.NORMAL)
@@ -0,0 +1,85 @@
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+def format_progress(event):
+    """Turn a progress event dict into a one-line status message"""
+    stage = {'detect': "Processing images", 'label': "Saving labeled images"}.get(
+        event['stage'], event['stage'].capitalize())
+    total = event['total'] if event['total'] is not None else "?"
+    message = (f"{stage}: {event['done']}/{total} images, "
+               f"{event['faces']} faces, {event['rate']:.1f} images/s")
+    if event['eta'] is not None and event['done'] < event['total']:
+        minutes, seconds = divmod(int(event['eta']), 60)
+        message += f", ETA {minutes}m {seconds:02d}s"
+    return message
+
+
+class BackgroundRunner:
+    """Runs long jobs off the Tk main thread and streams their events back to it.
+
+    A job is a callable taking (progress_callback, cancel_event). Progress
+    events and the final result travel through a queue that the Tk thread
+    drains with after(), so the callbacks always run on the Tk thread.
+    """
+
+    def __init__(self, root, poll_interval=100):
+        self.root = root
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.events = queue.Queue()
+        self.cancel_event = None
+        self.busy = False
+
+    def submit(self, job, on_done, on_error=None, on_progress=None):
+        """Start a job; on_done(result, cancelled) runs on the Tk thread when it ends"""
+        if self.busy:
+            raise RuntimeError("A background job is already running")
+        self.busy = True
+        self.cancel_event = threading.Event()
+        self._handlers = (on_done, on_error, on_progress)
+
+        cancel_event = self.cancel_event
+
+        def run():
+            try:
+                result = job(lambda event: self.events.put(('progress', event)), cancel_event)
+                self.events.put(('done', result))
+            except Exception as e:
+                self.events.put(('error', e))
+
+        self.executor.submit(run)
+        self.root.after(self.poll_interval, self._poll)
+
+    def cancel(self):
+        """Ask the running job to stop; it finishes with partial results"""
+        if self.cancel_event is not None:
+            self.cancel_event.set()
+
+    def _poll(self):
+        on_done, on_error, on_progress = self._handlers
+        latest_progress = None
+        while True:
+            try:
+                kind, payload = self.events.get_nowait()
+            except queue.Empty:
+                break
+
+            if kind == 'progress':
+                # Only the newest progress event matters for display
+                latest_progress = payload
+                continue
+
+            if latest_progress is not None and on_progress:
+                on_progress(latest_progress)
+            self.busy = False
+            if kind == 'done':
+                on_done(payload, self.cancel_event.is_set())
+            elif on_error:
+                on_error(payload)
+            return
+
+        if latest_progress is not None and on_progress:
+            on_progress(latest_progress)
+        self.root.after(self.poll_interval, self._poll)
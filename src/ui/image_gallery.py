@@ -1,7 +1,8 @@
 import tkinter as tk
 from tkinter import ttk
 # Use absolute import
-from utils.image_processor import get_image_thumbnails, get_face_group_thumbnails
+from utils.image_processor import get_face_group_thumbnails
+from ui.virtual_grid import VirtualImageGrid
 
 class ImageGallery:
     def __init__(self, parent):
@@ -32,71 +33,70 @@ class ImageGallery:
         self.images_frame = ttk.Frame(self.canvas)
         self.canvas_window = self.canvas.create_window((0, 0), window=self.images_frame, anchor="nw")
         
+        # Virtualized grid used for the all-images view
+        self.image_grid = VirtualImageGrid(self.canvas)
+        
         # Update scroll region when the size of the frame changes
         self.images_frame.bind("<Configure>", self.on_frame_configure)
         
-    def on_frame_configure(self, event):
-        self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+        # Redraw the visible grid rows when scrolling or resizing
+        self.v_scrollbar.config(command=self.on_yview)
+        self.canvas.bind("<Configure>", lambda event: self.image_grid.relayout())
+        self.canvas.bind("<MouseWheel>", self.on_mousewheel)
+        self.canvas.bind("<Button-4>", lambda event: self.on_yview("scroll", -1, "units"))
+        self.canvas.bind("<Button-5>", lambda event: self.on_yview("scroll", 1, "units"))
         
-    def load_and_display_images(self, folder_path):
-        # Clear previous images
+    def on_frame_configure(self, event):
+        if not self.image_grid.active:
+            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+    
+    def on_yview(self, *args):
+        self.canvas.yview(*args)
+        self.image_grid.render()
+    
+    def on_mousewheel(self, event):
+        self.on_yview("scroll", -1 if event.delta > 0 else 1, "units")
+    
+    def clear(self):
+        """Remove the current grid or face group widgets"""
+        self.image_grid.clear()
         for widget in self.images_frame.winfo_children():
             widget.destroy()
-            
-        # Get image files from the folder
-        from utils.file_handler import get_image_files
-        self.current_image_files = get_image_files(folder_path)
-        images_info = get_image_thumbnails(folder_path)
+        self.canvas.yview_moveto(0)
         
-        if not images_info:
+    def display_images(self, image_files, scanning=False):
+        """Show images in the all-images grid; while scanning, append_images adds more"""
+        # Clear previous images
+        self.clear()
+        self.canvas.itemconfigure(self.canvas_window, state=tk.HIDDEN)
+        self.current_image_files = list(image_files)
+            
+        # Only the rows in view are drawn; thumbnails load in the background
+        self.image_grid.show(self.current_image_files, "Scanning folder...")
+        if not scanning:
+            self.finish_images()
+    
+    def append_images(self, image_files):
+        """Add a batch of scanned images to the end of the grid"""
+        self.current_image_files.extend(image_files)
+        self.image_grid.append(image_files, f"Scanning folder... {len(self.current_image_files)} images so far")
+    
+    def finish_images(self):
+        """Show the final image count once the scan is complete"""
+        if not self.current_image_files:
+            self.image_grid.clear()
+            self.canvas.itemconfigure(self.canvas_window, state=tk.NORMAL)
             ttk.Label(self.images_frame, text="No images found in the selected folder").pack(pady=20)
             return
-            
-        # Add a label showing the count of images
-        count_label = ttk.Label(self.images_frame, text=f"Displaying all {len(images_info)} images")
-        count_label.pack(side=tk.TOP, pady=10)
-        
-        # Create a container frame for all images
-        thumbnail_frame = ttk.Frame(self.images_frame)
-        thumbnail_frame.pack(fill=tk.BOTH, expand=True)
-        
-        # Use a grid layout to better organize images
-        row, col = 0, 0
-        max_cols = 5  # Number of thumbnails per row
-        
-        # Load and display all thumbnail images
-        for i, (filename, thumbnail) in enumerate(images_info):
-            # Create frame for image and label
-            img_frame = ttk.Frame(thumbnail_frame)
-            img_frame.grid(row=row, column=col, padx=5, pady=5, sticky="nsew")
-            
-            # Display image
-            img_label = ttk.Label(img_frame, image=thumbnail)
-            img_label.image = thumbnail  # Keep a reference to prevent garbage collection
-            img_label.pack()
-            
-            # Display filename
-            name_label = ttk.Label(img_frame, text=filename[:15] + "..." if len(filename) > 15 else filename)
-            name_label.pack()
-            
-            # Update row and column for grid layout
-            col += 1
-            if col >= max_cols:
-                col = 0
-                row += 1
-                
-            # Update UI every 20 images to keep it responsive
-            if i % 20 == 0:
-                self.parent.update()
+        self.image_grid.set_header(f"Displaying all {len(self.current_image_files)} images")
     
     def display_face_groups(self, grouped_faces):
         """Display face groups in the gallery"""
         # Clear previous content
-        for widget in self.images_frame.winfo_children():
-            widget.destroy()
+        self.clear()
+        self.canvas.itemconfigure(self.canvas_window, state=tk.NORMAL)
             
         # Get thumbnails for each face group
-        from utils.image_processor import get_face_group_thumbnails
         group_thumbnails = get_face_group_thumbnails(grouped_faces)
         
         if not group_thumbnails:
@@ -0,0 +1,176 @@
+import queue
+import tkinter as tk
+from concurrent.futures import ThreadPoolExecutor
+from PIL import ImageTk
+from utils.thumbnail_cache import get_default_cache
+
+
+class VirtualImageGrid:
+    """Thumbnail grid drawn directly on a canvas, materializing only visible rows.
+
+    Each visible cell is a canvas image item plus a text item. Cells that
+    scroll out of view are hidden and reused for newly visible rows, and
+    their PhotoImages are dropped, so memory stays flat however many images
+    there are. Thumbnails are loaded on a small thread pool and handed back
+    to the Tk thread through a queue polled with after().
+    """
+
+    def __init__(self, canvas, thumbnail_size=(100, 100), overscan_rows=2, workers=4,
+                 cache=None, header_height=40):
+        self.canvas = canvas
+        self.thumbnail_size = thumbnail_size
+        self.overscan_rows = overscan_rows
+        self.cache = cache
+        self.header_height = header_height
+        self.cell_width = thumbnail_size[0] + 20
+        self.cell_height = thumbnail_size[1] + 35
+
+        self.items = []
+        self.columns = 1
+        self.cells = {}        # item index -> (image item id, text item id)
+        self.free_cells = []   # hidden cell item pairs ready for reuse
+        self.photos = {}       # item index -> PhotoImage for materialized cells
+        self.requested = set()
+        self.header_item = None
+        self.active = False
+
+        # Bumped whenever the item list changes so stale thumbnail loads are ignored
+        self.generation = 0
+        self.results = queue.Queue()
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        self._polling = False
+
+    def show(self, items, header_text):
+        """Display a new list of (filename, filepath) items"""
+        self.clear()
+        self.active = True
+        self.items = list(items)
+        self.header_item = self.canvas.create_text(
+            10, self.header_height // 2, text=header_text, anchor="w")
+        self.relayout()
+
+    def append(self, items, header_text=None):
+        """Add (filename, filepath) items at the end, e.g. as a folder scan streams in"""
+        if not self.active:
+            return
+        self.items.extend(items)
+        if header_text is not None:
+            self.set_header(header_text)
+        self.relayout()
+
+    def set_header(self, header_text):
+        if self.header_item is not None:
+            self.canvas.itemconfigure(self.header_item, text=header_text)
+
+    def clear(self):
+        """Hide every cell and forget the current items"""
+        self.generation += 1
+        self.active = False
+        for index in list(self.cells):
+            self._release(index)
+        self.requested.clear()
+        self.items = []
+        if self.header_item is not None:
+            self.canvas.delete(self.header_item)
+            self.header_item = None
+
+    def relayout(self):
+        """Recompute the column count and scroll region, then redraw"""
+        if not self.active:
+            return
+        width = max(self.canvas.winfo_width(), self.cell_width)
+        columns = max(1, width // self.cell_width)
+        if columns != self.columns:
+            # Every cell moves when the column count changes
+            self.columns = columns
+            for index in list(self.cells):
+                self._release(index)
+        rows = -(-len(self.items) // self.columns)
+        self.canvas.configure(scrollregion=(0, 0, width, self.header_height + rows * self.cell_height))
+        self.render()
+
+    def render(self):
+        """Materialize the cells in and near the viewport and recycle the rest"""
+        if not self.active or not self.items:
+            return
+        top = self.canvas.canvasy(0) - self.header_height
+        bottom = self.canvas.canvasy(self.canvas.winfo_height()) - self.header_height
+        first_row = max(0, int(top // self.cell_height) - self.overscan_rows)
+        last_row = int(bottom // self.cell_height) + self.overscan_rows
+        first = first_row * self.columns
+        last = min(len(self.items), (last_row + 1) * self.columns)
+
+        for index in [i for i in self.cells if i < first or i >= last]:
+            self._release(index)
+        for index in range(first, last):
+            if index not in self.cells:
+                self._materialize(index)
+
+    def _materialize(self, index):
+        row, col = divmod(index, self.columns)
+        x = col * self.cell_width + self.cell_width // 2
+        y = self.header_height + row * self.cell_height
+        filename, filepath = self.items[index]
+        label = filename[:15] + "..." if len(filename) > 15 else filename
+
+        if self.free_cells:
+            image_item, text_item = self.free_cells.pop()
+            self.canvas.coords(image_item, x, y + 5)
+            self.canvas.coords(text_item, x, y + self.thumbnail_size[1] + 15)
+            self.canvas.itemconfigure(image_item, image="", state=tk.NORMAL)
+            self.canvas.itemconfigure(text_item, text=label, state=tk.NORMAL)
+        else:
+            image_item = self.canvas.create_image(x, y + 5, anchor="n")
+            text_item = self.canvas.create_text(x, y + self.thumbnail_size[1] + 15, text=label)
+        self.cells[index] = (image_item, text_item)
+
+        if index not in self.requested:
+            self.requested.add(index)
+            self.executor.submit(self._load, index, filepath, self.generation)
+            self._start_polling()
+
+    def _release(self, index):
+        image_item, text_item = self.cells.pop(index)
+        self.canvas.itemconfigure(image_item, image="", state=tk.HIDDEN)
+        self.canvas.itemconfigure(text_item, state=tk.HIDDEN)
+        self.free_cells.append((image_item, text_item))
+        self.photos.pop(index, None)
+        self.requested.discard(index)
+
+    def _load(self, index, filepath, generation):
+        """Worker thread: decode a thumbnail as a PIL image"""
+        # Skip cells that scrolled away before their turn came
+        if generation != self.generation or index not in self.requested:
+            return
+        try:
+            cache = self.cache or get_default_cache()
+            self.results.put((generation, index, cache.get(filepath, self.thumbnail_size)))
+        except Exception as e:
+            print(f"Error creating thumbnail for {filepath}: {e}")
+            self.results.put((generation, index, None))
+
+    def _start_polling(self):
+        if not self._polling:
+            self._polling = True
+            self.canvas.after(25, self._poll)
+
+    def _poll(self):
+        """Tk thread: attach loaded thumbnails to cells that are still visible"""
+        while True:
+            try:
+                generation, index, img = self.results.get_nowait()
+            except queue.Empty:
+                break
+            if generation != self.generation or index not in self.cells:
+                continue
+            if img is None:
+                self.photos[index] = None
+                continue
+            photo = ImageTk.PhotoImage(img)
+            self.photos[index] = photo
+            self.canvas.itemconfigure(self.cells[index][0], image=photo)
+
+        if self.requested - set(self.photos):
+            self.canvas.after(25, self._poll)
+        else:
+            self._polling = False
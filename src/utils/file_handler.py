@@ -1,25 +1,28 @@
-from tkinter import filedialog
 import os
+from utils.scanner import scan_images
 
 def select_image_folder():
     """Open a dialog to select an image folder and return the path"""
+    # Imported here so headless tools can use this module without tkinter
+    from tkinter import filedialog
     folder_path = filedialog.askdirectory(title="Select Image Folder")
     return folder_path if folder_path else None
 
-def get_image_files(folder_path):
-    """Get all image files from a folder"""
+def get_image_files(folder_path, recursive=True, include=None, exclude=None, sniff=False):
+    """Get all image files from a folder and its subfolders"""
     if not folder_path or not os.path.isdir(folder_path):
         return []
         
     # Find all image files in the folder
-    image_extensions = ('.jpg', '.jpeg', '.png', '.gif', '.bmp')
-    image_files = [f for f in os.listdir(folder_path) if f.lower().endswith(image_extensions)]
+    image_files = [entry for batch in scan_images(folder_path, recursive=recursive, include=include,
+                                                  exclude=exclude, sniff=sniff)
+                   for entry in batch]
     
     # Print to console for debugging
     print(f"Found {len(image_files)} images in {folder_path}")
-    for img in image_files[:10]:  # Show first 10 for brevity
+    for img, _ in image_files[:10]:  # Show first 10 for brevity
         print(f" - {img}")
     if len(image_files) > 10:
         print(f" - ... and {len(image_files) - 10} more")
         
-    return [(f, os.path.join(folder_path, f)) for f in image_files]
+    return image_files
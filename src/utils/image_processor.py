@@ -1,13 +1,13 @@
-from PIL import Image, ImageTk
+from PIL import ImageTk
 # Use absolute import
 from utils.file_handler import get_image_files
+from utils.thumbnail_cache import get_default_cache
 
-def create_thumbnail(image_path, size=(100, 100)):
+def create_thumbnail(image_path, size=(100, 100), cache=None):
     """Create a thumbnail from an image file"""
     try:
-        img = Image.open(image_path)
-        img.thumbnail(size)
-        return ImageTk.PhotoImage(img)
+        cache = cache or get_default_cache()
+        return ImageTk.PhotoImage(cache.get(image_path, size))
     except Exception as e:
         print(f"Error creating thumbnail for {image_path}: {e}")
         return None
@@ -24,29 +24,12 @@ def get_image_thumbnails(folder_path):
     
     return thumbnails
 
-def create_face_thumbnail(image_path, face_location, size=(100, 100)):
+def create_face_thumbnail(image_path, face_location, size=(100, 100), cache=None):
     """Create a thumbnail from a face in an image"""
     try:
-        # Load the image
-        img = Image.open(image_path)
-        
-        # Extract face coordinates
-        top, right, bottom, left = face_location
-        
-        # Crop the face with a small margin
-        margin = 20
-        face_img = img.crop((
-            max(0, left - margin),
-            max(0, top - margin),
-            min(img.width, right + margin),
-            min(img.height, bottom + margin)
-        ))
-        
-        # Resize to thumbnail
-        face_img.thumbnail(size)
-        
-        # Convert to PhotoImage
-        return ImageTk.PhotoImage(face_img)
+        # Crop from the detected face location, reusing a cached crop when possible
+        cache = cache or get_default_cache()
+        return ImageTk.PhotoImage(cache.get(image_path, size, face_location=face_location))
     except Exception as e:
         print(f"Error creating face thumbnail for {image_path}: {e}")
         return None
@@ -66,3 +49,17 @@ def get_face_group_thumbnails(grouped_faces, max_faces_per_group=5):
         group_thumbnails[person_name] = thumbnails
     
     return group_thumbnails
+
+def warm_face_thumbnails(grouped_faces, max_faces_per_group=5, cache=None):
+    """Decode the face thumbnails a group view will show, without creating Tk images.
+    
+    Safe to call from a background thread; the thumbnails land in the
+    cache's in-memory LRU so get_face_group_thumbnails finds them ready.
+    """
+    cache = cache or get_default_cache()
+    for faces in grouped_faces.values():
+        for face_info in faces[:max_faces_per_group]:
+            try:
+                cache.get(face_info['filepath'], face_location=face_info['location'])
+            except Exception as e:
+                print(f"Error creating face thumbnail for {face_info['filepath']}: {e}")
@@ -0,0 +1,147 @@
+import os
+import fnmatch
+import hashlib
+from collections import namedtuple
+
+# File extensions treated as images (compared case-insensitively)
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.tif', '.tiff')
+
+# Leading bytes of the supported image formats, used when sniffing content
+IMAGE_SIGNATURES = (
+    b'\xff\xd8\xff',                # JPEG
+    b'\x89PNG\r\n\x1a\n',           # PNG
+    b'GIF87a', b'GIF89a',           # GIF
+    b'BM',                          # BMP
+    b'II*\x00', b'MM\x00*',         # TIFF
+)
+
+# The stat fields the caches key on
+FileStat = namedtuple('FileStat', ['st_size', 'st_mtime_ns'])
+
+
+class ImageFile(tuple):
+    """A (filename, filepath) pair from a scan, carrying the FileStat taken while scanning.
+
+    It unpacks like a plain pair. Consumers of the scan reuse ``stat``
+    instead of statting the file again; a list kept around for later should
+    be re-stated, as the file may have changed since.
+    """
+
+    def __new__(cls, filename, filepath, stat=None):
+        entry = super().__new__(cls, (filename, filepath))
+        entry.stat = stat
+        return entry
+
+    def __getnewargs__(self):
+        return (self[0], self[1], self.stat)
+
+
+def file_stat(path, stat=None):
+    """Return ``stat`` if a scan recorded one, otherwise the file's current FileStat"""
+    if stat is not None:
+        return stat
+    st = os.stat(path)
+    return FileStat(st.st_size, st.st_mtime_ns)
+
+
+def hash_file(path, block_size=1 << 20):
+    """Return a hex digest of the file contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def scanned_stat(entry):
+    """Return the FileStat carried by a (filename, filepath) entry, or None for a plain pair"""
+    return getattr(entry, 'stat', None)
+
+
+def sniff_image(path):
+    """Return True if the file starts with a known image signature"""
+    try:
+        with open(path, 'rb') as f:
+            head = f.read(16)
+    except OSError:
+        return False
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return True
+    return head.startswith(IMAGE_SIGNATURES)
+
+
+def _matches(relpath, patterns):
+    relpath = relpath.replace(os.sep, '/').lower()
+    name = relpath.rsplit('/', 1)[-1]
+    return any(fnmatch.fnmatchcase(relpath, p.lower()) or fnmatch.fnmatchcase(name, p.lower())
+               for p in patterns)
+
+
+def scan_images(root, recursive=True, include=None, exclude=None, sniff=False, batch_size=256):
+    """Walk a folder with os.scandir, yielding batches of (filename, filepath) ImageFile entries.
+
+    ``filename`` is the path relative to ``root``; each entry carries the
+    size and mtime read during the walk. ``include``/``exclude``
+    are glob patterns matched against that relative path or the bare name;
+    excluded directories are not descended into. With ``sniff`` every file
+    is checked by its leading bytes instead of its extension. Batches are
+    yielded as soon as they fill up, so consumers can start before the
+    walk finishes.
+    """
+    if not root or not os.path.isdir(root):
+        return
+
+    batch = []
+    pending_dirs = [(root, '')]
+    while pending_dirs:
+        directory, rel_dir = pending_dirs.pop()
+        try:
+            with os.scandir(directory) as it:
+                entries = sorted(it, key=lambda e: e.name)
+        except OSError as e:
+            print(f"Cannot scan {directory}: {e}")
+            continue
+
+        subdirs = []
+        for entry in entries:
+            relpath = os.path.join(rel_dir, entry.name) if rel_dir else entry.name
+            if exclude and _matches(relpath, exclude):
+                continue
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    if recursive:
+                        subdirs.append((entry.path, relpath))
+                    continue
+                if not entry.is_file():
+                    continue
+            except OSError:
+                continue
+
+            if include and not _matches(relpath, include):
+                continue
+            if sniff:
+                if not sniff_image(entry.path):
+                    continue
+            elif not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                continue
+
+            try:
+                st = entry.stat()
+            except OSError:
+                continue
+            batch.append(ImageFile(relpath, entry.path, FileStat(st.st_size, st.st_mtime_ns)))
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+
+        # Visit subdirectories in name order
+        pending_dirs.extend(reversed(subdirs))
+
+    if batch:
+        yield batch
+
+
+def iter_image_files(root, **options):
+    """Yield (filename, filepath) one at a time from scan_images"""
+    for batch in scan_images(root, **options):
+        yield from batch
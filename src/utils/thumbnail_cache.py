@@ -0,0 +1,235 @@
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from PIL import Image, ImageOps
+from utils.scanner import hash_file
+
+# Margin kept around a face when cropping it, in source pixels
+FACE_MARGIN = 20
+
+# Bumped when rendering or keying changes (2: EXIF orientation applied, 3: content keys)
+THUMBNAIL_VERSION = 3
+
+
+def default_thumbnail_dir():
+    """Return the per-user directory used for cached thumbnails"""
+    base = os.environ.get("LOCALAPPDATA") or os.environ.get("XDG_CACHE_HOME")
+    if not base:
+        base = os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "face-grouper", "thumbnails")
+
+
+def open_reduced(image_path, min_size=None, scale=None):
+    """Open an image upright, letting JPEG decode at a reduced scale.
+
+    The decoded image is at least ``min_size``, or at least ``scale`` times
+    the source size. The EXIF orientation is applied, as it is for
+    detection. Returns the image and its scale relative to the source.
+    """
+    img = Image.open(image_path)
+    full_width, full_height = img.size
+    if min_size is None:
+        min_size = (full_width * scale, full_height * scale)
+    if img.format == "JPEG":
+        # Draft mode makes libjpeg decode at 1/2, 1/4 or 1/8 scale
+        img.draft("RGB", (max(1, int(min_size[0])), max(1, int(min_size[1]))))
+    img.load()
+    scale = img.size[0] / full_width
+    return ImageOps.exif_transpose(img), scale
+
+
+def render_thumbnail(image_path, size=(100, 100)):
+    """Decode an image at reduced resolution and shrink it to a thumbnail"""
+    img, _ = open_reduced(image_path, min_size=size)
+    img.thumbnail(size, reducing_gap=2.0)
+    return img.convert("RGB")
+
+
+def render_face_thumbnail(image_path, face_location, size=(100, 100)):
+    """Crop a face (with a small margin) from an image and shrink it to a thumbnail"""
+    top, right, bottom, left = face_location
+
+    # Decode only as large as needed for the face crop to still fill the thumbnail
+    crop_width = max(1, right - left + 2 * FACE_MARGIN)
+    crop_height = max(1, bottom - top + 2 * FACE_MARGIN)
+    scale = min(1.0, max(size[0] / crop_width, size[1] / crop_height))
+    img, actual_scale = open_reduced(image_path, scale=scale)
+    full_width = round(img.size[0] / actual_scale)
+    full_height = round(img.size[1] / actual_scale)
+
+    face_img = img.crop((
+        int(max(0, left - FACE_MARGIN) * actual_scale),
+        int(max(0, top - FACE_MARGIN) * actual_scale),
+        int(min(full_width, right + FACE_MARGIN) * actual_scale),
+        int(min(full_height, bottom + FACE_MARGIN) * actual_scale)
+    ))
+    face_img.thumbnail(size, reducing_gap=2.0)
+    return face_img.convert("RGB")
+
+
+class ThumbnailCache:
+    """On-disk thumbnail cache with an in-memory LRU of decoded thumbnails.
+
+    Thumbnails are stored as small JPEG files named after a hash of the
+    source file's content, the thumbnail size and, for face crops, the face
+    location, so renamed and copied files share entries and a rewritten
+    file never gets an old thumbnail. Content hashes are remembered per
+    file identity (path, size, mtime, ctime and inode), which any rewrite
+    changes. Files are removed least-recently-used first once the cache
+    grows beyond max_bytes.
+    """
+
+    def __init__(self, cache_dir, memory_items=1024, quality=85, max_bytes=256 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self.quality = quality
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._memory = OrderedDict()
+        self._digests = OrderedDict()  # file identity -> content hash
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+        # key -> [size in bytes, last used timestamp]
+        self._entries = {}
+        self._total_bytes = 0
+        with os.scandir(cache_dir) as subdirs:
+            for subdir in subdirs:
+                if not subdir.is_dir():
+                    continue
+                with os.scandir(subdir.path) as it:
+                    for entry in it:
+                        if entry.name.endswith(".jpg") and entry.is_file():
+                            st = entry.stat()
+                            self._entries[entry.name[:-len(".jpg")]] = [st.st_size, st.st_mtime]
+                            self._total_bytes += st.st_size
+        self.evict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    @property
+    def total_bytes(self):
+        return self._total_bytes
+
+    def _content_hash(self, image_path):
+        """Hash a file's content, reusing the hash while the file is unchanged"""
+        st = os.stat(image_path)
+        identity = (os.path.abspath(image_path), st.st_size, st.st_mtime_ns, st.st_ctime_ns, st.st_ino)
+        with self._lock:
+            digest = self._digests.get(identity)
+            if digest is not None:
+                self._digests.move_to_end(identity)
+                return digest
+        digest = hash_file(image_path)
+        with self._lock:
+            self._digests[identity] = digest
+            while len(self._digests) > 4 * self.memory_items:
+                self._digests.popitem(last=False)
+        return digest
+
+    def make_key(self, image_path, size, face_location=None):
+        """Build the cache key for a thumbnail"""
+        parts = [self._content_hash(image_path), f"{size[0]}x{size[1]}", f"v{THUMBNAIL_VERSION}",
+                 ",".join(str(int(v)) for v in face_location) if face_location is not None else ""]
+        return hashlib.sha1("\0".join(parts).encode("utf-8")).hexdigest()
+
+    def _entry_path(self, key):
+        # Fan out into subdirectories so no single directory gets huge
+        return os.path.join(self.cache_dir, key[:2], key + ".jpg")
+
+    def _remember(self, key, img):
+        with self._lock:
+            self._memory[key] = img
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    def get(self, image_path, size=(100, 100), face_location=None):
+        """Return the thumbnail as a PIL image, generating and caching it if needed"""
+        key = self.make_key(image_path, size, face_location)
+
+        with self._lock:
+            img = self._memory.get(key)
+            if img is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return img
+
+        entry_path = self._entry_path(key)
+        try:
+            with Image.open(entry_path) as cached:
+                img = cached.convert("RGB")
+            self.hits += 1
+            self._touch(key)
+        except (OSError, ValueError):
+            self.misses += 1
+            if face_location is None:
+                img = render_thumbnail(image_path, size)
+            else:
+                img = render_face_thumbnail(image_path, face_location, size)
+            self._store(key, entry_path, img)
+
+        self._remember(key, img)
+        return img
+
+    def _store(self, key, entry_path, img):
+        try:
+            os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+            tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            img.save(tmp_path, format="JPEG", quality=self.quality)
+            os.replace(tmp_path, entry_path)
+            size = os.path.getsize(entry_path)
+        except OSError as e:
+            print(f"Could not write thumbnail cache entry {entry_path}: {e}")
+            return
+        with self._lock:
+            if key in self._entries:
+                self._total_bytes -= self._entries[key][0]
+            self._entries[key] = [size, time.time()]
+            self._total_bytes += size
+        self.evict()
+
+    def _touch(self, key):
+        # Mark as recently used so eviction keeps it, also for later sessions
+        now = time.time()
+        with self._lock:
+            if key in self._entries:
+                self._entries[key][1] = now
+        try:
+            os.utime(self._entry_path(key), (now, now))
+        except OSError:
+            pass
+
+    def evict(self):
+        """Remove least recently used thumbnail files until the cache fits in max_bytes"""
+        with self._lock:
+            if self._total_bytes <= self.max_bytes:
+                return
+            for key in sorted(self._entries, key=lambda k: self._entries[k][1]):
+                if self._total_bytes <= self.max_bytes:
+                    break
+                self._total_bytes -= self._entries.pop(key)[0]
+                try:
+                    os.remove(self._entry_path(key))
+                except OSError:
+                    pass
+
+    def clear_memory(self):
+        """Drop all decoded thumbnails held in memory"""
+        with self._lock:
+            self._memory.clear()
+
+
+_default_cache = None
+
+
+def get_default_cache():
+    """Return the shared thumbnail cache, creating it on first use"""
+    global _default_cache
+    if _default_cache is None:
+        _default_cache = ThumbnailCache(default_thumbnail_dir())
+    return _default_cache
@@ -0,0 +1,51 @@
+import os
+import sys
+import numpy as np
+import pytest
+
+# The modules live under src/ and import each other absolutely, as when run from there
+SRC = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "src")
+if SRC not in sys.path:
+    sys.path.insert(0, SRC)
+
+from grouper.detection import ENCODING_SIZE
+from grouper.index import FaceGrouper
+
+
+def person_encoding(person, jitter=0):
+    """A unit encoding per person; jittered copies stay well within the matching tolerance"""
+    rng = np.random.default_rng(person)
+    encoding = rng.normal(size=ENCODING_SIZE)
+    encoding /= np.linalg.norm(encoding)
+    if jitter:
+        encoding += np.random.default_rng(1000 * person + jitter).normal(scale=0.01, size=ENCODING_SIZE)
+    return encoding.astype(np.float32)
+
+
+@pytest.fixture
+def make_grouper(monkeypatch):
+    """Create FaceGroupers whose detector returns the faces listed in a {path: [person]} dict.
+
+    A person is a number, a (number, jitter) pair or an encoding array.
+    """
+    def make(faces, **options):
+        face_grouper = FaceGrouper(workers=1, dedupe=False, instrument=False, **options)
+
+        def detect(image_paths):
+            for path in image_paths:
+                people = faces[path]
+                locations = np.array([[10, 40 + 50 * i, 40, 10 + 50 * i] for i in range(len(people))],
+                                     dtype=np.int32).reshape(-1, 4)
+                encodings = np.array([person if isinstance(person, np.ndarray)
+                                      else person_encoding(*person) if isinstance(person, tuple)
+                                      else person_encoding(person) for person in people],
+                                     dtype=np.float32).reshape(-1, ENCODING_SIZE)
+                yield path, locations, encodings, None
+
+        monkeypatch.setattr(face_grouper.detector, "detect", detect)
+        return face_grouper
+    return make
+
+
+def image_files(paths):
+    return [(os.path.basename(path), path) for path in paths]
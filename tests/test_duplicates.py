@@ -0,0 +1,34 @@
+import shutil
+import numpy as np
+from PIL import Image
+from grouper.duplicates import DuplicateFinder
+
+
+def write_photo(path, size=(320, 240)):
+    gradient = np.linspace(0, 255, size[0], dtype=np.uint8)
+    pixels = np.stack([np.tile(gradient, (size[1], 1))] * 3, axis=-1)
+    pixels[size[1] // 3:, size[0] // 2:, 0] = 40
+    Image.fromarray(pixels).resize(size).save(path)
+
+
+def test_only_exact_copies_by_default(tmp_path):
+    write_photo(tmp_path / "a.png")
+    shutil.copy(tmp_path / "a.png", tmp_path / "copy.png")
+    with Image.open(tmp_path / "a.png") as img:
+        img.resize((160, 120)).save(tmp_path / "small.png")
+
+    finder = DuplicateFinder()
+    assert [finder.check(str(tmp_path / name)) for name in ("a.png", "copy.png", "small.png")] == [
+        None, str(tmp_path / "a.png"), None]
+    assert (finder.exact, finder.near) == (1, 0)
+
+
+def test_near_duplicates_when_enabled(tmp_path):
+    write_photo(tmp_path / "a.png")
+    with Image.open(tmp_path / "a.png") as img:
+        img.resize((160, 120)).save(tmp_path / "small.png")
+
+    finder = DuplicateFinder(near_distance=3)
+    assert finder.check(str(tmp_path / "a.png")) is None
+    assert finder.check(str(tmp_path / "small.png")) == str(tmp_path / "a.png")
+    assert finder.near == 1
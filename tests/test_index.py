@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from conftest import image_files, person_encoding
+from grouper.results import save_grouped_faces
+
+FACES = {
+    "/photos/a.jpg": [1],
+    "/photos/b.jpg": [2, (1, 1)],
+    "/photos/c.jpg": [(2, 1)],
+}
+
+
+def test_add_after_json_load_is_refused(make_grouper, tmp_path):
+    first = make_grouper(FACES)
+    first.group_faces(image_files(FACES))
+    results = tmp_path / "groups.json"
+    save_grouped_faces(first.grouped_faces, results)
+
+    face_grouper = make_grouper(dict(FACES, **{"/photos/d.jpg": [(2, 2)]}))
+    face_grouper.load_results(str(results))
+    with pytest.raises(ValueError, match="no face encodings"):
+        face_grouper.add_images(image_files(["/photos/d.jpg"]))
+    assert not face_grouper.store.has_image("/photos/d.jpg")
+    assert {name: len(faces) for name, faces in face_grouper.grouped_faces.items()} == {"Person_1": 2, "Person_2": 2}
+
+
+def test_add_after_library_load_keeps_identities(make_grouper, tmp_path):
+    first = make_grouper(FACES)
+    first.group_faces(image_files(FACES))
+    first.save_library(str(tmp_path / "library"))
+
+    face_grouper = make_grouper(dict(FACES, **{"/photos/d.jpg": [(2, 2), 3]}))
+    face_grouper.load_results(str(tmp_path / "library"))
+    face_grouper.add_images(image_files(["/photos/d.jpg"]))
+    people = {name: sorted(face['filepath'] for face in faces) for name, faces in face_grouper.grouped_faces.items()}
+    assert people == {
+        "Person_1": ["/photos/a.jpg", "/photos/b.jpg"],
+        "Person_2": ["/photos/b.jpg", "/photos/c.jpg", "/photos/d.jpg"],
+        "Person_3": ["/photos/d.jpg"],
+    }
+
+
+def test_remove_from_reopened_project(make_grouper, tmp_path):
+    project = str(tmp_path / "photos.sqlite")
+    first = make_grouper(FACES, project=project)
+    first.group_faces(image_files(FACES))
+    first.project.close()
+
+    face_grouper = make_grouper(dict(FACES, **{"/photos/d.jpg": [(1, 2)]}), project=project)
+    face_grouper.remove_images(["/photos/a.jpg"])
+    face_grouper.add_images(image_files(["/photos/d.jpg"]))
+    people = {name: sorted(face['filepath'] for face in faces) for name, faces in face_grouper.grouped_faces.items()}
+    assert people == {
+        "Person_1": ["/photos/b.jpg", "/photos/d.jpg"],
+        "Person_2": ["/photos/b.jpg", "/photos/c.jpg"],
+    }
+
+
+def test_removed_faces_stop_matching_as_exemplars(make_grouper):
+    base = person_encoding(1)
+    direction = person_encoding(2) - base * float(person_encoding(2) @ base)
+    direction /= np.linalg.norm(direction)
+    # The side face is close enough to join Person_1 but far enough from the centroid to be kept
+    # as an exemplar; the profile face is only within tolerance of that exemplar
+    faces = {
+        "/photos/a.jpg": [base, base],
+        "/photos/side.jpg": [base + 0.55 * direction],
+        "/photos/profile.jpg": [base + 1.0 * direction],
+    }
+
+    kept = make_grouper(faces)
+    kept.group_faces(image_files(["/photos/a.jpg", "/photos/side.jpg"]))
+    kept.add_images(image_files(["/photos/profile.jpg"]))
+    assert list(kept.grouped_faces) == ["Person_1"]
+
+    removed = make_grouper(faces)
+    removed.group_faces(image_files(["/photos/a.jpg", "/photos/side.jpg"]))
+    removed.remove_images(["/photos/side.jpg"])
+    removed.add_images(image_files(["/photos/profile.jpg"]))
+    assert [face['filepath'] for face in removed.grouped_faces["Person_2"]] == ["/photos/profile.jpg"]
@@ -0,0 +1,50 @@
+import os
+import shutil
+from PIL import Image
+from utils.thumbnail_cache import ThumbnailCache
+
+
+def make_image(path, colour, size=(320, 240)):
+    Image.new("RGB", size, colour).save(path, quality=90)
+
+
+def test_renamed_and_copied_files_share_thumbnails(tmp_path):
+    make_image(tmp_path / "a.jpg", (200, 40, 40))
+    ThumbnailCache(str(tmp_path / "cache")).get(str(tmp_path / "a.jpg"))
+
+    shutil.copy(tmp_path / "a.jpg", tmp_path / "b.jpg")
+    os.rename(tmp_path / "a.jpg", tmp_path / "c.jpg")
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+    cache.get(str(tmp_path / "b.jpg"))
+    cache.get(str(tmp_path / "c.jpg"))
+    assert (cache.hits, cache.misses) == (2, 0)
+
+
+def test_rewrite_with_the_same_mtime_is_rendered_again(tmp_path):
+    path = tmp_path / "a.jpg"
+    make_image(path, (200, 40, 40))
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+    cache.get(str(path))
+
+    st = os.stat(path)
+    make_image(path, (40, 40, 200))
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+    thumbnail = cache.get(str(path))
+    assert cache.misses == 2
+    assert thumbnail.getpixel((0, 0))[2] > 150
+
+
+def test_disk_budget_evicts_least_recently_used(tmp_path):
+    paths = []
+    for i in range(6):
+        paths.append(str(tmp_path / f"{i}.jpg"))
+        make_image(paths[-1], (40 * i, 100, 100))
+    cache = ThumbnailCache(str(tmp_path / "cache"))
+    for path in paths:
+        cache.get(path)
+    entry_size = cache.total_bytes // len(cache)
+
+    cache = ThumbnailCache(str(tmp_path / "cache"), max_bytes=3 * entry_size + entry_size // 2)
+    assert 0 < len(cache) < len(paths)
+    assert cache.total_bytes <= cache.max_bytes
+    assert sum(len(files) for _, _, files in os.walk(tmp_path / "cache")) == len(cache)